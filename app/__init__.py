@@ -73,6 +73,15 @@ def create_app(config_name='development'):
         from app.models import User
         return User.query.get(int(user_id))
 
+    # Add indexes and tables introduced since the database was created
+    if os.getenv('SCHEMA_AUTO_UPGRADE', 'true').lower() != 'false':
+        from app.utils.schema_upgrade import upgrade_schema
+        with app.app_context():
+            try:
+                upgrade_schema()
+            except Exception as e:
+                print(f"Error upgrading database schema: {str(e)}")
+
     # ── Register blueprints ───────────────────────
     from app.routes.auth import auth_bp
     from app.routes.main import main_bp
@@ -92,6 +101,30 @@ def create_app(config_name='development'):
     app.register_blueprint(goals_bp)
     app.register_blueprint(api_bp, url_prefix='/api')
 
+    # ── CLI maintenance commands ──────────────────
+    from app.cli import register_commands
+    register_commands(app)
+
+    # ── Background services ───────────────────────
+    from app.services.chat_history_writer import history_writer
+    history_writer.init_app(app)
+
+    # Price changes patch dependent caches instead of flushing them
+    from app.services.price_events import price_events
+    from app.services.response_cache import response_cache
+    from app.services.recommendation_engine import update_recommendation_costs
+    from app.routes.api import offline_manager
+    price_events.subscribe(response_cache.on_price_change)
+    price_events.subscribe(update_recommendation_costs)
+    price_events.subscribe(offline_manager.on_price_change)
+
+    from app.services.job_scheduler import job_scheduler
+    job_scheduler.init_app(app)
+    refresh_minutes = float(os.getenv('FOOD_PRICE_REFRESH_INTERVAL_MINUTES', 0))
+    if refresh_minutes > 0:
+        from app.services.price_api import refresh_prices_job
+        job_scheduler.schedule('price_refresh', refresh_prices_job, refresh_minutes * 60, lease=True)
+
     # Optional: basic health check route (good for first phase verification)
     @app.route('/health')
     def health():
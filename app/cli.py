@@ -0,0 +1,63 @@
+"""
+Maintenance Commands
+Flask CLI commands for scheduled housekeeping jobs
+"""
+import click
+
+
+def register_commands(app):
+    """Attach maintenance commands to the Flask CLI"""
+
+    @app.cli.command('archive-chat-history')
+    @click.option('--days', default=90, show_default=True, help='Archive turns older than this many days')
+    @click.option('--chunk-size', default=1000, show_default=True, help='Turns per compressed archive row')
+    def archive_chat_history(days, chunk_size):
+        """Move old chat turns into compressed cold storage"""
+        from app.services.chat_archive import ChatArchiveService
+        summary = ChatArchiveService(chunk_size=chunk_size).archive_old_history(older_than_days=days)
+        click.echo(f"Archived {summary['turns']} turns for {summary['users']} users "
+                   f"into {summary['archives']} archive rows")
+
+    @app.cli.command('rebuild-price-rollups')
+    @click.option('--days', default=None, type=int, help='Only rebuild periods from this many days ago (default: all history)')
+    def rebuild_price_rollups(days):
+        """Recompute daily and weekly price rollups from food_prices"""
+        from datetime import datetime, timedelta
+        from app.services.price_rollups import price_rollups
+        since = datetime.utcnow() - timedelta(days=days) if days is not None else None
+        rows_read = price_rollups.rebuild(since=since)
+        click.echo(f"Rebuilt price rollups from {rows_read} price records")
+
+    @app.cli.command('compact-price-history')
+    @click.option('--days', default=None, type=int, help='Keep this many days of raw prices (default: FOOD_PRICE_RETENTION_DAYS)')
+    @click.option('--archive-dir', default=None, help='Directory for archive files (default: FOOD_PRICE_ARCHIVE_DIR)')
+    def compact_price_history(days, archive_dir):
+        """Archive old food_prices rows to columnar files and keep their daily rollups"""
+        from app.services.price_archive import PriceArchiveService
+        summary = PriceArchiveService(archive_dir=archive_dir).compact(retention_days=days)
+        click.echo(f"Archived {summary['rows']} price records into {summary['files']} files")
+
+    @app.cli.command('price-worker')
+    @click.option('--interval-minutes', default=60.0, show_default=True, help='Minutes between price refreshes')
+    @click.option('--once', is_flag=True, help='Run a single refresh and exit')
+    @click.option('--force', is_flag=True, help='Refresh every food, not just stale ones')
+    def price_worker(interval_minutes, once, force):
+        """Refresh food prices in this process, outside the web server"""
+        import time
+        from app.services.job_scheduler import job_scheduler
+        from app.services.price_api import refresh_prices_job
+        if once:
+            job, _ = job_scheduler.submit('price_refresh', refresh_prices_job, lease=True, force=force)
+            while not job.finished:
+                time.sleep(0.5)
+            click.echo(f"Price refresh {job.status}: {job.result or job.error}")
+            return
+
+        job_scheduler.schedule('price_refresh', refresh_prices_job, interval_minutes * 60, lease=True, force=force)
+        job_scheduler.submit('price_refresh', refresh_prices_job, lease=True, force=force)
+        click.echo(f"Refreshing prices every {interval_minutes:g} minutes; press CTRL+C to stop")
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            job_scheduler.shutdown()
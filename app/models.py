@@ -3,6 +3,7 @@ from flask_login import UserMixin
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 import json
+import zlib
 
 class User(UserMixin, db.Model):
     """User model for authentication and profile management"""
@@ -28,6 +29,7 @@ class User(UserMixin, db.Model):
     primary_goal = db.Column(db.String(50))  # 'healthy_eating', 'lose_weight', 'gain_weight', 'diabetes_management'
     budget_range = db.Column(db.String(50))  # 'low', 'medium', 'high'
     monthly_budget = db.Column(db.Float)  # in UGX
+    location = db.Column(db.String(100))  # Nearest market, e.g. 'Gulu'; prices fall back to Kampala
     
     # Medical connections
     medical_provider_id = db.Column(db.String(100))
@@ -71,7 +73,8 @@ class User(UserMixin, db.Model):
             'diabetes_type': self.diabetes_type,
             'primary_goal': self.primary_goal,
             'budget_range': self.budget_range,
-            'monthly_budget': self.monthly_budget
+            'monthly_budget': self.monthly_budget,
+            'location': self.location
         }
 
 
@@ -145,6 +148,10 @@ class FoodItem(db.Model):
 class DiabetesRecord(db.Model):
     """Diabetes tracking records for Type 1 and Type 2"""
     __tablename__ = 'diabetes_records'
+    __table_args__ = (
+        # Duplicate checks for imported and synced readings
+        db.Index('ix_diabetes_records_user_measurement', 'user_id', 'measurement_time'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -187,6 +194,14 @@ class DiabetesRecord(db.Model):
         }
 
 
+# Serves stats and progress windows on the time a reading was taken (created_at for manual entries)
+db.Index(
+    'ix_diabetes_records_user_type_taken',
+    DiabetesRecord.user_id, DiabetesRecord.record_type,
+    db.func.coalesce(DiabetesRecord.measurement_time, DiabetesRecord.created_at)
+)
+
+
 class Goal(db.Model):
     """User goals for weight management and health"""
     __tablename__ = 'goals'
@@ -303,6 +318,10 @@ class Recommendation(db.Model):
 class ChatHistory(db.Model):
     """NLP chatbot conversation history"""
     __tablename__ = 'chat_history'
+    __table_args__ = (
+        # Serves per-user history pages newest first and keyset cursors
+        db.Index('ix_chat_history_user_created', 'user_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -322,9 +341,71 @@ class ChatHistory(db.Model):
         }
 
 
+class ChatHistoryArchive(db.Model):
+    """Compressed cold storage for old chat turns, one row per archived chunk"""
+    __tablename__ = 'chat_history_archive'
+    __table_args__ = (
+        db.Index('ix_chat_history_archive_user_first', 'user_id', 'first_message_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    first_chat_id = db.Column(db.Integer)
+    last_chat_id = db.Column(db.Integer)
+    first_message_at = db.Column(db.DateTime)
+    last_message_at = db.Column(db.DateTime)
+    turn_count = db.Column(db.Integer)
+    payload = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed JSON array of turns
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @staticmethod
+    def compress_turns(turns):
+        return zlib.compress(json.dumps(turns, separators=(',', ':')).encode('utf-8'), 9)
+    
+    def load_turns(self):
+        return json.loads(zlib.decompress(self.payload).decode('utf-8'))
+
+
+class MarketPrice(db.Model):
+    """Current price of a food at one market location"""
+    __tablename__ = 'market_prices'
+    __table_args__ = (
+        db.UniqueConstraint('food_item_id', 'location', name='uq_market_prices_food_location'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    food_item_id = db.Column(db.Integer, db.ForeignKey('food_items.id'), nullable=False)
+    location = db.Column(db.String(100), nullable=False)
+    price = db.Column(db.Float, nullable=False)  # in UGX per FoodItem.price_unit
+    source = db.Column(db.String(50))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'food_item_id': self.food_item_id,
+            'location': self.location,
+            'price': self.price,
+            'source': self.source,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class CatalogChange(db.Model):
+    """One food catalog change; the highest id is the current catalog version"""
+    __tablename__ = 'catalog_changes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    food_ids = db.Column(db.Text)  # JSON list of foods with new prices, NULL if anything may have changed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class FoodPrice(db.Model):
     """Food price tracking from market API"""
     __tablename__ = 'food_prices'
+    __table_args__ = (
+        # Serves per-food history windows for short trends and rollup rebuilds
+        db.Index('ix_food_prices_food_recorded', 'food_item_id', 'recorded_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     food_item_id = db.Column(db.Integer, db.ForeignKey('food_items.id'), nullable=False)
@@ -343,3 +424,75 @@ class FoodPrice(db.Model):
             'recorded_at': self.recorded_at.isoformat()
         }
 
+
+class PriceRollup(db.Model):
+    """Daily or weekly price summary per food per market"""
+    __tablename__ = 'price_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('food_item_id', 'location', 'resolution', 'period_start',
+                            name='uq_price_rollups_period'),
+        # Serves trend windows for one food at one resolution
+        db.Index('ix_price_rollups_food_period', 'food_item_id', 'resolution', 'period_start'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    food_item_id = db.Column(db.Integer, db.ForeignKey('food_items.id'), nullable=False)
+    location = db.Column(db.String(100), nullable=False)
+    resolution = db.Column(db.String(10), nullable=False)  # 'day', 'week'
+    period_start = db.Column(db.DateTime, nullable=False)  # Midnight, or Monday midnight for weeks
+    min_price = db.Column(db.Float, nullable=False)
+    max_price = db.Column(db.Float, nullable=False)
+    price_sum = db.Column(db.Float, nullable=False)
+    sample_count = db.Column(db.Integer, nullable=False)
+    last_price = db.Column(db.Float, nullable=False)
+    last_recorded_at = db.Column(db.DateTime, nullable=False)
+    
+    @property
+    def mean_price(self):
+        return self.price_sum / self.sample_count if self.sample_count else None
+    
+    def to_dict(self):
+        return {
+            'date': self.period_start.isoformat(),
+            'location': self.location,
+            'price': self.last_price,
+            'min': self.min_price,
+            'max': self.max_price,
+            'mean': round(self.mean_price, 2),
+            'samples': self.sample_count
+        }
+
+
+class JobLease(db.Model):
+    """Cross-process lock on a background job name, held until expires_at unless renewed"""
+    __tablename__ = 'job_leases'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    owner = db.Column(db.String(150), nullable=False)  # host:pid:job id of the holder
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class OfflineOperation(db.Model):
+    """Outcome of a queued offline write, keyed by the client's idempotency key"""
+    __tablename__ = 'offline_operations'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'idempotency_key', name='uq_offline_operations_user_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    idempotency_key = db.Column(db.String(64), nullable=False)
+    operation_type = db.Column(db.String(30), nullable=False)  # 'food_log', 'diabetes_record', 'goal_progress'
+    status = db.Column(db.String(20), nullable=False)  # 'applied', 'conflict'
+    result_id = db.Column(db.Integer)  # ID of the created row when applied
+    reason = db.Column(db.String(50))  # Conflict reason
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_result(self):
+        return {
+            'key': self.idempotency_key,
+            'type': self.operation_type,
+            'status': self.status,
+            'id': self.result_id,
+            'reason': self.reason
+        }
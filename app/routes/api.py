@@ -2,18 +2,57 @@
 API Routes
 RESTful API endpoints for external integrations
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, url_for, send_file, make_response
 from flask_login import login_required, current_user
 from app import db
 from app.models import User, FoodItem, Recommendation, FoodLog
-from app.services.price_api import PriceAPIService
+from app.services.price_api import PriceAPIService, refresh_prices_job
+from app.services.job_scheduler import job_scheduler
+from app.services.price_rollups import price_rollups
 from app.services.offline_manager import OfflineManager
+from app.services import offline_encoding
+from app.services.connectivity import connectivity_monitor
 from functools import wraps
+import os
+import re
 
 api_bp = Blueprint('api', __name__)
 price_service = PriceAPIService()
 offline_manager = OfflineManager()
 
+# Largest offline upload applied in one transaction
+OFFLINE_SYNC_MAX_ITEMS = int(os.getenv('OFFLINE_SYNC_MAX_ITEMS', 5000))
+# Largest queued-operation replay (applied in OFFLINE_REPLAY_CHUNK_SIZE transactions)
+OFFLINE_REPLAY_MAX_OPERATIONS = int(os.getenv('OFFLINE_REPLAY_MAX_OPERATIONS', 20000))
+
+def encoded_response(payload, status=200):
+    """Serialize payload in the media type and compression the client accepts"""
+    media_type, encoding = offline_encoding.negotiate(request)
+    body = offline_encoding.compress(offline_encoding.dumps(payload, media_type), encoding)
+    response = make_response(body, status)
+    response.mimetype = media_type
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    return response
+
+def send_catalog_file(catalog_id):
+    """send_file for the catalog variant matching the client's Accept/Accept-Encoding"""
+    media_type, encoding = offline_encoding.negotiate(request)
+    path = offline_manager.catalog_path(catalog_id, media_type, encoding)
+    if not os.path.exists(path):
+        # Variant not written (codec installed after the file was built)
+        media_type, encoding = offline_encoding.JSON_TYPE, 'identity'
+        path = offline_manager.catalog_path(catalog_id)
+    
+    # Each variant is a different representation, so it needs its own strong ETag
+    etag = offline_encoding.variant_etag(catalog_id, media_type, encoding)
+    response = send_file(path, mimetype=media_type, etag=etag, conditional=True)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    return response
+
 def api_key_required(f):
     """Decorator for API key authentication"""
     @wraps(f)
@@ -73,14 +112,29 @@ def get_recommendations():
 @api_bp.route('/prices/update', methods=['POST'])
 @api_key_required
 def update_prices():
-    """Update food prices from external API"""
+    """Start a background price refresh from the external API"""
     force = request.json.get('force', False) if request.is_json else False
-    updated_count = price_service.update_food_prices(force=force)
+    job, created = job_scheduler.submit('price_refresh', refresh_prices_job, lease=True, force=force)
+    
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': url_for('api.get_job', job_id=job.id),
+        'message': 'Price update started' if created else 'A price update is already running'
+    }), 202
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+@api_key_required
+def get_job(job_id):
+    """Get status and progress of a background job"""
+    job = job_scheduler.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
     
     return jsonify({
         'success': True,
-        'updated_count': updated_count,
-        'message': f'Updated {updated_count} food prices'
+        'job': job.to_dict()
     })
 
 @api_bp.route('/prices/<int:food_id>/trend', methods=['GET'])
@@ -88,24 +142,27 @@ def update_prices():
 def get_price_trend(food_id):
     """Get price trend for a food item"""
     days = request.args.get('days', 30, type=int)
-    trend = price_service.get_price_trend(food_id, days=days)
+    location = request.args.get('location')
+    trend = price_service.get_price_trend(food_id, days=days, location=location)
     
     return jsonify({
         'success': True,
+        'resolution': price_rollups.resolution_for(days),
         'trend': trend
     })
 
 @api_bp.route('/offline/enable', methods=['POST'])
 @login_required
 def enable_offline():
-    """Enable offline mode"""
-    success = offline_manager.enable_offline_mode(current_user)
+    """Enable offline mode; the cache is built in the background (poll /api/offline/data)"""
+    job = offline_manager.enable_offline_mode(current_user)
     
     return jsonify({
-        'success': success,
+        'success': True,
         'offline_mode': current_user.offline_mode_enabled,
-        'features': offline_manager.get_offline_features()
-    })
+        'features': offline_manager.get_offline_features(),
+        'cache_job': {'job_id': job.id, 'status': job.status}
+    }), 202
 
 @api_bp.route('/offline/disable', methods=['POST'])
 @login_required
@@ -121,20 +178,126 @@ def disable_offline():
 @api_bp.route('/offline/data', methods=['GET'])
 @login_required
 def get_offline_data():
-    """Get cached offline data"""
-    data = offline_manager.load_cached_data(current_user.id)
+    """Get cached offline data (supports If-None-Match)"""
+    cache_etag = offline_manager.data_etag(current_user.id)
+    if cache_etag is None:
+        job = offline_manager.cache_job(current_user.id)
+        if job is not None:
+            response = jsonify({
+                'success': False,
+                'status': job.status,
+                'error': 'Offline data is still being prepared'
+            })
+            response.headers['Retry-After'] = '2'
+            return response, 202
+        return jsonify({'success': False, 'error': 'No cached data found'}), 404
     
-    if data:
-        return jsonify({'success': True, 'data': data})
+    media_type, encoding = offline_encoding.negotiate(request)
+    etag = offline_encoding.variant_etag(cache_etag, media_type, encoding)
+    if request.if_none_match.contains(etag):
+        # Unchanged: answer without reading the cache file
+        response = make_response('', 304)
     else:
-        return jsonify({'success': False, 'error': 'No cached data found'}), 404
+        data = offline_manager.load_cached_data(current_user.id)
+        if not data:
+            return jsonify({'success': False, 'error': 'No cached data found'}), 404
+        response = encoded_response({'success': True, 'data': data})
+    
+    response.set_etag(etag)
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@api_bp.route('/offline/catalog', methods=['GET'])
+@login_required
+def get_offline_catalog():
+    """Get the current shared food catalog snapshot"""
+    catalog_id, _ = offline_manager.get_catalog_file()
+    response = send_catalog_file(catalog_id)
+    response.headers['X-Catalog-Id'] = catalog_id
+    response.cache_control.no_cache = True
+    return response
+
+@api_bp.route('/offline/catalog/<catalog_id>', methods=['GET'])
+@login_required
+def get_offline_catalog_by_id(catalog_id):
+    """Get a catalog snapshot by id; content never changes, so it is cached for a year"""
+    path = offline_manager.catalog_path(catalog_id)
+    if not re.fullmatch(r'[0-9a-f]{32}', catalog_id) or not os.path.exists(path):
+        return jsonify({'success': False, 'error': 'Catalog snapshot not found'}), 404
+    
+    response = send_catalog_file(catalog_id)
+    response.cache_control.private = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response
+
+@api_bp.route('/offline/sync', methods=['GET'])
+@login_required
+def get_offline_changes():
+    """Get server changes since the client's last sync (?since=<server_time>)"""
+    since = request.args.get('since')
+    since_time = offline_manager.parse_time(since)
+    if since and since_time is None:
+        return jsonify({'success': False, 'error': 'since must be an ISO timestamp'}), 400
+    
+    changes = offline_manager.get_changes(current_user, since=since_time)
+    return encoded_response({'success': True, 'changes': changes})
+
+@api_bp.route('/offline/sync', methods=['POST'])
+@login_required
+def upload_offline_changes():
+    """Apply food logs, diabetes records and goal progress created offline"""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'success': False, 'error': 'JSON body required'}), 400
+    
+    kinds = ('food_logs', 'diabetes_records', 'goal_progress')
+    for kind in kinds:
+        if not isinstance(payload.get(kind) or [], list):
+            return jsonify({'success': False, 'error': f'{kind} must be a list'}), 400
+    
+    item_count = sum(len(payload.get(kind) or []) for kind in kinds)
+    if item_count > OFFLINE_SYNC_MAX_ITEMS:
+        return jsonify({
+            'success': False,
+            'error': f'At most {OFFLINE_SYNC_MAX_ITEMS} items per upload'
+        }), 413
+    
+    result = offline_manager.apply_offline_changes(current_user, payload)
+    return jsonify(dict(result, success=True))
+
+@api_bp.route('/offline/replay', methods=['POST'])
+@login_required
+def replay_offline_operations():
+    """Replay queued offline writes; each operation carries a client idempotency key"""
+    payload = request.get_json(silent=True)
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    if not isinstance(operations, list):
+        return jsonify({'success': False, 'error': 'JSON body with an operations list required'}), 400
+    
+    if len(operations) > OFFLINE_REPLAY_MAX_OPERATIONS:
+        return jsonify({
+            'success': False,
+            'error': f'At most {OFFLINE_REPLAY_MAX_OPERATIONS} operations per replay'
+        }), 413
+    
+    results = offline_manager.replay_operations(current_user, operations)
+    summary = {'applied': 0, 'conflict': 0, 'invalid': 0, 'failed': 0, 'replayed': 0}
+    for result in results:
+        summary[result['status']] += 1
+        summary['replayed'] += result['replayed']
+    return encoded_response({'success': True, 'summary': summary, 'results': results})
 
 @api_bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
+    connectivity = connectivity_monitor.status()
     return jsonify({
         'success': True,
         'status': 'healthy',
-        'online': offline_manager.is_online()
+        'online': connectivity['online'],
+        'connectivity_checked_at': connectivity['checked_at']
     })
 
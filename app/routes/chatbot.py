@@ -2,13 +2,30 @@
 Chatbot Routes
 NLP conversational interface for dietary advice
 """
-from flask import Blueprint, render_template, request, jsonify
+import hmac
+import json
+import os
+from functools import wraps
+from flask import Blueprint, render_template, request, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
 from app.services.chatbot_service import ChatbotService
 
 chatbot_bp = Blueprint('chatbot', __name__)
 chatbot_service = ChatbotService()
 
+def batch_api_key_required(f):
+    """Require the X-API-Key set in CHATBOT_BATCH_API_KEY; batch callers act as any user"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        expected = os.getenv('CHATBOT_BATCH_API_KEY')
+        if not expected:
+            return jsonify({'success': False, 'error': 'Batch API is not configured'}), 503
+        api_key = request.headers.get('X-API-Key') or ''
+        if not hmac.compare_digest(api_key.encode('utf-8'), expected.encode('utf-8')):
+            return jsonify({'success': False, 'error': 'Invalid API key'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
 @chatbot_bp.route('/')
 @login_required
 def chat():
@@ -38,15 +55,72 @@ def send_message():
         'entities': response['entities']
     })
 
+@chatbot_bp.route('/message/stream', methods=['POST'])
+@login_required
+def stream_message():
+    """Send a message and stream the response as Server-Sent Events"""
+    data = request.get_json()
+    message = data.get('message', '').strip()
+    
+    if not message:
+        return jsonify({'success': False, 'error': 'Message cannot be empty'}), 400
+    
+    def generate():
+        try:
+            for event, payload in chatbot_service.stream_message(current_user, message):
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        except Exception as e:
+            # Headers are already sent; end the stream with an error event instead
+            print(f"Error streaming chatbot response: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'error': 'Sorry, I encountered an error. Please try again.'})}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop reverse proxies from buffering the stream
+    })
+
+@chatbot_bp.route('/message/batch', methods=['POST'])
+@batch_api_key_required
+def batch_messages():
+    """Process a burst of (user, message) pairs, e.g. from the SMS gateway"""
+    data = request.get_json(silent=True) or {}
+    items = data.get('messages')
+    max_batch_size = int(os.getenv('CHATBOT_BATCH_MAX_SIZE', 1000))
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'error': 'messages must be a non-empty list'}), 400
+    if len(items) > max_batch_size:
+        return jsonify({'success': False, 'error': f'At most {max_batch_size} messages per batch'}), 413
+    
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('user_id'), int) \
+                or not str(item.get('message') or '').strip():
+            return jsonify({'success': False, 'error': 'Each message needs a user_id and a non-empty message'}), 400
+    
+    results = chatbot_service.process_batch([
+        {'user_id': item['user_id'], 'message': str(item['message']).strip()}
+        for item in items
+    ])
+    
+    return jsonify({
+        'success': True,
+        'processed': sum(1 for result in results if 'error' not in result),
+        'results': results
+    })
+
 @chatbot_bp.route('/history')
 @login_required
 def get_history():
     """Get conversation history"""
-    limit = request.args.get('limit', 20, type=int)
-    history = chatbot_service.get_conversation_history(current_user, limit=limit)
+    max_limit = int(os.getenv('CHAT_HISTORY_PAGE_MAX', 100))
+    limit = min(max(request.args.get('limit', 20, type=int), 1), max_limit)
+    before_id = request.args.get('before_id', type=int)
+    history = chatbot_service.get_conversation_history(current_user, limit=limit, before_id=before_id)
     
     return jsonify({
         'success': True,
-        'history': [h.to_dict() for h in history]
+        'history': [h.to_dict() for h in history],
+        # Pass back as before_id to fetch the next (older) page
+        'next_before_id': history[-1].id if len(history) == limit else None
     })
 
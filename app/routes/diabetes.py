@@ -6,11 +6,24 @@ from flask import Blueprint, render_template, request, jsonify, flash, redirect,
 from flask_login import login_required, current_user
 from app import db
 from app.models import DiabetesRecord, User
-from datetime import datetime
+from app.services.glucose_import import glucose_importer, ImportFormatError
+from datetime import datetime, timedelta
+from collections import deque
+from sqlalchemy import func, and_
 import json
 
 diabetes_bp = Blueprint('diabetes', __name__)
 
+# Day windows for glucose statistics; the headline figures use STATS_DEFAULT_WINDOW
+STATS_WINDOWS = (7, 14, 30, 90)
+STATS_DEFAULT_WINDOW = 30
+# Target glucose range in mg/dL
+TARGET_RANGE = (70, 180)
+# Weeks in the rolling glucose average on the progress page
+ROLLING_WEEKS = 4
+# Rows fetched per round trip when streaming records
+STREAM_BATCH_SIZE = 2000
+
 @diabetes_bp.route('/dashboard')
 @login_required
 def dashboard():
@@ -86,6 +99,45 @@ def record_entry():
     
     return render_template('diabetes/record.html', user=current_user)
 
+@diabetes_bp.route('/record/import', methods=['POST'])
+@login_required
+def import_records():
+    """
+    Bulk import blood glucose readings from a CGM or glucometer export
+    
+    Accepts a multipart 'file' field or a raw body in CSV, NDJSON or JSON
+    (?format= overrides detection from the content type or file name).
+    ?unit=mmol/L converts readings given in mmol/L.
+    """
+    if not current_user.has_diabetes:
+        return jsonify({'success': False, 'error': 'Not authorized'}), 403
+    
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    name = ((upload.filename or '') if upload else '').lower()
+    mimetype = upload.mimetype if upload else request.mimetype
+    
+    fmt = request.args.get('format')
+    if not fmt:
+        if 'csv' in mimetype or name.endswith('.csv'):
+            fmt = 'csv'
+        elif 'ndjson' in mimetype or name.endswith(('.ndjson', '.jsonl')):
+            fmt = 'ndjson'
+        elif 'json' in mimetype or name.endswith('.json'):
+            fmt = 'json'
+    
+    try:
+        summary = glucose_importer.import_readings(
+            current_user,
+            glucose_importer.read_rows(stream, fmt),
+            unit=request.args.get('unit', 'mg/dL'),
+            measurement_type=request.args.get('measurement_type', 'random')
+        )
+    except ImportFormatError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({'success': True, 'summary': summary})
+
 @diabetes_bp.route('/insulin-recommendation', methods=['POST'])
 @login_required
 def insulin_recommendation():
@@ -112,13 +164,8 @@ def progress():
     if not current_user.has_diabetes:
         return redirect(url_for('main.dashboard'))
     
-    # Get records for analysis
-    records = DiabetesRecord.query.filter_by(
-        user_id=current_user.id
-    ).order_by(DiabetesRecord.created_at.asc()).all()
-    
-    # Analyze progress
-    progress_data = _analyze_progress(records, current_user.diabetes_type)
+    # Analyze progress (streams the user's records)
+    progress_data = _analyze_progress(current_user)
     
     return render_template('diabetes/progress.html',
                          progress_data=progress_data,
@@ -131,59 +178,110 @@ def api_stats():
     if not current_user.has_diabetes:
         return jsonify({'success': False, 'error': 'Not authorized'}), 403
     
-    stats = _calculate_diabetes_stats(current_user)
+    windows = STATS_WINDOWS
+    if request.args.get('windows'):
+        try:
+            windows = sorted({int(days) for days in request.args['windows'].split(',')})
+        except ValueError:
+            windows = None
+        if not windows or any(days not in STATS_WINDOWS for days in windows):
+            return jsonify({
+                'success': False,
+                'error': f"windows must be a comma-separated subset of {','.join(map(str, STATS_WINDOWS))}"
+            }), 400
+    
+    stats = _calculate_diabetes_stats(current_user, windows=windows)
     return jsonify({'success': True, 'stats': stats})
 
-def _calculate_diabetes_stats(user):
-    """Calculate diabetes statistics"""
-    records = DiabetesRecord.query.filter_by(
-        user_id=user.id,
-        record_type='blood_glucose'
-    ).order_by(DiabetesRecord.created_at.desc()).limit(30).all()
+def _calculate_diabetes_stats(user, windows=STATS_WINDOWS):
+    """
+    Calculate diabetes statistics
+    
+    Every window is aggregated in one SQL query (AVG/MIN/MAX/COUNT with
+    FILTER) over the time each reading was taken - measurement_time, or
+    created_at for readings without one - served by the
+    ix_diabetes_records_user_type_taken expression index.
+    
+    Args:
+        user: User model instance
+        windows: Day windows to report besides the STATS_DEFAULT_WINDOW headline
+    
+    Returns:
+        Dict with headline figures for the default window, 'trend' (last 7
+        days against the 7 before) and per-window figures under 'windows'
+    """
+    now = datetime.utcnow()
+    windows = sorted(set(windows) | {STATS_DEFAULT_WINDOW})
+    level = DiabetesRecord.blood_glucose_level
+    taken_at = func.coalesce(DiabetesRecord.measurement_time, DiabetesRecord.created_at)
+    
+    def since(days):
+        return taken_at >= now - timedelta(days=days)
     
-    if not records:
+    columns = []
+    for days in windows:
+        in_window = since(days)
+        columns += [
+            func.count(level).filter(in_window),
+            func.avg(level).filter(in_window),
+            func.min(level).filter(in_window),
+            func.max(level).filter(in_window),
+            func.count(level).filter(and_(in_window, level.between(*TARGET_RANGE)))
+        ]
+    # Trend: this week against the week before
+    columns += [
+        func.avg(level).filter(since(7)),
+        func.count(level).filter(and_(since(14), ~since(7))),
+        func.avg(level).filter(and_(since(14), ~since(7)))
+    ]
+    
+    row = db.session.query(*columns).filter(
+        DiabetesRecord.user_id == user.id,
+        DiabetesRecord.record_type == 'blood_glucose',
+        taken_at >= now - timedelta(days=max(windows[-1], 14)),
+        level > 0
+    ).one()
+    
+    window_stats = {}
+    for index, days in enumerate(windows):
+        count, avg_glucose, min_glucose, max_glucose, in_range = row[index * 5:index * 5 + 5]
+        window_stats[days] = {
+            'avg_glucose': round(avg_glucose, 1) if count else None,
+            'min_glucose': round(min_glucose, 1) if count else None,
+            'max_glucose': round(max_glucose, 1) if count else None,
+            'in_range_percentage': round(in_range / count * 100, 1) if count else None,
+            'total_readings': count
+        }
+    
+    headline = window_stats[STATS_DEFAULT_WINDOW]
+    if not headline['total_readings']:
         return {
             'avg_glucose': None,
             'glucose_range': None,
             'in_range_percentage': None,
-            'trend': 'insufficient_data'
+            'trend': 'insufficient_data',
+            'windows': window_stats
         }
     
-    glucose_levels = [r.blood_glucose_level for r in records if r.blood_glucose_level]
-    
-    if not glucose_levels:
-        return {'avg_glucose': None, 'glucose_range': None}
-    
-    avg_glucose = sum(glucose_levels) / len(glucose_levels)
-    min_glucose = min(glucose_levels)
-    max_glucose = max(glucose_levels)
-    
-    # Count in-range readings (70-180 mg/dL)
-    in_range = sum(1 for g in glucose_levels if 70 <= g <= 180)
-    in_range_percentage = (in_range / len(glucose_levels)) * 100
-    
     # Determine trend
-    if len(glucose_levels) >= 7:
-        recent_avg = sum(glucose_levels[:7]) / 7
-        older_avg = sum(glucose_levels[7:14]) / 7 if len(glucose_levels) >= 14 else avg_glucose
-        if recent_avg < older_avg * 0.95:
+    recent_avg, older_count, older_avg = row[-3:]
+    if recent_avg is not None and headline['total_readings'] >= 7:
+        baseline = older_avg if older_count else headline['avg_glucose']
+        if recent_avg < baseline * 0.95:
             trend = 'improving'
-        elif recent_avg > older_avg * 1.05:
+        elif recent_avg > baseline * 1.05:
             trend = 'worsening'
         else:
             trend = 'stable'
     else:
         trend = 'insufficient_data'
     
-    return {
-        'avg_glucose': round(avg_glucose, 1),
-        'min_glucose': round(min_glucose, 1),
-        'max_glucose': round(max_glucose, 1),
-        'glucose_range': f"{min_glucose:.0f}-{max_glucose:.0f}",
-        'in_range_percentage': round(in_range_percentage, 1),
-        'total_readings': len(glucose_levels),
-        'trend': trend
-    }
+    return dict(
+        headline,
+        glucose_range=f"{headline['min_glucose']:.0f}-{headline['max_glucose']:.0f}",
+        trend=trend,
+        windows=window_stats
+    )
 
 def _sync_with_external_system(user, record):
     """Sync insulin data with external medical system"""
@@ -217,8 +315,22 @@ def _get_insulin_recommendation(user, blood_glucose, carbs):
     
     return recommendation
 
-def _analyze_progress(records, diabetes_type):
-    """Analyze diabetes progress over time"""
+def _analyze_progress(user):
+    """
+    Analyze diabetes progress over time
+    
+    Streams only the needed columns in the order readings were taken
+    (measurement_time, else created_at; yield_per) and folds them into
+    weekly glucose summaries with a ROLLING_WEEKS rolling average, so
+    memory stays bounded by the number of weeks, not readings.
+    
+    Args:
+        user: User model instance
+    
+    Returns:
+        Dict with 'glucose_trends' (one entry per week), 'hba1c_trends',
+        'improvements' and 'concerns'
+    """
     progress_data = {
         'glucose_trends': [],
         'hba1c_trends': [],
@@ -226,11 +338,48 @@ def _analyze_progress(records, diabetes_type):
         'concerns': []
     }
     
-    # Analyze glucose trends
-    glucose_records = [r for r in records if r.record_type == 'blood_glucose' and r.blood_glucose_level]
-    if len(glucose_records) >= 7:
-        recent_avg = sum(r.blood_glucose_level for r in glucose_records[:7]) / 7
-        older_avg = sum(r.blood_glucose_level for r in glucose_records[7:14]) / 7 if len(glucose_records) >= 14 else recent_avg
+    # Analyze glucose trends, one week at a time
+    taken_at = func.coalesce(DiabetesRecord.measurement_time, DiabetesRecord.created_at)
+    readings = db.session.query(taken_at, DiabetesRecord.blood_glucose_level).filter(
+        DiabetesRecord.user_id == user.id,
+        DiabetesRecord.record_type == 'blood_glucose',
+        DiabetesRecord.blood_glucose_level > 0
+    ).order_by(taken_at.asc()).execution_options(yield_per=STREAM_BATCH_SIZE)
+    
+    recent_weeks = deque(maxlen=ROLLING_WEEKS)  # (sum, count) of the last weeks
+    week = None
+    
+    def close_week():
+        total, count, low, high, in_range = week['sum'], week['count'], week['min'], week['max'], week['in_range']
+        recent_weeks.append((total, count))
+        progress_data['glucose_trends'].append({
+            'week_start': week['start'].date().isoformat(),
+            'average': round(total / count, 1),
+            'min': round(low, 1),
+            'max': round(high, 1),
+            'in_range_percentage': round(in_range / count * 100, 1),
+            'readings': count,
+            'rolling_average': round(sum(t for t, _ in recent_weeks) / sum(c for _, c in recent_weeks), 1)
+        })
+    
+    for taken, level in readings:
+        start = datetime.combine(taken.date() - timedelta(days=taken.weekday()), datetime.min.time())
+        if week is None or week['start'] != start:
+            if week is not None:
+                close_week()
+            week = {'start': start, 'sum': 0.0, 'count': 0, 'min': level, 'max': level, 'in_range': 0}
+        week['sum'] += level
+        week['count'] += 1
+        week['min'] = min(week['min'], level)
+        week['max'] = max(week['max'], level)
+        week['in_range'] += TARGET_RANGE[0] <= level <= TARGET_RANGE[1]
+    if week is not None:
+        close_week()
+    
+    glucose_trends = progress_data['glucose_trends']
+    if len(glucose_trends) >= 2:
+        recent_avg = glucose_trends[-1]['average']
+        older_avg = glucose_trends[-2]['average']
         
         if recent_avg < older_avg:
             progress_data['improvements'].append(f"Average blood glucose improved from {older_avg:.1f} to {recent_avg:.1f} mg/dL")
@@ -238,10 +387,26 @@ def _analyze_progress(records, diabetes_type):
             progress_data['concerns'].append(f"Average blood glucose increased from {older_avg:.1f} to {recent_avg:.1f} mg/dL")
     
     # Analyze HbA1c trends
-    hba1c_records = [r for r in records if r.record_type == 'hba1c' and r.hba1c_value]
-    if len(hba1c_records) >= 2:
-        latest = hba1c_records[0].hba1c_value
-        previous = hba1c_records[1].hba1c_value
+    taken_at = func.coalesce(DiabetesRecord.hba1c_date, DiabetesRecord.created_at)
+    hba1c_values = db.session.query(taken_at, DiabetesRecord.hba1c_value).filter(
+        DiabetesRecord.user_id == user.id,
+        DiabetesRecord.record_type == 'hba1c',
+        DiabetesRecord.hba1c_value > 0
+    ).order_by(taken_at.asc()).execution_options(yield_per=STREAM_BATCH_SIZE)
+    
+    previous = None
+    for taken, value in hba1c_values:
+        progress_data['hba1c_trends'].append({
+            'date': taken.date().isoformat() if taken else None,
+            'value': value,
+            'change': round(value - previous, 1) if previous is not None else None
+        })
+        previous = value
+    
+    hba1c_trends = progress_data['hba1c_trends']
+    if len(hba1c_trends) >= 2:
+        latest = hba1c_trends[-1]['value']
+        previous = hba1c_trends[-2]['value']
         
         if latest < previous:
             progress_data['improvements'].append(f"HbA1c improved from {previous:.1f}% to {latest:.1f}%")
@@ -249,4 +414,3 @@ def _analyze_progress(records, diabetes_type):
             progress_data['concerns'].append(f"HbA1c increased from {previous:.1f}% to {latest:.1f}%")
     
     return progress_data
-
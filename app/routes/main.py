@@ -2,9 +2,20 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from app import db
 from app.models import User
+from app.services.catalog import get_markets, normalize_market
 
 main_bp = Blueprint('main', __name__)
 
+def _update_location(location):
+    """Set the user's market from a form value, ignoring markets prices aren't tracked for"""
+    if not location:
+        return
+    market = normalize_market(location)
+    if market:
+        current_user.location = market
+    else:
+        flash(f'Unknown market location: {location}', 'error')
+
 @main_bp.route('/')
 def index():
     """Landing page"""
@@ -23,6 +34,7 @@ def onboarding():
         current_user.height = float(request.form.get('height', 0))
         current_user.weight = float(request.form.get('weight', 0))
         current_user.activity_level = request.form.get('activity_level')
+        _update_location(request.form.get('location'))
         
         # Health conditions
         has_diabetes = request.form.get('has_diabetes') == 'yes'
@@ -43,7 +55,7 @@ def onboarding():
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('main.dashboard'))
     
-    return render_template('onboarding.html')
+    return render_template('onboarding.html', markets=get_markets())
 
 @main_bp.route('/dashboard')
 @login_required
@@ -89,6 +101,7 @@ def profile():
         current_user.height = float(request.form.get('height', 0))
         current_user.weight = float(request.form.get('weight', 0))
         current_user.activity_level = request.form.get('activity_level')
+        _update_location(request.form.get('location'))
         current_user.budget_range = request.form.get('budget_range')
         
         monthly_budget = request.form.get('monthly_budget')
@@ -99,5 +112,5 @@ def profile():
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('main.profile'))
     
-    return render_template('profile.html', user=current_user)
+    return render_template('profile.html', user=current_user, markets=get_markets())
 
@@ -0,0 +1,314 @@
+"""
+Food Catalog Snapshot
+Versioned in-memory copy of the food catalog shared by services
+"""
+import copy
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+import numpy as np
+from sqlalchemy import func
+from app import db
+from app.models import CatalogChange, FoodItem, MarketPrice
+from app.services.price_events import price_events
+
+# FoodItem.current_price is the price at this market
+DEFAULT_MARKET = 'Kampala'
+
+
+def get_markets():
+    """Market locations that prices are tracked for, default market first"""
+    markets = [m.strip() for m in os.getenv('FOOD_PRICE_MARKETS', 'Kampala,Gulu,Mbarara,Jinja,Mbale,Arua').split(',')]
+    markets = [m for m in markets if m and m != DEFAULT_MARKET]
+    return [DEFAULT_MARKET] + markets
+
+
+def normalize_market(location):
+    """Tracked market matching location (case and spacing ignored), or None if unknown"""
+    wanted = (location or '').strip().lower()
+    return next((market for market in get_markets() if market.lower() == wanted), None)
+
+
+class CatalogSnapshot:
+    """Read-only view of every food item at one catalog version"""
+
+    def __init__(self, version, foods, market_prices=()):
+        self.version = version
+        self.foods = foods  # ordered by id
+        self.by_id = {food.id: food for food in foods}
+        self.by_name = {food.name: food for food in foods}
+
+        # food x market price matrix; NaN where a market has no price yet
+        self.food_index = {food.id: row for row, food in enumerate(foods)}
+        self.markets = get_markets()
+        for _, location, _ in market_prices:
+            if location not in self.markets:
+                self.markets.append(location)
+        self.market_index = {market: col for col, market in enumerate(self.markets)}
+        self.price_matrix = np.full((len(foods), len(self.markets)), np.nan)
+
+        default_col = self.market_index[DEFAULT_MARKET]
+        for row, food in enumerate(foods):
+            if food.current_price is not None:
+                self.price_matrix[row, default_col] = food.current_price
+        for food_item_id, location, price in market_prices:
+            row = self.food_index.get(food_item_id)
+            if row is not None and price is not None:
+                self.price_matrix[row, self.market_index[location]] = price
+
+        # Price unit flags per food row; anything else is priced per 100g
+        units = np.array([food.price_unit or '' for food in foods], dtype=object)
+        self.per_kg = units == 'kg'
+        self.per_piece = units == 'piece'
+
+    def price_for(self, food_id, location=None):
+        """
+        Price of a food at a market in O(1)
+
+        Falls back to the default market (FoodItem.current_price) when the
+        location is unknown or has no price for this food.
+        """
+        row = self.food_index.get(food_id)
+        if row is None:
+            return None
+        col = self.market_index.get(location or DEFAULT_MARKET)
+        if col is not None:
+            price = self.price_matrix[row, col]
+            if not np.isnan(price):
+                return float(price)
+        return self.foods[row].current_price
+
+    def price_vector(self, location=None):
+        """Prices of every food at a market, aligned with self.foods (NaN if unpriced)"""
+        default = self.price_matrix[:, self.market_index[DEFAULT_MARKET]]
+        col = self.market_index.get(location or DEFAULT_MARKET)
+        if col is None:
+            return default
+        return np.where(np.isnan(self.price_matrix[:, col]), default, self.price_matrix[:, col])
+
+    def with_prices(self, version, changed_foods, market_prices):
+        """
+        Copy of this snapshot with some foods' prices replaced
+
+        Args:
+            version: Version of the new snapshot
+            changed_foods: Fresh rows (as built by FoodCatalog) for the changed foods
+            market_prices: (food_item_id, location, price) rows for those foods
+
+        Returns:
+            The patched snapshot, or None if the change adds foods or markets
+            and needs a full reload
+        """
+        if any(food.id not in self.food_index for food in changed_foods):
+            return None
+        if any(location not in self.market_index for _, location, _ in market_prices):
+            return None
+
+        patched = copy.copy(self)
+        patched.version = version
+        patched.foods = list(self.foods)
+        patched.price_matrix = self.price_matrix.copy()
+        patched.per_kg = self.per_kg.copy()
+        patched.per_piece = self.per_piece.copy()
+
+        default_col = self.market_index[DEFAULT_MARKET]
+        for food in changed_foods:
+            row = self.food_index[food.id]
+            patched.foods[row] = food
+            patched.price_matrix[row, :] = np.nan
+            if food.current_price is not None:
+                patched.price_matrix[row, default_col] = food.current_price
+            patched.per_kg[row] = food.price_unit == 'kg'
+            patched.per_piece[row] = food.price_unit == 'piece'
+        for food_item_id, location, price in market_prices:
+            if price is not None:
+                patched.price_matrix[self.food_index[food_item_id], self.market_index[location]] = price
+
+        patched.by_id = {food.id: food for food in patched.foods}
+        patched.by_name = {food.name: food for food in patched.foods}
+        return patched
+
+    def find_food_in_text(self, text):
+        """Return the first food whose name or local name appears in text"""
+        text_lower = text.lower()
+        for food in self.foods:
+            if food.name_lower in text_lower or (food.local_name_lower and food.local_name_lower in text_lower):
+                return food
+        return None
+
+
+class FoodCatalog:
+    """
+    Tracks the catalog version and lazily builds snapshots
+
+    The version is the id of the newest catalog_changes row, so every
+    process sharing the database agrees on it. Each process re-reads the
+    change log at most every sync_seconds and publishes a price change
+    event for every change it applies, its own and other processes' alike;
+    anything cached against the catalog should compare versions before reuse.
+    """
+
+    def __init__(self):
+        self.version = 0  # 0 until the change log has been read
+        self.sync_seconds = float(os.getenv('CATALOG_SYNC_SECONDS', 5))
+        # Changes kept in catalog_changes; a process further behind reloads everything
+        self.log_size = int(os.getenv('CATALOG_CHANGE_LOG_SIZE', 1000))
+        self._synced_at = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def bump_version(self):
+        """Record that any food data may have changed, drop the snapshot and publish the change"""
+        self.sync(force=True)
+        version = self._record_change(None)
+        self.sync(force=True, local_version=version)
+        return version
+
+    def apply_price_changes(self, food_ids):
+        """
+        Record price updates, patch the snapshot and publish the change
+
+        The current snapshot is copied with fresh rows for food_ids instead of
+        being dropped, so the next reader does not reload the whole catalog.
+        The price change event goes out in the same call, so no reader sees
+        the new version without the event that explains it. The change log is
+        read first, so a process that has not synced yet (a fresh worker)
+        publishes its own change with its food ids rather than as a full reload.
+
+        Returns:
+            The new catalog version
+        """
+        self.sync(force=True)
+        version = self._record_change(sorted(set(food_ids)))
+        self.sync(force=True, local_version=version)
+        return version
+
+    def sync(self, force=False, local_version=None):
+        """
+        Catch up with catalog changes recorded by any process
+
+        Args:
+            force: Read the change log even if it was read less than sync_seconds ago
+            local_version: Version of the change this process just recorded
+
+        Returns:
+            The current catalog version
+        """
+        if not force and not self._sync_due():
+            return self.version
+
+        with self._lock:
+            if not force and not self._sync_due():
+                return self.version
+            changes = self._load_changes()
+            self._synced_at = time.monotonic()
+            if not changes:
+                return self.version
+            previous = self.version
+            self._apply_changes(changes)
+            version = self.version
+
+        # Outside the lock: subscribers read the new snapshot
+        for change_version, food_ids in changes:
+            price_events.publish(food_ids, change_version, previous, local=change_version == local_version)
+            previous = change_version
+        return version
+
+    def snapshot(self):
+        """Get the snapshot for the current version, loading it if needed"""
+        self.sync()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self.version:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != self.version:
+                self._snapshot = CatalogSnapshot(self.version, self._load_foods(), self._load_market_prices())
+            return self._snapshot
+
+    def _sync_due(self):
+        return self._synced_at is None or time.monotonic() - self._synced_at >= self.sync_seconds
+
+    def _record_change(self, food_ids):
+        """
+        Append a change to the log and trim entries beyond log_size
+
+        Returns:
+            Version of the recorded change
+        """
+        change = CatalogChange(food_ids=json.dumps(food_ids) if food_ids is not None else None)
+        db.session.add(change)
+        db.session.flush()
+        version = change.id
+        CatalogChange.query.filter(CatalogChange.id <= version - self.log_size).delete()
+        db.session.commit()
+        return version
+
+    def _load_changes(self):
+        """
+        Changes newer than self.version, oldest first
+
+        Returns:
+            List of (version, food_ids or None) tuples
+        """
+        latest = db.session.query(func.max(CatalogChange.id)).scalar() or 0
+        if latest == self.version:
+            return []
+        if latest < self.version or self.version == 0:
+            # First read, or the log was recreated (fresh database): one full change
+            return [(latest, None)]
+        rows = db.session.query(CatalogChange.id, CatalogChange.food_ids).filter(
+            CatalogChange.id > self.version, CatalogChange.id <= latest
+        ).order_by(CatalogChange.id).all()
+        if not rows or rows[0].id != self.version + 1:
+            # Changes we missed were trimmed from the log
+            return [(latest, None)]
+        return [(version, json.loads(food_ids) if food_ids else None) for version, food_ids in rows]
+
+    def _apply_changes(self, changes):
+        """Move to the newest change, patching the snapshot if only some prices changed"""
+        previous = self.version
+        snapshot = self._snapshot
+        self.version = changes[-1][0]
+        self._snapshot = None
+
+        if snapshot is None or snapshot.version != previous or changes[0][0] != previous + 1:
+            return
+        food_ids = set()
+        for _, ids in changes:
+            if ids is None:
+                return
+            food_ids.update(ids)
+        if len(food_ids) > len(snapshot.foods) // 2:
+            # Most of the catalog changed; a full reload is cheaper
+            return
+
+        changed_foods = self._load_foods(food_ids)
+        market_prices = self._load_market_prices(food_ids)
+        self._snapshot = snapshot.with_prices(self.version, changed_foods, market_prices)
+
+    def _load_foods(self, food_ids=None):
+        columns = [column.name for column in FoodItem.__table__.columns]
+        query = FoodItem.query
+        if food_ids is not None:
+            query = query.filter(FoodItem.id.in_(food_ids))
+        foods = []
+        for food in query.order_by(FoodItem.id).all():
+            row = SimpleNamespace(**{name: getattr(food, name) for name in columns})
+            row.name_lower = row.name.lower()
+            row.local_name_lower = row.local_name.lower() if row.local_name else None
+            foods.append(row)
+        return foods
+
+    def _load_market_prices(self, food_ids=None):
+        query = MarketPrice.query.with_entities(
+            MarketPrice.food_item_id, MarketPrice.location, MarketPrice.price
+        )
+        if food_ids is not None:
+            query = query.filter(MarketPrice.food_item_id.in_(food_ids))
+        return query.all()
+
+
+catalog = FoodCatalog()
@@ -0,0 +1,100 @@
+"""
+Chat History Archival
+Moves old chat turns into compressed cold storage
+"""
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app import db
+from app.models import ChatHistory, ChatHistoryArchive
+from app.services.chat_history_writer import history_writer
+
+
+class ChatArchiveService:
+    """Archives chat_history rows older than a retention window"""
+
+    def __init__(self, older_than_days=90, chunk_size=1000):
+        self.older_than_days = older_than_days
+        self.chunk_size = chunk_size
+
+    def archive_old_history(self, older_than_days=None):
+        """
+        Move chat turns older than the window into chat_history_archive
+
+        Each user's old turns are packed oldest first into compressed chunks
+        of at most chunk_size turns, one transaction per chunk.
+
+        Returns:
+            Dict with the number of users, turns and archive rows processed
+        """
+        days = older_than_days if older_than_days is not None else self.older_than_days
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        history_writer.flush()
+
+        user_ids = [
+            user_id for user_id, in db.session.query(ChatHistory.user_id).filter(
+                ChatHistory.created_at < cutoff
+            ).distinct().all()
+        ]
+
+        summary = {'users': len(user_ids), 'turns': 0, 'archives': 0}
+        for user_id in user_ids:
+            while True:
+                archived = self._archive_chunk(user_id, cutoff)
+                if not archived:
+                    break
+                summary['turns'] += archived
+                summary['archives'] += 1
+        return summary
+
+    def get_archived_history(self, user, limit=50):
+        """Most recent archived turns for a user, newest first"""
+        archives = ChatHistoryArchive.query.filter_by(
+            user_id=user.id
+        ).order_by(ChatHistoryArchive.first_message_at.desc()).yield_per(10)
+
+        turns = []
+        for archive in archives:
+            turns.extend(reversed(archive.load_turns()))
+            if len(turns) >= limit:
+                break
+        return turns[:limit]
+
+    def _archive_chunk(self, user_id, cutoff):
+        rows = ChatHistory.query.filter(
+            ChatHistory.user_id == user_id,
+            ChatHistory.created_at < cutoff
+        ).order_by(ChatHistory.created_at.asc(), ChatHistory.id.asc()).limit(self.chunk_size).all()
+
+        if not rows:
+            return 0
+
+        turns = [{
+            'id': row.id,
+            'message': row.message,
+            'response': row.response,
+            'intent': row.intent,
+            'entities': json.loads(row.entities) if row.entities else {},
+            'created_at': row.created_at.isoformat()
+        } for row in rows]
+
+        try:
+            db.session.execute(insert(ChatHistoryArchive), [{
+                'user_id': user_id,
+                'first_chat_id': rows[0].id,
+                'last_chat_id': rows[-1].id,
+                'first_message_at': rows[0].created_at,
+                'last_message_at': rows[-1].created_at,
+                'turn_count': len(rows),
+                'payload': ChatHistoryArchive.compress_turns(turns),
+                'created_at': datetime.utcnow()
+            }])
+            ChatHistory.query.filter(
+                ChatHistory.id.in_([row.id for row in rows])
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return len(rows)
@@ -0,0 +1,183 @@
+"""
+Chat History Write-Behind Buffer
+Batches ChatHistory inserts off the request path
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import insert
+from app import db
+from app.models import ChatHistory
+
+
+class ChatHistoryWriter:
+    """Bounded in-process buffer that flushes ChatHistory rows in batches"""
+
+    def __init__(self):
+        self.app = None
+        self.batch_size = int(os.getenv('CHAT_HISTORY_BATCH_SIZE', 50))
+        self.flush_interval_ms = int(os.getenv('CHAT_HISTORY_FLUSH_INTERVAL_MS', 500))
+        self.max_pending = int(os.getenv('CHAT_HISTORY_MAX_PENDING', 1000))
+        self.block_timeout = float(os.getenv('CHAT_HISTORY_BLOCK_TIMEOUT', 2.0))
+        # 'strict' writes every row synchronously, like the original behaviour
+        self.strict = os.getenv('CHAT_HISTORY_DURABILITY', 'buffered').lower() == 'strict'
+        # Write attempts per batch before it is retried row by row
+        self.max_retries = int(os.getenv('CHAT_HISTORY_MAX_RETRIES', 3))
+
+        self._pending = []
+        self._failed = []  # (rows, attempts) batches waiting to be retried
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        """Bind the writer to an app and start the background flusher"""
+        self.app = app
+        if self.strict or self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self._run, name='chat-history-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def record(self, user_id, message, response, intent, entities):
+        """
+        Queue a chat turn for persistence
+
+        Args:
+            user_id: ID of the user who sent the message
+            message: User's message string
+            response: Generated response string
+            intent: Detected intent
+            entities: Dict of extracted entities
+        """
+        row = {
+            'user_id': user_id,
+            'message': message,
+            'response': response,
+            'intent': intent,
+            'entities': json.dumps(entities),
+            'created_at': datetime.utcnow()
+        }
+
+        if self.strict or self._thread is None:
+            self._write([row])
+            return
+
+        with self._condition:
+            # Backpressure: wait for the flusher to make room
+            deadline = time.monotonic() + self.block_timeout
+            while len(self._pending) >= self.max_pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.notify_all()
+                self._condition.wait(remaining)
+
+            if len(self._pending) < self.max_pending:
+                self._pending.append(row)
+                if len(self._pending) >= self.batch_size:
+                    self._condition.notify_all()
+                return
+
+        # Flusher is not keeping up - write this row inline
+        self._write([row])
+
+    def pending_count(self):
+        """Number of rows waiting to be written"""
+        with self._condition:
+            return len(self._pending)
+
+    def flush(self):
+        """
+        Write all pending rows now
+
+        Holding the write lock also waits for a batch the flusher thread has
+        already taken, so every row recorded before the call is written (or
+        queued for retry) when this returns.
+        """
+        with self._write_lock:
+            self._write_batches(self._take_pending())
+
+    def shutdown(self):
+        """Stop the flusher and write whatever is still pending"""
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        """Background loop: flush every batch_size rows or flush_interval_ms"""
+        interval = self.flush_interval_ms / 1000.0
+        while not self._stop.is_set():
+            with self._condition:
+                if len(self._pending) < self.batch_size:
+                    self._condition.wait(interval)
+            # Take and write under one lock hold, so flush() can wait for the batch
+            with self._write_lock:
+                self._write_batches(self._take_pending())
+
+    def _take_pending(self):
+        with self._condition:
+            batch = self._pending
+            self._pending = []
+            self._condition.notify_all()
+        return batch
+
+    def _write(self, rows):
+        """Insert rows in a single transaction"""
+        with self._write_lock:
+            self._write_batches(rows)
+
+    def _write_batches(self, rows):
+        """Retry earlier failed batches, then write rows; call with the write lock held"""
+        retries, self._failed = self._failed, []
+        for batch, attempts in retries:
+            self._write_batch(batch, attempts)
+        if rows:
+            self._write_batch(rows, 0)
+
+    def _write_batch(self, rows, attempts):
+        if self._insert(rows):
+            return
+
+        attempts += 1
+        if attempts < self.max_retries:
+            self._failed.append((rows, attempts))
+            # Bound what is held for retry; the oldest rows go first
+            while sum(len(batch) for batch, _ in self._failed) > self.max_pending:
+                dropped, _ = self._failed.pop(0)
+                print(f"Dropped {len(dropped)} chat history rows: retry queue full")
+            return
+
+        # Retries exhausted: write rows one by one so a bad row cannot sink the batch
+        lost = rows if len(rows) == 1 else [row for row in rows if not self._insert([row])]
+        if lost:
+            print(f"Dropped {len(lost)} chat history rows after {attempts} failed attempts")
+
+    def _insert(self, rows):
+        """Returns True if rows were committed"""
+        if self.app is None:
+            return self._execute(rows)
+        with self.app.app_context():
+            return self._execute(rows)
+
+    def _execute(self, rows):
+        try:
+            db.session.execute(insert(ChatHistory), rows)
+            db.session.commit()
+            return True
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error writing {len(rows)} chat history rows: {str(e)}")
+            return False
+
+
+history_writer = ChatHistoryWriter()
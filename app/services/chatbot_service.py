@@ -3,17 +3,28 @@ NLP Conversational Interface Service
 Uses LLM for dietary conversations and nutrition advice
 """
 import json
+import os
 import re
 from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, func, or_, and_
 from app import db
-from app.models import ChatHistory, User, FoodItem, Recommendation
+from app.models import ChatHistory, User, FoodLog
 from app.services.recommendation_engine import RecommendationEngine
+from app.services.chat_history_writer import history_writer
+from app.services.catalog import catalog
+from app.services.response_cache import response_cache
+from app.services.conversation_context import context_store
 
 class ChatbotService:
     """NLP-powered chatbot for dietary conversations"""
     
     def __init__(self):
         self.recommendation_engine = RecommendationEngine()
+        self.history_writer = history_writer
+        self.response_cache = response_cache
+        self.context_store = context_store
         self.intents = {
             'greeting': ['hello', 'hi', 'hey', 'greetings'],
             'food_recommendation': ['recommend', 'suggest', 'what should i eat', 'food', 'meal'],
@@ -24,6 +35,20 @@ class ChatbotService:
             'recipe': ['recipe', 'how to cook', 'prepare', 'make'],
             'goodbye': ['bye', 'goodbye', 'see you', 'thanks', 'thank you']
         }
+        # Sent straight away by the streaming endpoint while the answer is computed
+        self.acknowledgements = {
+            'food_recommendation': "Let me find the best foods for your profile...",
+            'nutrition_info': "Looking up the nutrition details...",
+            'diabetes_advice': "Let me check your diabetes care plan...",
+            'weight_management': "Let me check your weight goals...",
+            'budget': "Checking current market prices...",
+            'recipe': "Let me find some preparation tips..."
+        }
+        # Words that point back at something said earlier in the conversation
+        self.reference_pattern = re.compile(r"\b(it|its|it's|this|that|them|they|those|these)\b")
+        self.follow_up_prefixes = ('what about', 'how about', 'and ', 'also ')
+        # Budget answers are cached per bucket of this size (UGX/month)
+        self.budget_bucket = float(os.getenv('BUDGET_BUCKET_UGX', 10000))
     
     def process_message(self, user, message):
         """
@@ -38,25 +63,15 @@ class ChatbotService:
         """
         message_lower = message.lower().strip()
         
-        # Detect intent
-        intent = self._detect_intent(message_lower)
-        
-        # Extract entities
-        entities = self._extract_entities(message_lower, user)
+        # Detect intent and extract entities, filling gaps from earlier turns
+        intent, entities = self._understand(user, message_lower)
         
         # Generate response based on intent
         response = self._generate_response(user, message, intent, entities)
         
-        # Save to history
-        chat_history = ChatHistory(
-            user_id=user.id,
-            message=message,
-            response=response,
-            intent=intent,
-            entities=json.dumps(entities)
-        )
-        db.session.add(chat_history)
-        db.session.commit()
+        # Save to history (buffered unless strict durability is configured)
+        self.context_store.add_turn(user.id, intent, entities)
+        self.history_writer.record(user.id, message, response, intent, entities)
         
         return {
             'response': response,
@@ -64,6 +79,216 @@ class ChatbotService:
             'entities': entities
         }
     
+    def process_batch(self, items):
+        """
+        Process many messages from many users in one pass
+        
+        Intent detection and entity extraction run vectorized over the whole
+        batch against one catalog snapshot, recommendation scoring is shared by
+        users with the same profile, and every ChatHistory row is committed in a
+        single transaction.
+        
+        Args:
+            items: List of dicts with 'user_id' and 'message'
+        
+        Returns:
+            List of result dicts in input order; unknown users get an 'error'
+        """
+        if not items:
+            return []
+        
+        snapshot = catalog.snapshot()
+        user_ids = {item['user_id'] for item in items}
+        users = {user.id: user for user in User.query.filter(User.id.in_(user_ids)).all()}
+        
+        messages = [item['message'] for item in items]
+        messages_lower = [message.lower().strip() for message in messages]
+        intents = self._detect_intents_batch(messages_lower)
+        entities_list = self._extract_entities_batch(messages_lower, snapshot)
+        
+        # In order, so a user's later messages can refer back to earlier ones
+        batch_turns = {}  # user id -> this batch's turns, added to the store after commit
+        for i, item in enumerate(items):
+            user = users.get(item['user_id'])
+            if user is not None:
+                pending = batch_turns.setdefault(user.id, [])
+                intents[i], entities_list[i] = self._resolve_context(
+                    user, messages_lower[i], intents[i], entities_list[i], pending
+                )
+                pending.append({'intent': intents[i], 'entities': entities_list[i]})
+        
+        recommendations = self._batch_recommendations(items, users, intents, entities_list)
+        
+        results = []
+        history_rows = []
+        for i, item in enumerate(items):
+            user = users.get(item['user_id'])
+            if user is None:
+                results.append({'user_id': item['user_id'], 'error': 'Unknown user'})
+                continue
+            
+            intent, entities = intents[i], entities_list[i]
+            if intent == 'food_recommendation':
+                response = ''.join(self._recommendation_fragments(recommendations[i]))
+            else:
+                response = self._generate_response(user, messages[i], intent, entities)
+            
+            history_rows.append({
+                'user_id': user.id,
+                'message': messages[i],
+                'response': response,
+                'intent': intent,
+                'entities': json.dumps(entities),
+                'created_at': datetime.utcnow()
+            })
+            results.append({
+                'user_id': user.id,
+                'response': response,
+                'intent': intent,
+                'entities': entities
+            })
+        
+        # New recommendations and all history rows go in one transaction
+        if history_rows:
+            db.session.execute(insert(ChatHistory), history_rows)
+        db.session.commit()
+        
+        # Only remember turns whose history rows were saved
+        for user_id, turns in batch_turns.items():
+            self.context_store.add_committed_turns(user_id, turns)
+        
+        return results
+    
+    def _detect_intents_batch(self, messages_lower):
+        """Same scoring as _detect_intent, computed as a keyword matrix over all messages"""
+        intent_names = list(self.intents)
+        keywords = [(keyword, intent) for intent in intent_names for keyword in self.intents[intent]]
+        series = pd.Series(messages_lower, dtype=object)
+        
+        # messages x keywords hit matrix, then keywords x intents weights
+        hits = np.column_stack([
+            series.str.contains(keyword, regex=False).to_numpy(dtype=np.int32)
+            for keyword, _ in keywords
+        ])
+        weights = np.zeros((len(keywords), len(intent_names)), dtype=np.int32)
+        for row, (_, intent) in enumerate(keywords):
+            weights[row, intent_names.index(intent)] = 1
+        scores = hits @ weights
+        
+        # argmax returns the first maximum, matching max() over the intent dict
+        best = scores.argmax(axis=1)
+        return [
+            intent_names[best[i]] if scores[i, best[i]] > 0 else 'general'
+            for i in range(len(messages_lower))
+        ]
+    
+    def _extract_entities_batch(self, messages_lower, snapshot):
+        """Same entities as _extract_entities, matched column-wise over all messages"""
+        series = pd.Series(messages_lower, dtype=object)
+        entities_list = [{} for _ in messages_lower]
+        
+        # First food (in catalog order) mentioned by name or local name
+        unmatched = np.ones(len(messages_lower), dtype=bool)
+        for food in snapshot.foods:
+            if not unmatched.any():
+                break
+            matched = series.str.contains(food.name_lower, regex=False).to_numpy(dtype=bool)
+            if food.local_name_lower:
+                matched = matched | series.str.contains(food.local_name_lower, regex=False).to_numpy(dtype=bool)
+            for i in np.flatnonzero(matched & unmatched):
+                entities_list[i]['food'] = food.name
+            unmatched &= ~matched
+        
+        for i, numbers in enumerate(series.str.findall(r'\d+\.?\d*')):
+            if numbers:
+                entities_list[i]['numbers'] = [float(n) for n in numbers]
+        
+        unmatched = np.ones(len(messages_lower), dtype=bool)
+        for meal in ['breakfast', 'lunch', 'dinner', 'snack']:
+            matched = series.str.contains(meal, regex=False).to_numpy(dtype=bool)
+            for i in np.flatnonzero(matched & unmatched):
+                entities_list[i]['meal_type'] = meal
+            unmatched &= ~matched
+        
+        return entities_list
+    
+    def _batch_recommendations(self, items, users, intents, entities_list):
+        """Generate recommendations for every food_recommendation message in the batch"""
+        wanted = [
+            i for i, item in enumerate(items)
+            if intents[i] == 'food_recommendation' and item['user_id'] in users
+        ]
+        if not wanted:
+            return {}
+        
+        # Last 10 logged foods for every user in one query
+        wanted_user_ids = {items[i]['user_id'] for i in wanted}
+        position = func.row_number().over(
+            partition_by=FoodLog.user_id,
+            order_by=FoodLog.consumed_at.desc()
+        ).label('position')
+        recent_logs = db.session.query(FoodLog.user_id, FoodLog.food_item_id, position).filter(
+            FoodLog.user_id.in_(wanted_user_ids)
+        ).subquery()
+        recent_food_ids = {user_id: set() for user_id in wanted_user_ids}
+        for user_id, food_item_id in db.session.query(
+            recent_logs.c.user_id, recent_logs.c.food_item_id
+        ).filter(recent_logs.c.position <= 10):
+            recent_food_ids[user_id].add(food_item_id)
+        
+        engine = self.recommendation_engine
+        profile_scores = {}
+        recommendations = {}
+        for i in wanted:
+            user = users[items[i]['user_id']]
+            meal_type = entities_list[i].get('meal_type', 'all')
+            
+            # Users with the same profile share the profile part of the score
+            group = (engine.profile_key(user), meal_type)
+            if group not in profile_scores:
+                profile_scores[group] = engine.profile_scores(user, meal_type)
+            
+            ranked_foods = engine.rank_foods(
+                user, meal_type,
+                recent_food_ids=recent_food_ids[user.id],
+                profile_scores=profile_scores[group]
+            )
+            recommendations[i] = engine.generate_recommendations(
+                user=user,
+                meal_type=meal_type,
+                limit=3,
+                ranked_foods=ranked_foods,
+                commit=False
+            )
+        return recommendations
+    
+    def _understand(self, user, message_lower):
+        """Detect intent and entities, resolving references to earlier turns"""
+        intent = self._detect_intent(message_lower)
+        entities = self._extract_entities(message_lower, user)
+        return self._resolve_context(user, message_lower, intent, entities)
+    
+    def _resolve_context(self, user, message_lower, intent, entities, pending=()):
+        """
+        Use the conversation context for follow-up messages
+        
+        "What about its protein?" takes the food from the previous turn, and
+        "what about dinner?" repeats the previous intent for a new meal type.
+        pending holds newer turns not yet in the context store.
+        """
+        if intent == 'general' and message_lower.startswith(self.follow_up_prefixes):
+            previous_intent = self.context_store.last_intent(user.id, pending)
+            if previous_intent:
+                intent = previous_intent
+        
+        if 'food' not in entities and intent in ('nutrition_info', 'recipe') \
+                and self.reference_pattern.search(message_lower):
+            previous_food = self.context_store.last_entity(user.id, 'food', pending)
+            if previous_food:
+                entities['food'] = previous_food
+        
+        return intent, entities
+    
     def _detect_intent(self, message):
         """Detect user intent from message"""
         message_lower = message.lower()
@@ -85,12 +310,10 @@ class ChatbotService:
         entities = {}
         message_lower = message.lower()
         
-        # Extract food names
-        food_items = FoodItem.query.all()
-        for food in food_items:
-            if food.name.lower() in message_lower or (food.local_name and food.local_name.lower() in message_lower):
-                entities['food'] = food.name
-                break
+        # Extract food names (from the in-memory catalog, no query per message)
+        food = catalog.snapshot().find_food_in_text(message_lower)
+        if food:
+            entities['food'] = food.name
         
         # Extract numbers (could be calories, weight, etc.)
         numbers = re.findall(r'\d+\.?\d*', message)
@@ -106,11 +329,40 @@ class ChatbotService:
         
         return entities
     
+    def stream_message(self, user, message):
+        """
+        Process user message and yield the response incrementally
+
+        Yields (event, data) tuples: a 'meta' event with the intent, entities and
+        a short acknowledgement, one 'chunk' event per response fragment as it
+        is computed, and a final 'done' event with the full response.
+        """
+        message_lower = message.lower().strip()
+        
+        intent, entities = self._understand(user, message_lower)
+        yield 'meta', {'intent': intent, 'ack': self.acknowledgements.get(intent)}
+        yield 'entities', {'entities': entities}
+        
+        fragments = []
+        for fragment in self._iter_response(user, message, intent, entities):
+            fragments.append(fragment)
+            yield 'chunk', {'text': fragment}
+        response = ''.join(fragments)
+        
+        self.context_store.add_turn(user.id, intent, entities)
+        self.history_writer.record(user.id, message, response, intent, entities)
+        
+        yield 'done', {'response': response, 'intent': intent, 'entities': entities}
+    
     def _generate_response(self, user, message, intent, entities):
         """Generate response based on intent and context"""
+        return ''.join(self._iter_response(user, message, intent, entities))
+    
+    def _iter_response(self, user, message, intent, entities):
+        """Yield response fragments as soon as each one is available"""
         
         if intent == 'greeting':
-            return f"Hello {user.first_name or 'there'}! I'm ZOE, your nutrition assistant. How can I help you today? I can help with food recommendations, nutrition advice, diabetes management, and more!"
+            yield f"Hello {user.first_name or 'there'}! I'm ZOE, your nutrition assistant. How can I help you today? I can help with food recommendations, nutrition advice, diabetes management, and more!"
         
         elif intent == 'food_recommendation':
             meal_type = entities.get('meal_type', 'all')
@@ -119,80 +371,140 @@ class ChatbotService:
                 meal_type=meal_type,
                 limit=3
             )
-            
-            if recommendations:
-                food_names = [rec.food_item.name for rec in recommendations]
-                response = f"Based on your profile, I recommend: {', '.join(food_names)}. "
-                if recommendations[0].reasoning:
-                    response += f"Reason: {recommendations[0].reasoning}"
-                return response
-            else:
-                return "I'm having trouble finding recommendations right now. Please check your profile settings."
+            yield from self._recommendation_fragments(recommendations)
         
         elif intent == 'nutrition_info':
             food_name = entities.get('food')
             if food_name:
-                food = FoodItem.query.filter_by(name=food_name).first()
-                if food:
-                    return self._format_nutrition_info(food)
-                else:
-                    return f"I don't have information about {food_name} in my database. Could you try a different food?"
+                yield self.response_cache.get_or_set(
+                    'nutrition_info', (food_name, user.location),
+                    lambda: self._nutrition_info_response(food_name, user.location),
+                    depends_on=self._food_ids_named(food_name)
+                )
             else:
-                return "Which food would you like to know about? I can provide detailed nutritional information."
+                yield "Which food would you like to know about? I can provide detailed nutritional information."
         
         elif intent == 'diabetes_advice':
             if not user.has_diabetes:
-                return "I notice you don't have diabetes in your profile. Would you like to update your health information?"
-            
-            response = "For diabetes management, I recommend:\n"
-            response += "1. Choose foods with low glycemic index (GI < 55)\n"
-            response += "2. Monitor your blood sugar regularly\n"
-            response += "3. Eat balanced meals with protein, fiber, and healthy carbs\n"
-            response += "4. Avoid high-sugar foods and refined carbohydrates\n\n"
+                yield "I notice you don't have diabetes in your profile. Would you like to update your health information?"
+                return
             
-            if user.diabetes_type == 'type1':
-                response += "For Type 1 diabetes, make sure to coordinate with your medical provider for insulin dosing."
-            elif user.diabetes_type == 'type2':
-                response += "For Type 2 diabetes, focus on lifestyle changes and medication adherence."
-            
-            return response
+            yield from self.response_cache.get_or_set(
+                'diabetes_advice', (user.diabetes_type,),
+                lambda: self._diabetes_advice_fragments(user.diabetes_type),
+                depends_on=()
+            )
         
         elif intent == 'weight_management':
-            if user.primary_goal == 'lose_weight':
-                return "For weight loss, I recommend:\n- Low-calorie, high-fiber foods\n- Lean proteins\n- Plenty of vegetables\n- Portion control\n- Regular physical activity"
-            elif user.primary_goal == 'gain_weight':
-                return "For healthy weight gain, I recommend:\n- Calorie-dense foods\n- High-protein options\n- Healthy fats\n- Regular meals and snacks"
-            else:
-                return "I can help you with weight management. Would you like to set a weight goal in your profile?"
+            yield self.response_cache.get_or_set(
+                'weight_management', (user.primary_goal,),
+                lambda: self._weight_management_response(user.primary_goal),
+                depends_on=()
+            )
         
         elif intent == 'budget':
             if user.monthly_budget:
-                daily_budget = user.monthly_budget / 30
-                affordable_foods = FoodItem.query.filter(
-                    FoodItem.current_price <= daily_budget * 0.15
-                ).limit(5).all()
+                budget = self._budget_bucket(user.monthly_budget)
+                food_names = self.response_cache.get_or_set(
+                    'budget', (budget, user.location),
+                    lambda: self._affordable_food_names(budget, user.location)
+                )
                 
-                if affordable_foods:
-                    food_names = [f.name for f in affordable_foods]
-                    return f"Based on your budget of {user.monthly_budget:,.0f} UGX/month, here are affordable options: {', '.join(food_names)}"
+                if food_names:
+                    yield f"Based on your budget of {user.monthly_budget:,.0f} UGX/month, here are affordable options: {', '.join(food_names)}"
+                    return
             
-            return "I can help you find affordable foods. Please set your monthly budget in your profile settings."
+            yield "I can help you find affordable foods. Please set your monthly budget in your profile settings."
         
         elif intent == 'recipe':
             food_name = entities.get('food')
             if food_name:
-                return f"I can help you with recipes for {food_name}. Here's a simple preparation tip: focus on steaming, boiling, or grilling to preserve nutrients. Would you like more specific cooking instructions?"
+                yield f"I can help you with recipes for {food_name}. Here's a simple preparation tip: focus on steaming, boiling, or grilling to preserve nutrients. Would you like more specific cooking instructions?"
             else:
-                return "Which food would you like a recipe for? I can provide cooking tips and preparation methods."
+                yield "Which food would you like a recipe for? I can provide cooking tips and preparation methods."
         
         elif intent == 'goodbye':
-            return "You're welcome! Feel free to ask me anything about nutrition anytime. Stay healthy!"
+            yield "You're welcome! Feel free to ask me anything about nutrition anytime. Stay healthy!"
         
         else:
             # General fallback
-            return "I'm here to help with nutrition and dietary advice. You can ask me about:\n- Food recommendations\n- Nutritional information\n- Diabetes management\n- Weight management\n- Budget-friendly options\nWhat would you like to know?"
+            yield "I'm here to help with nutrition and dietary advice. You can ask me about:\n- Food recommendations\n- Nutritional information\n- Diabetes management\n- Weight management\n- Budget-friendly options\nWhat would you like to know?"
+    
+    def _recommendation_fragments(self, recommendations):
+        """Response fragments listing generated recommendations"""
+        foods_by_id = catalog.snapshot().by_id
+        # Skip foods removed from the catalog since the recommendation was made
+        food_names = [food.name for food in (foods_by_id.get(rec.food_item_id) for rec in recommendations) if food]
+        if not food_names:
+            return ["I'm having trouble finding recommendations right now. Please check your profile settings."]
+        
+        fragments = [f"Based on your profile, I recommend: {', '.join(food_names)}. "]
+        if recommendations[0].reasoning:
+            fragments.append(f"Reason: {recommendations[0].reasoning}")
+        return fragments
+    
+    def _food_ids_named(self, food_name):
+        """IDs of the catalog food with this name (empty if unknown)"""
+        food = catalog.snapshot().by_name.get(food_name)
+        return (food.id,) if food else ()
+    
+    def _nutrition_info_response(self, food_name, location=None):
+        """Nutrition answer for a food name, resolved from the catalog snapshot"""
+        snapshot = catalog.snapshot()
+        food = snapshot.by_name.get(food_name)
+        if food:
+            return self._format_nutrition_info(food, snapshot.price_for(food.id, location))
+        return f"I don't have information about {food_name} in my database. Could you try a different food?"
+    
+    def _diabetes_advice_fragments(self, diabetes_type):
+        """Diabetes advice lines for a diabetes type"""
+        fragments = [
+            "For diabetes management, I recommend:\n",
+            "1. Choose foods with low glycemic index (GI < 55)\n",
+            "2. Monitor your blood sugar regularly\n",
+            "3. Eat balanced meals with protein, fiber, and healthy carbs\n",
+            "4. Avoid high-sugar foods and refined carbohydrates\n\n"
+        ]
+        
+        if diabetes_type == 'type1':
+            fragments.append("For Type 1 diabetes, make sure to coordinate with your medical provider for insulin dosing.")
+        elif diabetes_type == 'type2':
+            fragments.append("For Type 2 diabetes, focus on lifestyle changes and medication adherence.")
+        
+        return fragments
+    
+    def _weight_management_response(self, primary_goal):
+        """Weight management advice for a primary goal"""
+        if primary_goal == 'lose_weight':
+            return "For weight loss, I recommend:\n- Low-calorie, high-fiber foods\n- Lean proteins\n- Plenty of vegetables\n- Portion control\n- Regular physical activity"
+        elif primary_goal == 'gain_weight':
+            return "For healthy weight gain, I recommend:\n- Calorie-dense foods\n- High-protein options\n- Healthy fats\n- Regular meals and snacks"
+        return "I can help you with weight management. Would you like to set a weight goal in your profile?"
+    
+    def _budget_bucket(self, monthly_budget):
+        """
+        Round a budget down to BUDGET_BUCKET_UGX so nearby budgets share a cache entry
+        
+        Rounding down never lists a food the exact budget could not afford.
+        """
+        if monthly_budget < self.budget_bucket:
+            return monthly_budget
+        return monthly_budget // self.budget_bucket * self.budget_bucket
     
-    def _format_nutrition_info(self, food):
+    def _affordable_food_names(self, monthly_budget, location=None):
+        """Names of up to 5 foods costing at most 15% of the daily budget at the user's market"""
+        max_price = (monthly_budget / 30) * 0.15
+        snapshot = catalog.snapshot()
+        names = []
+        for food in snapshot.foods:
+            price = snapshot.price_for(food.id, location)
+            if price is not None and price <= max_price:
+                names.append(food.name)
+                if len(names) == 5:
+                    break
+        return names
+    
+    def _format_nutrition_info(self, food, price=None):
         """Format nutritional information for a food item"""
         info = f"Nutritional information for {food.name} (per 100g):\n\n"
         
@@ -213,14 +525,35 @@ class ChatbotService:
         if food.iron:
             info += f"Iron: {food.iron}mg\n"
         
-        if food.current_price:
-            info += f"\nCurrent price: {food.current_price:,.0f} UGX per {food.price_unit}"
+        price = price if price is not None else food.current_price
+        if price:
+            info += f"\nCurrent price: {price:,.0f} UGX per {food.price_unit}"
         
         return info
     
-    def get_conversation_history(self, user, limit=10):
-        """Get recent conversation history"""
-        return ChatHistory.query.filter_by(
-            user_id=user.id
-        ).order_by(ChatHistory.created_at.desc()).limit(limit).all()
+    def get_conversation_history(self, user, limit=10, before_id=None):
+        """
+        Get recent conversation history, newest first
+        
+        Args:
+            user: User model instance
+            limit: Maximum number of turns
+            before_id: Only return turns older than this chat history id (keyset cursor)
+        """
+        # Make sure buffered turns are visible before reading
+        self.history_writer.flush()
+        query = ChatHistory.query.filter_by(user_id=user.id)
+        
+        if before_id:
+            cursor_time = db.session.query(ChatHistory.created_at).filter_by(
+                id=before_id, user_id=user.id
+            ).scalar_subquery()
+            query = query.filter(or_(
+                ChatHistory.created_at < cursor_time,
+                and_(ChatHistory.created_at == cursor_time, ChatHistory.id < before_id)
+            ))
+        
+        return query.order_by(
+            ChatHistory.created_at.desc(), ChatHistory.id.desc()
+        ).limit(limit).all()
 
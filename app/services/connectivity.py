@@ -0,0 +1,94 @@
+"""
+Connectivity Monitor
+Probes internet reachability on a background thread so callers never block on it
+"""
+import atexit
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+
+class ConnectivityMonitor:
+    """
+    Periodic TCP probe with a cached result
+
+    The probe runs every interval_seconds on a daemon thread; is_online()
+    and status() only read the last result. The thread is started by the
+    first of those calls, so CLI commands, scripts and tests that never ask
+    about connectivity never probe.
+    """
+
+    def __init__(self):
+        self.host = os.getenv('CONNECTIVITY_PROBE_HOST', '8.8.8.8')
+        self.port = int(os.getenv('CONNECTIVITY_PROBE_PORT', 53))
+        self.timeout = float(os.getenv('CONNECTIVITY_PROBE_TIMEOUT', 3))
+        # 0 disables probing; the monitor then always reports offline
+        self.interval_seconds = float(os.getenv('CONNECTIVITY_PROBE_INTERVAL_SECONDS', 60))
+
+        self._online = False
+        self._checked_at = None  # datetime of the last completed probe
+        self._latency_ms = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the probe thread (no-op if already running or disabled)"""
+        if self._thread is not None or self.interval_seconds <= 0:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='connectivity-monitor', daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+
+    def is_online(self):
+        """Result of the last probe; False until the first probe completes"""
+        self.start()
+        return self._online
+
+    def status(self):
+        """Cached connectivity state for health checks"""
+        self.start()
+        checked_at = self._checked_at
+        return {
+            'online': self._online,
+            'checked_at': checked_at.isoformat() if checked_at else None,
+            'latency_ms': self._latency_ms,
+            'target': f'{self.host}:{self.port}'
+        }
+
+    def probe(self):
+        """
+        Open a TCP connection to the probe target and record the outcome
+
+        Returns:
+            True if the target was reachable
+        """
+        started = time.monotonic()
+        try:
+            with socket.create_connection((self.host, self.port), timeout=self.timeout):
+                pass
+            online = True
+        except OSError:
+            online = False
+
+        # Single attribute assignments, so readers never see a torn update
+        self._latency_ms = round((time.monotonic() - started) * 1000, 1) if online else None
+        self._online = online
+        self._checked_at = datetime.utcnow()
+        return online
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.probe()
+            self._stop.wait(self.interval_seconds)
+
+
+connectivity_monitor = ConnectivityMonitor()
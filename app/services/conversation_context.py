@@ -0,0 +1,131 @@
+"""
+Conversation Context Store
+Bounded in-memory memory of recent intents and entities per user
+"""
+import json
+import os
+import threading
+from collections import OrderedDict, deque
+from app.models import ChatHistory
+from app.services.chat_history_writer import history_writer
+
+
+class ConversationContextStore:
+    """LRU of users, each holding their last few chat turns"""
+
+    def __init__(self, max_users=None, max_turns=None):
+        self.max_users = max_users or int(os.getenv('CHAT_CONTEXT_MAX_USERS', 10000))
+        self.max_turns = max_turns or int(os.getenv('CHAT_CONTEXT_MAX_TURNS', 10))
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_turns(self, user_id):
+        """
+        Get a user's recent turns, oldest first
+
+        Loaded from ChatHistory on a miss; served from memory afterwards.
+        Each turn is a dict with 'intent' and 'entities'.
+        """
+        with self._lock:
+            turns = self._contexts.get(user_id)
+            if turns is not None:
+                self._contexts.move_to_end(user_id)
+                return list(turns)
+
+        turns = self._hydrate(user_id)
+
+        with self._lock:
+            # Another request may have hydrated or added turns meanwhile
+            if user_id not in self._contexts:
+                self._store(user_id, turns)
+            self._contexts.move_to_end(user_id)
+            return list(self._contexts[user_id])
+
+    def add_turn(self, user_id, intent, entities):
+        """
+        Remember the intent and entities of a processed message
+
+        Call before the turn itself is written to ChatHistory: a user who is
+        not in memory (never read, or evicted) is hydrated first, as in
+        get_turns, and the new turn appended to what was loaded.
+        """
+        turn = {'intent': intent, 'entities': dict(entities)}
+        with self._lock:
+            turns = self._contexts.get(user_id)
+            if turns is not None:
+                turns.append(turn)
+                self._contexts.move_to_end(user_id)
+                return
+
+        turns = self._hydrate(user_id)
+
+        with self._lock:
+            if user_id not in self._contexts:
+                self._store(user_id, turns)
+            self._contexts[user_id].append(turn)
+            self._contexts.move_to_end(user_id)
+
+    def add_committed_turns(self, user_id, turns):
+        """
+        Remember turns whose ChatHistory rows are already committed
+
+        Users not in memory are left alone: their next read hydrates these
+        turns from the database, so appending them too would repeat them.
+        """
+        with self._lock:
+            stored = self._contexts.get(user_id)
+            if stored is not None:
+                stored.extend({'intent': turn['intent'], 'entities': dict(turn['entities'])} for turn in turns)
+                self._contexts.move_to_end(user_id)
+
+    def last_entity(self, user_id, name, pending=()):
+        """
+        Most recent value of an entity in the user's conversation
+
+        Args:
+            pending: Newer turns not yet added to the store, oldest first
+        """
+        for turn in reversed(self.get_turns(user_id) + list(pending)):
+            if name in turn['entities']:
+                return turn['entities'][name]
+        return None
+
+    def last_intent(self, user_id, pending=()):
+        """Most recent intent other than small talk, including pending turns"""
+        for turn in reversed(self.get_turns(user_id) + list(pending)):
+            if turn['intent'] not in ('general', 'greeting', 'goodbye'):
+                return turn['intent']
+        return None
+
+    def forget(self, user_id):
+        with self._lock:
+            self._contexts.pop(user_id, None)
+
+    def _store(self, user_id, turns):
+        if not isinstance(turns, deque):
+            turns = deque(turns, maxlen=self.max_turns)
+        self._contexts[user_id] = turns
+        while len(self._contexts) > self.max_users:
+            self._contexts.popitem(last=False)
+        return turns
+
+    def _hydrate(self, user_id):
+        """Load the last max_turns turns from the database"""
+        history_writer.flush()
+        rows = ChatHistory.query.with_entities(
+            ChatHistory.intent, ChatHistory.entities
+        ).filter_by(
+            user_id=user_id
+        ).order_by(ChatHistory.created_at.desc()).limit(self.max_turns).all()
+
+        turns = deque(maxlen=self.max_turns)
+        for intent, entities in reversed(rows):
+            try:
+                entities = json.loads(entities) if entities else {}
+            except ValueError:
+                entities = {}
+            turns.append({'intent': intent, 'entities': entities})
+        return turns
+
+
+context_store = ConversationContextStore()
@@ -0,0 +1,67 @@
+"""
+Meal Cost Estimator
+Prices many (food, quantity) pairs at once from the catalog snapshot
+"""
+import numpy as np
+from app.services.catalog import catalog
+
+
+class CostEstimator:
+    """Vectorized cost estimation shared by price and recommendation services"""
+
+    def item_costs(self, items, location=None):
+        """
+        Cost of each (food_item_id, quantity_in_grams) pair
+
+        Foods priced per kg or per 100g scale with the quantity; foods priced
+        per piece cost one piece. Unknown or unpriced foods cost 0.
+
+        Args:
+            items: Iterable of (food_item_id, quantity_in_grams) tuples
+            location: Market to price at (defaults to Kampala)
+
+        Returns:
+            numpy array of costs in UGX, aligned with items
+        """
+        items = list(items)
+        if not items:
+            return np.zeros(0)
+
+        snapshot = catalog.snapshot()
+        if not snapshot.foods:
+            return np.zeros(len(items))
+
+        rows = np.array([snapshot.food_index.get(food_id, -1) for food_id, _ in items])
+        quantities = np.array([quantity or 0 for _, quantity in items], dtype=float)
+        known = rows >= 0
+        rows = np.where(known, rows, 0)
+
+        prices = snapshot.price_vector(location)[rows]
+        per_kg = snapshot.per_kg[rows]
+        per_piece = snapshot.per_piece[rows]
+
+        costs = np.where(per_piece, prices, prices * quantities / np.where(per_kg, 1000.0, 100.0))
+        return np.where(known & ~np.isnan(costs), costs, 0.0)
+
+    def estimate(self, items, location=None):
+        """Total cost of one meal in UGX"""
+        return float(self.item_costs(items, location).sum())
+
+    def estimate_meals(self, meals, location=None):
+        """
+        Total cost of many meals in one pass
+
+        Args:
+            meals: List of meals, each a list of (food_item_id, quantity_in_grams)
+            location: Market to price at
+
+        Returns:
+            List of totals in UGX, one per meal
+        """
+        items = [item for meal in meals for item in meal]
+        meal_index = np.repeat(np.arange(len(meals)), [len(meal) for meal in meals])
+        totals = np.bincount(meal_index, weights=self.item_costs(items, location), minlength=len(meals))
+        return [float(total) for total in totals]
+
+
+cost_estimator = CostEstimator()
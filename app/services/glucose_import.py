@@ -0,0 +1,214 @@
+"""
+Glucose Import Service
+Bulk import of CGM and glucometer exports (CSV, JSON or NDJSON)
+"""
+import codecs
+import csv
+import json
+import os
+from datetime import datetime, timezone
+from sqlalchemy import insert
+from app import db
+from app.models import DiabetesRecord
+
+# Accepted column names, first match wins
+TIME_COLUMNS = ('measurement_time', 'timestamp', 'time', 'datetime', 'date')
+LEVEL_COLUMNS = ('blood_glucose_level', 'glucose', 'value', 'reading')
+
+# mmol/L -> mg/dL
+MMOL_TO_MGDL = 18.0
+# Readings outside this range (mg/dL) are rejected as sensor or typing errors
+VALID_RANGE = (20, 600)
+# Numeric times above this are epoch milliseconds (1e11 seconds is the year 5138)
+EPOCH_MS_THRESHOLD = 1e11
+
+
+class ImportFormatError(ValueError):
+    """Upload is not in a supported format"""
+
+
+class InvalidRow(str):
+    """Stands in for a row that could not be read; the text is the reason"""
+
+
+class GlucoseImporter:
+    """Validates and inserts glucose readings in chunks"""
+
+    def __init__(self):
+        self.chunk_size = int(os.getenv('GLUCOSE_IMPORT_CHUNK_SIZE', 5000))
+        self.max_rows = int(os.getenv('GLUCOSE_IMPORT_MAX_ROWS', 500000))
+        # Invalid rows reported back in detail; the rest are only counted
+        self.max_errors = 20
+
+    def read_rows(self, stream, fmt):
+        """
+        Iterate the rows of an upload without reading it all into memory
+
+        Args:
+            stream: Binary file-like object
+            fmt: 'csv', 'ndjson' or 'json' ('json' is parsed in one go)
+
+        Yields:
+            Dicts, one per reading, or an InvalidRow for rows that cannot be parsed
+        """
+        if fmt == 'csv':
+            reader = csv.DictReader(self._decode_lines(stream))
+            while True:
+                try:
+                    row = next(reader)
+                except StopIteration:
+                    break
+                except csv.Error as e:
+                    yield InvalidRow(f'unreadable CSV row: {e}')
+                    continue
+                yield {(key or '').strip().lower(): value for key, value in row.items()}
+        elif fmt == 'ndjson':
+            for line in self._decode_lines(stream):
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        yield InvalidRow('invalid JSON')
+        elif fmt == 'json':
+            try:
+                data = json.load(stream)
+            except ValueError:
+                raise ImportFormatError('Upload is not valid JSON')
+            if isinstance(data, dict):
+                data = data.get('readings')
+            if not isinstance(data, list):
+                raise ImportFormatError("JSON upload must be a list of readings or {'readings': [...]}")
+            yield from data
+        else:
+            raise ImportFormatError(f'Unsupported format {fmt!r}; use csv, ndjson or json')
+
+    def _decode_lines(self, stream):
+        """Text lines of an upload: UTF-8, falling back to Latin-1 line by line for legacy exports"""
+        for number, line in enumerate(stream):
+            if number == 0 and line.startswith(codecs.BOM_UTF8):
+                line = line[len(codecs.BOM_UTF8):]
+            try:
+                yield line.decode('utf-8')
+            except UnicodeDecodeError:
+                yield line.decode('latin-1')
+
+    def import_readings(self, user, rows, unit='mg/dL', measurement_type='random'):
+        """
+        Validate, deduplicate and insert blood glucose readings
+
+        Rows are handled chunk_size at a time: each chunk is checked against
+        the readings already stored for its time span, then written with one
+        multi-row INSERT and committed. A reading is a duplicate when the user
+        already has a blood glucose record at the same measurement_time.
+
+        Args:
+            user: User model instance
+            rows: Iterable of dicts with a time and a glucose column
+            unit: 'mg/dL' or 'mmol/L', for rows without their own unit
+            measurement_type: Stored on rows without their own measurement_type
+
+        Returns:
+            Summary dict with received, imported, duplicates, invalid and errors
+        """
+        summary = {'received': 0, 'imported': 0, 'duplicates': 0, 'invalid': 0, 'errors': []}
+        chunk = []
+        for line, row in enumerate(rows, start=1):
+            if summary['received'] >= self.max_rows:
+                summary['truncated'] = True
+                break
+            summary['received'] += 1
+            chunk.append((line, row))
+            if len(chunk) >= self.chunk_size:
+                self._import_chunk(user, chunk, unit, measurement_type, summary)
+                chunk = []
+        if chunk:
+            self._import_chunk(user, chunk, unit, measurement_type, summary)
+        return summary
+
+    def _import_chunk(self, user, chunk, unit, measurement_type, summary):
+        readings = {}  # measurement_time -> row values
+        for line, row in chunk:
+            reading, error = self._parse_row(row, unit, measurement_type)
+            if error:
+                summary['invalid'] += 1
+                if len(summary['errors']) < self.max_errors:
+                    summary['errors'].append({'row': line, 'error': error})
+            elif reading['measurement_time'] in readings:
+                summary['duplicates'] += 1
+            else:
+                readings[reading['measurement_time']] = reading
+        if not readings:
+            return
+
+        times = list(readings)
+        existing = {measured_at for measured_at, in db.session.query(DiabetesRecord.measurement_time).filter(
+            DiabetesRecord.user_id == user.id,
+            DiabetesRecord.record_type == 'blood_glucose',
+            DiabetesRecord.measurement_time.between(min(times), max(times))
+        )}
+        new_rows = [
+            dict(reading, user_id=user.id, record_type='blood_glucose')
+            for measured_at, reading in readings.items() if measured_at not in existing
+        ]
+        summary['duplicates'] += len(readings) - len(new_rows)
+
+        if new_rows:
+            try:
+                db.session.execute(insert(DiabetesRecord), new_rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            summary['imported'] += len(new_rows)
+
+    def _parse_row(self, row, unit, measurement_type):
+        """Returns (reading dict, None) or (None, error message)"""
+        if isinstance(row, InvalidRow):
+            return None, str(row)
+        if not isinstance(row, dict):
+            return None, 'not an object'
+        raw_time = next((row[key] for key in TIME_COLUMNS if row.get(key) not in (None, '')), None)
+        raw_level = next((row[key] for key in LEVEL_COLUMNS if row.get(key) not in (None, '')), None)
+
+        measured_at = self._parse_time(raw_time)
+        if measured_at is None:
+            return None, 'missing or invalid time'
+        try:
+            level = float(raw_level)
+        except (TypeError, ValueError):
+            return None, 'missing or invalid glucose value'
+
+        row_unit = str(row.get('unit') or unit).replace(' ', '').lower()
+        if row_unit in ('mmol/l', 'mmol'):
+            level *= MMOL_TO_MGDL
+        elif row_unit not in ('mg/dl', 'mg'):
+            return None, f'unknown unit {row_unit}'
+        if not VALID_RANGE[0] <= level <= VALID_RANGE[1]:
+            return None, f'glucose {level:.0f} mg/dL out of range'
+
+        return {
+            'measurement_time': measured_at,
+            'blood_glucose_level': round(level, 1),
+            'measurement_type': str(row.get('measurement_type') or measurement_type)[:20]
+        }, None
+
+    def _parse_time(self, value):
+        """ISO 8601 or Unix epoch seconds or milliseconds, as naive UTC"""
+        if value in (None, '') or isinstance(value, bool):
+            return None
+        try:
+            if isinstance(value, (int, float)) or str(value).strip().replace('.', '', 1).isdigit():
+                seconds = float(value)
+                if seconds > EPOCH_MS_THRESHOLD:
+                    seconds /= 1000
+                return datetime.fromtimestamp(seconds, tz=timezone.utc).replace(tzinfo=None)
+            parsed = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+        except (ValueError, OverflowError, OSError):
+            return None
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+
+
+glucose_importer = GlucoseImporter()
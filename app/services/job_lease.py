@@ -0,0 +1,65 @@
+"""
+Job Leases
+Database-backed locks so only one process runs a job at a time
+"""
+import os
+import socket
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, or_, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import JobLease
+
+
+class JobLeaseStore:
+    """
+    Expiring named leases in the job_leases table
+
+    Each call runs in its own short transaction on a separate connection, so
+    it never commits or rolls back the caller's session. A holder that dies
+    loses the lease once it expires.
+    """
+
+    def __init__(self):
+        self.lease_seconds = float(os.getenv('JOB_LEASE_SECONDS', 300))
+
+    def owner_id(self, job_id):
+        return f"{socket.gethostname()}:{os.getpid()}:{job_id}"
+
+    def acquire(self, name, owner):
+        """
+        Take the lease on name if it is free, expired or already ours
+
+        Returns:
+            True if owner now holds the lease
+        """
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(insert(JobLease).values(name=name, owner=owner, expires_at=expires_at))
+            return True
+        except IntegrityError:
+            pass
+
+        with db.engine.begin() as connection:
+            taken = connection.execute(update(JobLease).where(
+                JobLease.name == name,
+                or_(JobLease.expires_at < now, JobLease.owner == owner)
+            ).values(owner=owner, expires_at=expires_at))
+        return taken.rowcount == 1
+
+    def renew(self, name, owner):
+        """Extend a held lease; returns False if it expired and someone else took it"""
+        with db.engine.begin() as connection:
+            renewed = connection.execute(update(JobLease).where(
+                JobLease.name == name, JobLease.owner == owner
+            ).values(expires_at=datetime.utcnow() + timedelta(seconds=self.lease_seconds)))
+        return renewed.rowcount == 1
+
+    def release(self, name, owner):
+        with db.engine.begin() as connection:
+            connection.execute(delete(JobLease).where(JobLease.name == name, JobLease.owner == owner))
+
+
+job_leases = JobLeaseStore()
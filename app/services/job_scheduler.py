@@ -0,0 +1,245 @@
+"""
+Background Job Scheduler
+Runs long maintenance work (price refreshes, archiving) off the request threads
+"""
+import atexit
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+class Job:
+    """One run of a named job, with status and progress for polling"""
+
+    def __init__(self, name, queue='default'):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.queue = queue
+        self.status = 'queued'  # 'queued', 'running', 'succeeded', 'failed', 'skipped'
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+
+    def set_progress(self, done, total=None):
+        """Report progress; jobs call this as they work through their items"""
+        self.done = done
+        if total is not None:
+            self.total = total
+
+    @property
+    def finished(self):
+        return self.status in ('succeeded', 'failed', 'skipped')
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'name': self.name,
+            'queue': self.queue,
+            'status': self.status,
+            'progress': {
+                'done': self.done,
+                'total': self.total,
+                'percent': round(100.0 * self.done / self.total, 1) if self.total else None
+            },
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class JobScheduler:
+    """
+    Thread pool for on-demand jobs plus a timer for periodic ones
+
+    At most one run of each job name is queued or running at a time;
+    submitting a name that is already active returns the active run. That
+    only holds within this process: jobs submitted with lease=True also
+    take a database lease on their name (see JobLeaseStore) and are skipped
+    while another process, such as `flask price-worker`, holds it.
+
+    Each queue has its own worker threads and job history, so a burst of
+    per-user offline cache rebuilds neither delays price refreshes nor
+    pushes them out of the history that /api/jobs/<id> polls.
+    """
+
+    def __init__(self):
+        self.app = None
+        # Queue name -> (worker threads, finished jobs kept for polling)
+        self.queues = {
+            'default': (int(os.getenv('JOB_WORKERS', 2)), int(os.getenv('JOB_HISTORY_SIZE', 200))),
+            'offline_cache': (int(os.getenv('OFFLINE_CACHE_WORKERS', 1)),
+                              int(os.getenv('OFFLINE_CACHE_HISTORY_SIZE', 200)))
+        }
+
+        self._jobs = {queue: OrderedDict() for queue in self.queues}  # queue -> job id -> Job
+        self._active = {}  # job name -> Job
+        self._periodic = {}  # job name -> (func, interval_seconds, lease, kwargs)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._executors = {}  # queue -> ThreadPoolExecutor
+        self._timer = None
+
+    def init_app(self, app):
+        """Bind the scheduler to an app and start its worker threads"""
+        self.app = app
+        if not self._executors:
+            self._executors = {
+                queue: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'job-{queue}')
+                for queue, (workers, _) in self.queues.items()
+            }
+            atexit.register(self.shutdown)
+
+    def submit(self, name, func, lease=False, queue='default', **kwargs):
+        """
+        Queue func to run in the background
+
+        Args:
+            name: Job name; also the overlap lock
+            func: Callable taking the Job as first argument plus kwargs
+            lease: Also hold a cross-process database lease while running
+            queue: Worker queue to run on (a key of self.queues)
+            kwargs: Passed through to func
+
+        Returns:
+            Tuple of (job, created) - created is False if a run was already active
+        """
+        with self._lock:
+            active = self._active.get(name)
+            if active is not None:
+                return active, False
+
+            job = Job(name, queue)
+            self._active[name] = job
+            history = self._jobs[queue]
+            history[job.id] = job
+            while len(history) > self.queues[queue][1]:
+                oldest_id = next(iter(history))
+                if not history[oldest_id].finished:
+                    break
+                history.pop(oldest_id)
+            executor = self._executors.get(queue)
+
+        if executor is None:
+            # Not started (e.g. scripts) - run inline
+            self._run(job, func, kwargs, lease)
+        else:
+            executor.submit(self._run, job, func, kwargs, lease)
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            for history in self._jobs.values():
+                if job_id in history:
+                    return history[job_id]
+            return None
+
+    def active(self, name):
+        """The queued or running job with this name, if any"""
+        with self._lock:
+            return self._active.get(name)
+
+    def schedule(self, name, func, interval_seconds, lease=False, **kwargs):
+        """Submit func every interval_seconds (skipped while a run is active)"""
+        with self._lock:
+            self._periodic[name] = (func, interval_seconds, lease, kwargs)
+            start_timer = self._timer is None
+            if start_timer:
+                self._timer = threading.Thread(target=self._run_periodic, name='job-timer', daemon=True)
+        if start_timer:
+            self._timer.start()
+
+    def shutdown(self):
+        """Stop scheduling and wait for running jobs to finish"""
+        self._stop.set()
+        executors, self._executors = self._executors, {}
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+
+    def _run(self, job, func, kwargs, lease=False):
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        try:
+            if self.app is None:
+                self._call(job, func, kwargs, lease)
+            else:
+                with self.app.app_context():
+                    self._call(job, func, kwargs, lease)
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+            print(f"Job {job.name} ({job.id}) failed: {str(e)}")
+            traceback.print_exc()
+        finally:
+            job.finished_at = datetime.utcnow()
+            with self._lock:
+                if self._active.get(job.name) is job:
+                    del self._active[job.name]
+
+    def _call(self, job, func, kwargs, lease):
+        """Run func, inside a database lease on the job name if requested"""
+        if not lease:
+            job.result = func(job, **kwargs)
+            job.status = 'succeeded'
+            return
+
+        from app.services.job_lease import job_leases
+        owner = job_leases.owner_id(job.id)
+        if not job_leases.acquire(job.name, owner):
+            job.result = {'skipped': 'already running in another process'}
+            job.status = 'skipped'
+            return
+
+        # Keep the lease while the job runs; it lapses on its own if this process dies
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._renew_lease, args=(job.name, owner, stop),
+                                     name=f'lease-{job.name}', daemon=True)
+        heartbeat.start()
+        try:
+            job.result = func(job, **kwargs)
+            job.status = 'succeeded'
+        finally:
+            stop.set()
+            heartbeat.join()
+            job_leases.release(job.name, owner)
+
+    def _renew_lease(self, name, owner, stop):
+        from app.services.job_lease import job_leases
+        while not stop.wait(job_leases.lease_seconds / 3):
+            try:
+                if self.app is None:
+                    renewed = job_leases.renew(name, owner)
+                else:
+                    with self.app.app_context():
+                        renewed = job_leases.renew(name, owner)
+                if not renewed:
+                    print(f"Job {name} lost its lease to another process")
+            except Exception as e:
+                print(f"Error renewing lease for job {name}: {str(e)}")
+
+    def _run_periodic(self):
+        """Timer loop: submit each periodic job once its interval has elapsed"""
+        next_run = {}
+        while not self._stop.is_set():
+            now = time.monotonic()
+            with self._lock:
+                periodic = dict(self._periodic)
+            for name, (func, interval, lease, kwargs) in periodic.items():
+                due = next_run.setdefault(name, now + interval)
+                if now >= due:
+                    next_run[name] = now + interval
+                    self.submit(name, func, lease=lease, **kwargs)
+            self._stop.wait(1.0)
+
+
+job_scheduler = JobScheduler()
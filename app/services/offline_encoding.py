@@ -0,0 +1,131 @@
+"""
+Offline Payload Encoding
+Compact serialization and compression for offline data sent to slow links
+"""
+import gzip
+import json
+import zlib
+
+# Optional encoders - compact JSON with gzip is always available
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+JSON_TYPE = 'application/json'
+MSGPACK_TYPE = 'application/msgpack'
+
+# File suffixes for each (media type, content encoding) variant
+SUFFIXES = {JSON_TYPE: '.json', MSGPACK_TYPE: '.msgpack'}
+ENCODING_SUFFIXES = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+
+
+def media_types():
+    return [JSON_TYPE, MSGPACK_TYPE] if MSGPACK_AVAILABLE else [JSON_TYPE]
+
+
+def content_encodings():
+    return ['br', 'gzip'] if BROTLI_AVAILABLE else ['gzip']
+
+
+def negotiate(request):
+    """
+    Pick the media type and content encoding for a request
+
+    JSON stays the default; msgpack is only used when the client lists it
+    ahead of JSON in Accept. Compression follows Accept-Encoding.
+
+    Returns:
+        Tuple of (media type, content encoding)
+    """
+    media_type = request.accept_mimetypes.best_match(media_types(), default=JSON_TYPE)
+    if media_type != MSGPACK_TYPE or request.accept_mimetypes[MSGPACK_TYPE] <= request.accept_mimetypes[JSON_TYPE]:
+        media_type = JSON_TYPE
+    encoding = request.accept_encodings.best_match(content_encodings(), default='identity')
+    return media_type, encoding
+
+
+def variant_etag(etag, media_type, encoding):
+    """Strong ETag for one representation; plain JSON keeps the base ETag"""
+    if (media_type, encoding) == (JSON_TYPE, 'identity'):
+        return etag
+    return f"{etag}-{SUFFIXES[media_type][1:]}-{encoding}"
+
+
+def dumps(data, media_type=JSON_TYPE):
+    """Serialize without whitespace"""
+    if media_type == MSGPACK_TYPE:
+        return msgpack.packb(data, use_bin_type=True)
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def compress(body, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return body
+
+
+class StreamCompressor:
+    """Incremental gzip/brotli/identity compressor for streamed writes"""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'gzip':
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        elif encoding == 'br':
+            self._compressor = brotli.Compressor(quality=5)
+        else:
+            self._compressor = None
+
+    def compress(self, chunk):
+        if self._compressor is None:
+            return chunk
+        if self.encoding == 'br':
+            return self._compressor.process(chunk)
+        return self._compressor.compress(chunk)
+
+    def flush(self):
+        if self._compressor is None:
+            return b''
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def encode_items(header, items_key, items, media_type=JSON_TYPE, count=None):
+    """
+    Serialize {**header, items_key: [...items]} chunk by chunk
+
+    Lets large lists be written without first building one big string.
+    msgpack needs the item count up front; pass count when items is a generator.
+
+    Yields:
+        bytes chunks whose concatenation is the full document
+    """
+    if media_type == MSGPACK_TYPE:
+        packer = msgpack.Packer(use_bin_type=True)
+        if count is None:
+            items = list(items)
+            count = len(items)
+        yield packer.pack_map_header(len(header) + 1)
+        for key, value in header.items():
+            yield packer.pack(key) + packer.pack(value)
+        yield packer.pack(items_key) + packer.pack_array_header(count)
+        for item in items:
+            yield packer.pack(item)
+        return
+
+    prefix = json.dumps(header, separators=(',', ':'))[:-1]
+    yield (prefix + (',' if header else '') + json.dumps(items_key) + ':[').encode('utf-8')
+    for index, item in enumerate(items):
+        yield ((',' if index else '') + json.dumps(item, separators=(',', ':'))).encode('utf-8')
+    yield b']}'
@@ -2,28 +2,86 @@
 Offline Mode Manager
 Handles offline functionality and data synchronization
 """
+import glob
+import hashlib
 import json
 import os
-from datetime import datetime
+import threading
+from datetime import datetime, timezone
+from sqlalchemy import or_, and_, func, insert
+from sqlalchemy.exc import IntegrityError
 from app import db
-from app.models import User, FoodItem, Recommendation, FoodLog, Goal
+from app.models import (User, Recommendation, FoodLog, Goal, GoalProgress, DiabetesRecord, MarketPrice,
+                        OfflineOperation)
+from app.services.catalog import catalog
+from app.services import offline_encoding
+from app.services.connectivity import connectivity_monitor
+from app.services.job_scheduler import job_scheduler
+
+# Food fields shipped to offline clients (same as FoodItem.to_dict)
+CATALOG_FIELDS = (
+    'id', 'name', 'local_name', 'category', 'description', 'calories', 'protein',
+    'carbohydrates', 'fiber', 'fat', 'sugar', 'glycemic_index', 'current_price',
+    'price_unit', 'diabetes_friendly'
+)
+
+# Replayable offline operation type -> apply_offline_changes payload key
+REPLAY_TYPES = {
+    'food_log': 'food_logs',
+    'diabetes_record': 'diabetes_records',
+    'goal_progress': 'goal_progress'
+}
 
 class OfflineManager:
     """Manages offline mode and data synchronization"""
     
     def __init__(self):
         self.cache_dir = 'offline_cache'
-        os.makedirs(self.cache_dir, exist_ok=True)
+        self.catalog_dir = os.path.abspath(os.path.join(self.cache_dir, 'catalog'))
+        # Catalog files kept on disk for clients still holding an older id
+        self.catalog_keep = int(os.getenv('OFFLINE_CATALOG_KEEP', 5))
+        os.makedirs(self.catalog_dir, exist_ok=True)
+        
+        self._catalog_file = None  # (catalog version, catalog id, path)
+        self._catalog_lock = threading.Lock()
+        self._cache_etags = {}  # user id -> (file mtime_ns, size, etag)
+        # Users whose caches a price change made stale, rebuilt by the next refresh job
+        self._stale_caches = set()
+        self._stale_lock = threading.Lock()
+        self._refresh_job = None
+        # Replayed operations applied per transaction
+        self.replay_chunk_size = int(os.getenv('OFFLINE_REPLAY_CHUNK_SIZE', 500))
+        self._cache_lock = threading.Lock()
     
     def enable_offline_mode(self, user):
-        """Enable offline mode for user and cache essential data"""
+        """
+        Enable offline mode for user and build their cache in the background
+        
+        Returns:
+            The Job building the cache file
+        """
         user.offline_mode_enabled = True
         user.last_sync = datetime.utcnow()
         db.session.commit()
         
-        # Cache essential data
-        self._cache_user_data(user)
-        return True
+        # A cache left from an earlier enable is stale; clients get 202 until the rebuild lands
+        self._discard_cache(user.id)
+        
+        # Cache essential data off the request thread
+        job, _ = job_scheduler.submit(f'offline_cache:{user.id}', self._build_cache_job,
+                                      queue='offline_cache', user_id=user.id)
+        return job
+    
+    def cache_job(self, user_id):
+        """The queued or running cache build for a user, if any"""
+        return job_scheduler.active(f'offline_cache:{user_id}')
+    
+    def _build_cache_job(self, job, user_id):
+        user = db.session.get(User, user_id)
+        if user is None or not user.offline_mode_enabled:
+            return {'cached': False}
+        etag = self._cache_user_data(user)
+        return {'cached': True, 'etag': etag}
     
     def disable_offline_mode(self, user):
         """Disable offline mode and sync data"""
@@ -35,69 +93,711 @@ class OfflineManager:
         db.session.commit()
         return True
     
+    def get_catalog_file(self):
+        """
+        Shared catalog snapshot file for the current catalog version
+        
+        The file is named by a hash of its food data, so every user shares one
+        copy and an unchanged catalog keeps its id across version bumps.
+        Compressed and msgpack variants are written next to it.
+        
+        Returns:
+            Tuple of (catalog_id, path of the plain JSON file)
+        """
+        snapshot = catalog.snapshot()
+        current = self._catalog_file
+        if current and current[0] == snapshot.version:
+            return current[1], current[2]
+        
+        with self._catalog_lock:
+            current = self._catalog_file
+            if current and current[0] == snapshot.version:
+                return current[1], current[2]
+            
+            foods = [food for food in snapshot.foods if food.is_affordable]
+            
+            # Hash one food at a time instead of building the whole document
+            digest = hashlib.sha256(b'[')
+            for index, food in enumerate(foods):
+                item = json.dumps(self._catalog_item(food), sort_keys=True, separators=(',', ':'))
+                digest.update(((',' if index else '') + item).encode('utf-8'))
+            digest.update(b']')
+            catalog_id = digest.hexdigest()[:32]
+            path = self.catalog_path(catalog_id)
+            
+            if not os.path.exists(path):
+                self._write_catalog_files(catalog_id, foods)
+                self._prune_catalog_files(keep=catalog_id)
+            
+            self._catalog_file = (snapshot.version, catalog_id, path)
+            return catalog_id, path
+    
+    def _catalog_item(self, food):
+        return {field: getattr(food, field) for field in CATALOG_FIELDS}
+    
+    def _write_catalog_files(self, catalog_id, foods):
+        """Stream the catalog into every media type / encoding variant, then move them into place"""
+        header = {'catalog_id': catalog_id}
+        written = []
+        for media_type in offline_encoding.media_types():
+            outputs = []
+            for encoding in ['identity'] + offline_encoding.content_encodings():
+                path = self.catalog_path(catalog_id, media_type, encoding)
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                outputs.append((path, tmp_path, open(tmp_path, 'wb'), offline_encoding.StreamCompressor(encoding)))
+            
+            try:
+                chunks = offline_encoding.encode_items(
+                    header, 'food_items', (self._catalog_item(food) for food in foods),
+                    media_type=media_type, count=len(foods)
+                )
+                for chunk in chunks:
+                    for _, _, f, compressor in outputs:
+                        f.write(compressor.compress(chunk))
+                for _, _, f, compressor in outputs:
+                    f.write(compressor.flush())
+            finally:
+                for _, _, f, _ in outputs:
+                    f.close()
+            written += [(path, tmp_path) for path, tmp_path, _, _ in outputs]
+        
+        # Plain JSON goes last, after every other variant: its presence marks the set as complete
+        plain_path = self.catalog_path(catalog_id)
+        for path, tmp_path in sorted(written, key=lambda output: output[0] == plain_path):
+            os.replace(tmp_path, path)
+    
+    def catalog_path(self, catalog_id, media_type=offline_encoding.JSON_TYPE, encoding='identity'):
+        """Path of a catalog snapshot file variant (which may no longer exist)"""
+        suffix = offline_encoding.SUFFIXES[media_type] + offline_encoding.ENCODING_SUFFIXES[encoding]
+        return os.path.join(self.catalog_dir, f'catalog-{catalog_id}{suffix}')
+    
+    def _prune_catalog_files(self, keep):
+        paths = sorted(glob.glob(os.path.join(self.catalog_dir, 'catalog-*.json')), key=os.path.getmtime)
+        for path in paths[:-self.catalog_keep]:
+            catalog_id = os.path.basename(path)[len('catalog-'):-len('.json')]
+            if catalog_id != keep:
+                for variant in glob.glob(os.path.join(self.catalog_dir, f'catalog-{catalog_id}.*')):
+                    os.remove(variant)
+    
     def _cache_user_data(self, user):
-        """Cache user's essential data for offline access"""
+        """
+        Cache user's essential data for offline access
+        
+        Foods live in the shared catalog file; the current catalog_id is
+        added when the cache is served, so catalog changes alone never
+        require rebuilding per-user caches.
+        """
         cache_data = {
             'user': user.to_dict(),
-            'food_items': [],
             'recommendations': [],
             'goals': [],
             'cached_at': datetime.utcnow().isoformat()
         }
         
-        # Cache all food items (essential for recommendations)
-        foods = FoodItem.query.filter_by(is_affordable=True).all()
-        cache_data['food_items'] = [food.to_dict() for food in foods]
-        
-        # Cache user's recent recommendations
+        # Cache user's recent recommendations, referencing catalog foods by id
         recommendations = Recommendation.query.filter_by(
             user_id=user.id
         ).order_by(Recommendation.created_at.desc()).limit(50).all()
-        cache_data['recommendations'] = [rec.to_dict() for rec in recommendations]
+        cache_data['recommendations'] = [self._recommendation_dict(rec) for rec in recommendations]
         
         # Cache user's goals
         goals = Goal.query.filter_by(user_id=user.id, status='active').all()
         cache_data['goals'] = [goal.to_dict() for goal in goals]
         
-        # Save to file
-        cache_file = os.path.join(self.cache_dir, f'user_{user.id}.json')
-        with open(cache_file, 'w') as f:
-            json.dump(cache_data, f, indent=2)
+        return self._save_cached_data(user.id, cache_data)
+    
+    def _recommendation_dict(self, recommendation):
+        """Recommendation.to_dict without the embedded food (clients have the catalog)"""
+        return {
+            'id': recommendation.id,
+            'food_item_id': recommendation.food_item_id,
+            'recommendation_type': recommendation.recommendation_type,
+            'confidence_score': recommendation.confidence_score,
+            'reasoning': recommendation.reasoning,
+            'meal_suggestion': recommendation.meal_suggestion,
+            'serving_size': recommendation.serving_size,
+            'estimated_cost': recommendation.estimated_cost
+        }
+    
+    def on_price_change(self, event):
+        """
+        Price change subscriber: rebuild the offline caches the change affects
+        
+        Runs only in the process that made the change (after
+        update_recommendation_costs has re-priced their recommendations), so
+        each cache is rebuilt once, off the price refresh job. The only
+        prices in a user's cache are their recommendations' costs, so only
+        users with a recommendation for a changed food are marked stale.
+        They are rebuilt by one job per change, and a change that finds a
+        refresh job still queued leaves its users to that job.
+        """
+        if not event.local:
+            return
+        query = db.session.query(User.id).filter(User.offline_mode_enabled.is_(True))
+        if event.food_ids is not None:
+            query = query.filter(User.id.in_(
+                db.session.query(Recommendation.user_id).filter(Recommendation.food_item_id.in_(sorted(event.food_ids)))
+            ))
+        user_ids = [user_id for user_id, in query if os.path.exists(self._cache_file(user_id))]
+        if not user_ids:
+            return
+        
+        with self._stale_lock:
+            self._stale_caches.update(user_ids)
+            queued = self._refresh_job is not None and self._refresh_job.status == 'queued'
+        if not queued:
+            self._refresh_job, _ = job_scheduler.submit(
+                f'offline_cache_refresh:{event.version}', self._refresh_caches_job, queue='offline_cache'
+            )
+    
+    def _refresh_caches_job(self, job):
+        """Rebuild every cache marked stale so far; later runs find the set drained"""
+        with self._stale_lock:
+            user_ids, self._stale_caches = sorted(self._stale_caches), set()
+        
+        failed = 0
+        for done, user_id in enumerate(user_ids):
+            job.set_progress(done, len(user_ids))
+            try:
+                self._build_cache_job(job, user_id)
+            except Exception as e:
+                db.session.rollback()
+                failed += 1
+                print(f"Error rebuilding offline cache for user {user_id}: {str(e)}")
+        job.set_progress(len(user_ids), len(user_ids))
+        return {'rebuilt': len(user_ids) - failed, 'failed': failed}
+    
+    def _save_cached_data(self, user_id, cache_data):
+        """
+        Write a user's cache file as compact JSON
+        
+        Returns:
+            Strong ETag of the new cache version
+        """
+        body = json.dumps(cache_data, separators=(',', ':')).encode('utf-8')
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        cache_file = self._cache_file(user_id)
+        tmp_path = f'{cache_file}.{threading.get_ident()}.tmp'
+        
+        with self._cache_lock:
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, cache_file)
+            stat = os.stat(cache_file)
+            self._cache_etags[user_id] = (stat.st_mtime_ns, stat.st_size, etag)
+        return etag
+    
+    def _discard_cache(self, user_id):
+        """Remove a user's cache file and forget its ETag"""
+        with self._cache_lock:
+            self._cache_etags.pop(user_id, None)
+            try:
+                os.remove(self._cache_file(user_id))
+            except FileNotFoundError:
+                pass
+    
+    def _cache_file(self, user_id):
+        return os.path.join(self.cache_dir, f'user_{user_id}.json')
+    
+    def cache_etag(self, user_id):
+        """
+        ETag of a user's current cache file without reading it
+        
+        Falls back to hashing the file once if it was written by another
+        process (or before a restart).
+        
+        Returns:
+            ETag string, or None if there is no cache file
+        """
+        try:
+            stat = os.stat(self._cache_file(user_id))
+        except OSError:
+            return None
+        
+        known = self._cache_etags.get(user_id)
+        if known and known[:2] == (stat.st_mtime_ns, stat.st_size):
+            return known[2]
+        
+        with open(self._cache_file(user_id), 'rb') as f:
+            etag = hashlib.sha256(f.read()).hexdigest()[:32]
+        self._cache_etags[user_id] = (stat.st_mtime_ns, stat.st_size, etag)
+        return etag
+    
+    def data_etag(self, user_id):
+        """
+        ETag of the offline data served to a user: their cache file plus the current catalog id
+        
+        Returns:
+            ETag string, or None if there is no cache file
+        """
+        cache_etag = self.cache_etag(user_id)
+        if cache_etag is None:
+            return None
+        catalog_id, _ = self.get_catalog_file()
+        return hashlib.sha256(f'{cache_etag}:{catalog_id}'.encode('utf-8')).hexdigest()[:32]
     
     def load_cached_data(self, user_id):
-        """Load cached data for offline access"""
-        cache_file = os.path.join(self.cache_dir, f'user_{user_id}.json')
+        """Load cached data for offline access, with the current catalog id"""
+        cache_file = self._cache_file(user_id)
         
         if not os.path.exists(cache_file):
             return None
         
         try:
             with open(cache_file, 'r') as f:
-                return json.load(f)
+                data = json.load(f)
         except:
             return None
+        # Foods live in the shared catalog file, fetched once per catalog id
+        data['catalog_id'], _ = self.get_catalog_file()
+        return data
     
     def sync_offline_data(self, user):
         """Sync offline changes back to server"""
-        # This would sync any changes made while offline
-        # For now, we'll just update the sync timestamp
+        # Clients upload their changes through apply_offline_changes and pull
+        # server changes through get_changes; here we only mark the sync
         user.last_sync = datetime.utcnow()
         db.session.commit()
+    
+    def get_changes(self, user, since=None):
+        """
+        Server-side changes for an offline client since its last sync
+        
+        Args:
+            user: User model instance
+            since: server_time returned by the client's previous sync (None for everything)
+        
+        Returns:
+            Dict with changed food_items, prices at the user's market,
+            recommendations and goals, plus the server_time to send next time
+        """
+        server_time = datetime.utcnow()
+        catalog_id, _ = self.get_catalog_file()
+        snapshot = catalog.snapshot()
+        changes = {
+            'since': since.isoformat() if since else None,
+            'server_time': server_time.isoformat(),
+            'catalog_id': catalog_id,
+            'full': since is None
+        }
+        
+        if since is None:
+            # First sync: foods come from the catalog file
+            changed_foods = []
+            recommendations = Recommendation.query.filter_by(
+                user_id=user.id
+            ).order_by(Recommendation.created_at.desc()).limit(50).all()
+            goals = Goal.query.filter_by(user_id=user.id, status='active').all()
+            prices = MarketPrice.query.filter_by(location=user.location).all() if user.location else []
+        else:
+            changed_foods = [
+                food for food in snapshot.foods
+                if food.updated_at is not None and food.updated_at >= since
+            ]
+            changed_food_ids = [food.id for food in changed_foods]
+            # New recommendations, and pending ones whose food was re-priced
+            recent_or_repriced = Recommendation.created_at >= since
+            if changed_food_ids:
+                recent_or_repriced = or_(recent_or_repriced, and_(
+                    Recommendation.is_accepted.is_(None),
+                    Recommendation.food_item_id.in_(changed_food_ids)
+                ))
+            recommendations = Recommendation.query.filter(
+                Recommendation.user_id == user.id, recent_or_repriced
+            ).all()
+            goals = Goal.query.filter(Goal.user_id == user.id, Goal.updated_at >= since).all()
+            prices = MarketPrice.query.filter(
+                MarketPrice.location == user.location,
+                MarketPrice.updated_at >= since
+            ).all() if user.location else []
         
-        # In a full implementation, this would:
-        # 1. Read offline changes from local storage
-        # 2. Apply them to the database
-        # 3. Handle conflicts
-        # 4. Update cache
+        changes['food_items'] = [
+            dict({field: getattr(food, field) for field in CATALOG_FIELDS}, is_affordable=food.is_affordable)
+            for food in changed_foods
+        ]
+        changes['prices'] = [
+            {'food_item_id': price.food_item_id, 'location': price.location, 'price': price.price}
+            for price in prices
+        ]
+        changes['recommendations'] = [self._recommendation_dict(rec) for rec in recommendations]
+        changes['goals'] = [dict(goal.to_dict(), updated_at=goal.updated_at.isoformat()) for goal in goals]
+        return changes
     
-    def is_online(self):
-        """Check if system has internet connectivity"""
+    def apply_offline_changes(self, user, payload):
+        """
+        Apply records created offline in a single transaction
+        
+        Each uploaded item carries a client_id. Items that would duplicate
+        server data, reference unknown foods or goals, or update a goal that
+        changed on the server since the client's copy are reported as
+        conflicts and skipped; everything else is applied together.
+        
+        Args:
+            user: User model instance
+            payload: Dict with optional 'food_logs', 'diabetes_records' and
+                'goal_progress' lists
+        
+        Returns:
+            Dict with 'applied' (client_id -> server id per type) and 'conflicts'
+        """
+        result = {'applied': {'food_logs': {}, 'diabetes_records': {}, 'goal_progress': {}}, 'conflicts': []}
+        
+        def conflict(kind, item, reason, **extra):
+            client_id = item.get('client_id') if isinstance(item, dict) else None
+            result['conflicts'].append(dict({'type': kind, 'client_id': client_id, 'reason': reason}, **extra))
+        
+        def items(kind):
+            valid = []
+            for item in payload.get(kind) or []:
+                if isinstance(item, dict):
+                    valid.append(item)
+                else:
+                    conflict(kind, item, 'invalid')
+            return valid
+        
         try:
-            import socket
-            socket.create_connection(("8.8.8.8", 53), timeout=3)
-            return True
-        except OSError:
-            return False
+            food_logs = self._prepare_food_logs(user, items('food_logs'), conflict)
+            records = self._prepare_diabetes_records(user, items('diabetes_records'), conflict)
+            progress = self._prepare_goal_progress(user, items('goal_progress'), conflict)
+            
+            new_rows = food_logs + records + progress
+            db.session.add_all([row for _, _, row in new_rows])
+            user.last_sync = datetime.utcnow()
+            db.session.flush()
+            for kind, client_id, row in new_rows:
+                result['applied'][kind][str(client_id)] = row.id
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        
+        return result
+    
+    def replay_operations(self, user, operations, chunk_size=None):
+        """
+        Replay writes queued by an offline client, each with an idempotency key
+        
+        Keys that were replayed before return their stored result without
+        writing again. New operations are applied chunk_size at a time, one
+        transaction per chunk, together with an OfflineOperation row recording
+        each outcome; the unique (user_id, idempotency_key) index catches
+        concurrent replays of the same queue. If a chunk fails it is retried
+        one operation at a time, and operations that still fail come back as
+        'failed' without a stored outcome, so the client can send them again.
+        
+        Args:
+            user: User model instance
+            operations: List of {'key', 'type', 'data'} dicts; type is
+                'food_log', 'diabetes_record' or 'goal_progress' and data has
+                the same fields as the apply_offline_changes items
+            chunk_size: Operations per transaction (default OFFLINE_REPLAY_CHUNK_SIZE)
+        
+        Returns:
+            List of per-operation results in request order, each with key, type,
+            status ('applied', 'conflict', 'invalid' or 'failed'), id, reason and replayed
+        """
+        chunk_size = chunk_size or self.replay_chunk_size
+        results = [None] * len(operations)
+        first_index = {}  # key -> index of its first occurrence
+        pending = []  # (index, key, type, data)
+        
+        for index, op in enumerate(operations):
+            op = op if isinstance(op, dict) else {}
+            key, op_type, data = op.get('key'), op.get('type'), op.get('data')
+            if not isinstance(key, str) or not key or len(key) > 64:
+                reason = 'invalid_key'
+            elif op_type not in REPLAY_TYPES:
+                reason = 'unknown_type'
+            elif not isinstance(data, dict):
+                reason = 'invalid'
+            else:
+                reason = None
+            
+            if reason:
+                results[index] = {'key': key if isinstance(key, str) else None, 'type': op_type,
+                                  'status': 'invalid', 'id': None, 'reason': reason, 'replayed': False}
+            elif key not in first_index:
+                first_index[key] = index
+                pending.append((index, key, op_type, data))
+        
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            stored = self._stored_operations(user, [key for _, key, _, _ in chunk])
+            new_ops = [op for op in chunk if op[1] not in stored]
+            if new_ops:
+                try:
+                    stored.update(self._replay_chunk(user, new_ops))
+                except Exception:
+                    # Another request replayed some of these keys first, or one
+                    # operation is broken; retry the rest one at a time
+                    stored.update(self._stored_operations(user, [key for _, key, _, _ in new_ops]))
+                    for op in new_ops:
+                        if op[1] not in stored:
+                            stored[op[1]] = self._replay_one(user, op)
+            
+            for index, key, _, _ in chunk:
+                results[index] = stored[key]
+        
+        # Repeated keys within the request share the first occurrence's result
+        for index, op in enumerate(operations):
+            if results[index] is None:
+                results[index] = dict(results[first_index[op['key']]], replayed=True)
+        return results
+    
+    def _replay_one(self, user, op):
+        """Replay a single operation; returns its result, 'failed' if it raises"""
+        _, key, op_type, _ = op
+        try:
+            return self._replay_chunk(user, [op])[key]
+        except IntegrityError:
+            stored = self._stored_operations(user, [key])
+            if key in stored:
+                return stored[key]
+            error = 'integrity error'
+        except Exception as e:
+            error = str(e)
+        print(f"Error replaying offline operation {key} for user {user.id}: {error}")
+        return {'key': key, 'type': op_type, 'status': 'failed', 'id': None, 'reason': 'error', 'replayed': False}
+    
+    def _stored_operations(self, user, keys):
+        """Results already recorded for these idempotency keys"""
+        if not keys:
+            return {}
+        rows = OfflineOperation.query.filter(
+            OfflineOperation.user_id == user.id,
+            OfflineOperation.idempotency_key.in_(keys)
+        ).all()
+        return {row.idempotency_key: dict(row.to_result(), replayed=True) for row in rows}
+    
+    def _replay_chunk(self, user, chunk):
+        """Apply one chunk of new operations and record their outcomes in one transaction"""
+        outcomes = {}
+        
+        def conflict(kind, item, reason, **extra):
+            outcomes[item['client_id']] = dict({'status': 'conflict', 'id': None, 'reason': reason}, **extra)
+        
+        prepare = {
+            'food_logs': self._prepare_food_logs,
+            'diabetes_records': self._prepare_diabetes_records,
+            'goal_progress': self._prepare_goal_progress
+        }
+        try:
+            new_rows = []
+            for op_type, kind in REPLAY_TYPES.items():
+                items = [dict(data, client_id=key) for _, key, t, data in chunk if t == op_type]
+                if items:
+                    new_rows += prepare[kind](user, items, conflict)
+            
+            db.session.add_all([row for _, _, row in new_rows])
+            db.session.flush()
+            for _, key, row in new_rows:
+                outcomes[key] = {'status': 'applied', 'id': row.id, 'reason': None}
+            
+            # Outcome rows need no ids back, so they go in as one executemany
+            db.session.execute(insert(OfflineOperation), [{
+                'user_id': user.id,
+                'idempotency_key': key,
+                'operation_type': op_type,
+                'status': outcomes[key]['status'],
+                'result_id': outcomes[key]['id'],
+                'reason': outcomes[key]['reason']
+            } for _, key, op_type, _ in chunk])
+            user.last_sync = datetime.utcnow()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        
+        return {
+            key: dict(outcomes[key], key=key, type=op_type, replayed=False)
+            for _, key, op_type, _ in chunk
+        }
+    
+    def _prepare_food_logs(self, user, items, conflict):
+        snapshot = catalog.snapshot()
+        parsed = []
+        for item in items:
+            consumed_at = self.parse_time(item.get('consumed_at'))
+            try:
+                quantity = self.parse_number(item.get('quantity'))
+            except ValueError:
+                consumed_at = None
+            if consumed_at is None:
+                conflict('food_logs', item, 'invalid')
+                continue
+            if not isinstance(item.get('food_item_id'), int) or item['food_item_id'] not in snapshot.by_id:
+                conflict('food_logs', item, 'unknown_food')
+                continue
+            parsed.append((dict(item, quantity=quantity), consumed_at))
+        if not parsed:
+            return []
+        
+        times = [consumed_at for _, consumed_at in parsed]
+        existing = set(db.session.query(FoodLog.food_item_id, FoodLog.consumed_at).filter(
+            FoodLog.user_id == user.id,
+            FoodLog.consumed_at.between(min(times), max(times))
+        ))
+        
+        rows = []
+        for item, consumed_at in parsed:
+            key = (item['food_item_id'], consumed_at)
+            if key in existing:
+                conflict('food_logs', item, 'duplicate')
+                continue
+            existing.add(key)
+            rows.append(('food_logs', item.get('client_id'), FoodLog(
+                user_id=user.id,
+                food_item_id=item['food_item_id'],
+                quantity=item.get('quantity'),
+                meal_type=item.get('meal_type'),
+                consumed_at=consumed_at,
+                notes=item.get('notes')
+            )))
+        return rows
+    
+    def _prepare_diabetes_records(self, user, items, conflict):
+        parsed = []
+        for item in items:
+            recorded_at = self.parse_time(
+                item.get('measurement_time') or item.get('insulin_time') or item.get('hba1c_date') or item.get('created_at')
+            )
+            try:
+                numbers = {field: self.parse_number(item.get(field))
+                           for field in ('blood_glucose_level', 'insulin_units', 'hba1c_value')}
+            except ValueError:
+                recorded_at = None
+            if recorded_at is None or not isinstance(item.get('record_type'), str) or not item['record_type']:
+                conflict('diabetes_records', item, 'invalid')
+                continue
+            parsed.append((dict(item, **numbers), recorded_at))
+        if not parsed:
+            return []
+        
+        # A reading is identified by its type and the time it was taken
+        taken_at = func.coalesce(
+            DiabetesRecord.measurement_time, DiabetesRecord.insulin_time,
+            DiabetesRecord.hba1c_date, DiabetesRecord.created_at
+        )
+        times = [recorded_at for _, recorded_at in parsed]
+        existing = set(db.session.query(DiabetesRecord.record_type, taken_at).filter(
+            DiabetesRecord.user_id == user.id,
+            taken_at.between(min(times), max(times))
+        ))
+        
+        rows = []
+        for item, recorded_at in parsed:
+            key = (item['record_type'], recorded_at)
+            if key in existing:
+                conflict('diabetes_records', item, 'duplicate')
+                continue
+            existing.add(key)
+            rows.append(('diabetes_records', item.get('client_id'), DiabetesRecord(
+                user_id=user.id,
+                record_type=item['record_type'],
+                blood_glucose_level=item.get('blood_glucose_level'),
+                measurement_time=self.parse_time(item.get('measurement_time')),
+                measurement_type=item.get('measurement_type'),
+                insulin_type=item.get('insulin_type'),
+                insulin_units=item.get('insulin_units'),
+                insulin_time=self.parse_time(item.get('insulin_time')),
+                hba1c_value=item.get('hba1c_value'),
+                hba1c_date=self.parse_time(item.get('hba1c_date')),
+                medication_name=item.get('medication_name'),
+                medication_dose=item.get('medication_dose'),
+                notes=item.get('notes'),
+                created_at=self.parse_time(item.get('created_at')) or datetime.utcnow()
+            )))
+        return rows
+    
+    def _prepare_goal_progress(self, user, items, conflict):
+        goal_ids = {item.get('goal_id') for item in items if isinstance(item.get('goal_id'), int)}
+        goals = {
+            goal.id: goal for goal in Goal.query.filter(Goal.user_id == user.id, Goal.id.in_(goal_ids))
+        } if goal_ids else {}
+        
+        parsed = []
+        for item in items:
+            goal = goals.get(item.get('goal_id')) if isinstance(item.get('goal_id'), int) else None
+            recorded_at = self.parse_time(item.get('recorded_at'))
+            try:
+                value = self.parse_number(item.get('value'))
+            except ValueError:
+                value = None
+            if goal is None:
+                conflict('goal_progress', item, 'unknown_goal')
+                continue
+            if recorded_at is None or value is None:
+                conflict('goal_progress', item, 'invalid')
+                continue
+            parsed.append((recorded_at, item, goal, value))
+        
+        rows = []
+        # Oldest first, so the newest value ends up as the goal's current value
+        for recorded_at, item, goal, value in sorted(parsed, key=lambda entry: entry[0]):
+            base_updated_at = self.parse_time(item.get('base_updated_at'))
+            if base_updated_at is not None and goal.updated_at and goal.updated_at > base_updated_at:
+                conflict('goal_progress', item, 'goal_changed',
+                         server=dict(goal.to_dict(), updated_at=goal.updated_at.isoformat()))
+                continue
+            
+            self._apply_goal_value(goal, value)
+            rows.append(('goal_progress', item.get('client_id'), GoalProgress(
+                goal_id=goal.id,
+                value=value,
+                notes=item.get('notes', ''),
+                created_at=recorded_at
+            )))
+        return rows
+    
+    def _apply_goal_value(self, goal, value):
+        """Same completion rules as the goal update route; goals without a target never complete"""
+        goal.current_value = value
+        goal.updated_at = datetime.utcnow()
+        if not goal.target_value:
+            return
+        if goal.goal_type == 'lose_weight' and value <= goal.target_value:
+            goal.status = 'completed'
+        elif goal.goal_type == 'gain_weight' and value >= goal.target_value:
+            goal.status = 'completed'
+        elif goal.goal_type == 'maintain_weight':
+            # Within 2% of target
+            if abs(value - goal.target_value) / goal.target_value < 0.02:
+                goal.status = 'completed'
+    
+    def parse_number(self, value):
+        """
+        Parse a numeric value from a client
+        
+        Returns:
+            The float, or None when the value is missing
+        
+        Raises:
+            ValueError: The value is present but not a number
+        """
+        if value is None or value == '':
+            return None
+        if isinstance(value, bool):
+            raise ValueError(f'{value!r} is not a number')
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{value!r} is not a number')
+    
+    def parse_time(self, value):
+        """Parse an ISO timestamp from a client into naive UTC, or None"""
+        if not value or not isinstance(value, str):
+            return None
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    
+    def is_online(self):
+        """Check if system has internet connectivity (last background probe, never blocks)"""
+        return connectivity_monitor.is_online()
     
     def get_offline_features(self):
         """Get list of features available offline"""
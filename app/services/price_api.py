@@ -3,104 +3,316 @@ Food Price API Integration Service
 Fetches and updates real-time food prices from market APIs
 """
 import requests
+import random
+import zlib
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from types import SimpleNamespace
+from requests.adapters import HTTPAdapter
+from sqlalchemy import or_, insert, update
 from app import db
-from app.models import FoodItem, FoodPrice
+from app.models import FoodItem, FoodPrice, MarketPrice
+from app.services.catalog import catalog, get_markets, DEFAULT_MARKET
+from app.services.price_rollups import price_rollups
+from app.services.cost_estimator import cost_estimator
 import os
 
 class PriceAPIService:
     """Service for fetching and managing food prices"""
     
-    def __init__(self):
-        # In production, this would be a real API endpoint
-        # For now, we'll simulate with market data
-        self.api_url = os.getenv('FOOD_PRICE_API_URL', 'https://api.example.com/prices')
-        self.api_key = os.getenv('FOOD_PRICE_API_KEY', '')
+    # Statuses worth retrying: rate limiting and transient server errors
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    
+    def __init__(self, api_url=None, api_key=None, max_workers=None, timeout=None,
+                 max_retries=None, bulk_size=None):
+        # Prices are simulated unless a real API endpoint is configured
+        configured_url = api_url or os.getenv('FOOD_PRICE_API_URL')
+        self.simulate = not configured_url
+        self.api_url = (configured_url or 'https://api.example.com/prices').rstrip('/')
+        self.api_key = api_key if api_key is not None else os.getenv('FOOD_PRICE_API_KEY', '')
         self.update_interval_hours = 24
+        
+        # Fetch engine settings
+        self.max_workers = max_workers or int(os.getenv('FOOD_PRICE_API_CONCURRENCY', 8))
+        self.timeout = timeout or float(os.getenv('FOOD_PRICE_API_TIMEOUT', 10))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('FOOD_PRICE_API_RETRIES', 3))
+        self.backoff_seconds = float(os.getenv('FOOD_PRICE_API_BACKOFF', 0.5))
+        self.max_backoff_seconds = float(os.getenv('FOOD_PRICE_API_MAX_BACKOFF', 10))
+        # > 0 switches to bulk-quote mode: one request per bulk_size foods
+        self.bulk_size = bulk_size if bulk_size is not None else int(os.getenv('FOOD_PRICE_API_BULK_SIZE', 0))
+        
+        # Markets quoted on every refresh, default market first
+        self.markets = get_markets()
+        # Foods per fetch-and-write chunk in update_food_prices
+        self.chunk_size = int(os.getenv('FOOD_PRICE_UPDATE_CHUNK_SIZE', 1000))
+        
+        self._session = None
+        self._session_lock = threading.Lock()
     
-    def update_food_prices(self, force=False):
+    def update_food_prices(self, force=False, chunk_size=None, progress=None):
         """
         Update food prices from API
         
+        Stale foods are selected in SQL and processed in id-ordered chunks: each
+        chunk is fetched concurrently for every market, its prices written with
+        executemany UPDATEs and its history with one multi-row INSERT, then
+        committed. Only (id, name, current_price) tuples are loaded, so memory
+        stays bounded by the chunk size however large the catalog is.
+        
         Args:
             force: Force update even if recently updated
+            chunk_size: Foods per chunk (defaults to FOOD_PRICE_UPDATE_CHUNK_SIZE)
+            progress: Optional callable(done, total) called after each chunk
         
         Returns:
             Number of prices updated
         """
+        chunk_size = chunk_size or self.chunk_size
         updated_count = 0
         
-        # Get all food items
-        foods = FoodItem.query.all()
+        stale_query = db.session.query(FoodItem.id, FoodItem.name, FoodItem.current_price)
+        if not force:
+            cutoff = datetime.utcnow() - timedelta(hours=self.update_interval_hours)
+            stale_query = stale_query.filter(or_(
+                FoodItem.price_last_updated.is_(None),
+                FoodItem.price_last_updated < cutoff
+            ))
+        
+        total = stale_query.count() if progress else None
+        processed = 0
+        changed_food_ids = set()
         
-        for food in foods:
-            # Check if update is needed
-            if not force and food.price_last_updated:
-                time_since_update = datetime.utcnow() - food.price_last_updated
-                if time_since_update < timedelta(hours=self.update_interval_hours):
-                    continue
+        last_id = 0
+        while True:
+            chunk = stale_query.filter(FoodItem.id > last_id).order_by(FoodItem.id).limit(chunk_size).all()
+            if not chunk:
+                break
+            last_id = chunk[-1].id
             
-            # Fetch price from API (or use simulated data)
-            price_data = self._fetch_price(food)
+            # Fetch prices concurrently from API (or use simulated data), market by market
+            prices_by_market = {market: self.fetch_prices(chunk, location=market) for market in self.markets}
             
-            if price_data:
-                # Update food item price
-                old_price = food.current_price
-                food.current_price = price_data['price']
-                food.price_last_updated = datetime.utcnow()
+            now = datetime.utcnow()
+            food_updates = []
+            market_rows = []
+            history_rows = []
+            for food in chunk:
+                default_price = prices_by_market[DEFAULT_MARKET].get(food.id)
+                updated = False
                 
-                # Record price history
-                price_record = FoodPrice(
-                    food_item_id=food.id,
-                    price=price_data['price'],
-                    location=price_data.get('location', 'Kampala'),
-                    source=price_data.get('source', 'api')
-                )
-                db.session.add(price_record)
-                updated_count += 1
-        
-        db.session.commit()
+                for market, prices in prices_by_market.items():
+                    price_data = prices.get(food.id)
+                    if not price_data:
+                        continue
+                    updated = True
+                    market_rows.append({
+                        'food_item_id': food.id,
+                        'location': market,
+                        'price': price_data['price'],
+                        'source': price_data.get('source', 'api'),
+                        'updated_at': now
+                    })
+                    # Record price history
+                    history_rows.append({
+                        'food_item_id': food.id,
+                        'price': price_data['price'],
+                        'location': market,
+                        'source': price_data.get('source', 'api'),
+                        'recorded_at': now
+                    })
+                
+                if updated:
+                    food_updates.append({
+                        'id': food.id,
+                        # FoodItem.current_price tracks the default market
+                        'current_price': default_price['price'] if default_price else food.current_price,
+                        'price_last_updated': now,
+                        'updated_at': now
+                    })
+            
+            if food_updates:
+                db.session.execute(update(FoodItem), food_updates)
+                self._upsert_market_prices(market_rows)
+                db.session.execute(insert(FoodPrice.__table__).values(history_rows))
+                price_rollups.record(history_rows)
+                db.session.commit()
+                updated_count += len(food_updates)
+                changed_food_ids.update(food_update['id'] for food_update in food_updates)
+            
+            processed += len(chunk)
+            if progress:
+                progress(processed, total)
+        
+        if changed_food_ids:
+            # Patch the catalog snapshot; its price change event lets dependent caches patch themselves
+            catalog.apply_price_changes(changed_food_ids)
         return updated_count
     
+    def _upsert_market_prices(self, rows):
+        """Update existing (food, market) prices and insert the missing ones"""
+        food_ids = {row['food_item_id'] for row in rows}
+        existing = {
+            (food_item_id, location): price_id
+            for price_id, food_item_id, location in db.session.query(
+                MarketPrice.id, MarketPrice.food_item_id, MarketPrice.location
+            ).filter(MarketPrice.food_item_id.in_(food_ids))
+        }
+        
+        updates = []
+        inserts = []
+        for row in rows:
+            price_id = existing.get((row['food_item_id'], row['location']))
+            if price_id:
+                updates.append(dict(row, id=price_id))
+            else:
+                inserts.append(row)
+        
+        if updates:
+            db.session.execute(update(MarketPrice), updates)
+        if inserts:
+            db.session.execute(insert(MarketPrice.__table__).values(inserts))
+    
+    def fetch_prices(self, foods, location=DEFAULT_MARKET):
+        """
+        Fetch prices for many foods concurrently
+        
+        Args:
+            foods: Objects with id, name and current_price (ORM rows or snapshots)
+            location: Market to quote
+        
+        Returns:
+            Dict of food id -> price data; foods that failed are left out
+        """
+        # Worker threads only see plain copies, never session-bound ORM objects
+        items = [
+            SimpleNamespace(id=food.id, name=food.name, current_price=food.current_price, location=location)
+            for food in foods
+        ]
+        if not items:
+            return {}
+        
+        prices = {}
+        if self.bulk_size > 0 and not self.simulate:
+            chunks = [items[i:i + self.bulk_size] for i in range(0, len(items), self.bulk_size)]
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as pool:
+                for chunk_prices in pool.map(self._fetch_bulk, chunks):
+                    prices.update(chunk_prices)
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as pool:
+                for item, price_data in zip(items, pool.map(self._fetch_price, items)):
+                    if price_data:
+                        prices[item.id] = price_data
+        return prices
+    
     def _fetch_price(self, food_item):
         """
-        Fetch price from external API
-        In production, this would make actual API calls
+        Fetch price for one food from the external API
+        Falls back to simulated market variation when no API is configured
         """
         try:
-            # Simulate API call - in production, use actual API
-            # For now, add some variation to simulate market prices
-            import random
-            
-            base_price = food_item.current_price or 1000
-            # Simulate price variation (±20%)
-            variation = random.uniform(0.8, 1.2)
-            new_price = base_price * variation
+            location = getattr(food_item, 'location', DEFAULT_MARKET)
+            if self.simulate:
+                base_price = food_item.current_price or 1000
+                # Simulate price variation (±20%) around a fixed regional level (±10%)
+                regional_level = 0.9 + (zlib.crc32(location.encode('utf-8')) % 21) / 100 if location != DEFAULT_MARKET else 1.0
+                variation = random.uniform(0.8, 1.2)
+                new_price = base_price * regional_level * variation
+                
+                return {
+                    'price': round(new_price, 2),
+                    'location': location,
+                    'source': 'api',
+                    'timestamp': datetime.utcnow().isoformat()
+                }
             
-            return {
-                'price': round(new_price, 2),
-                'location': 'Kampala',
-                'source': 'api',
-                'timestamp': datetime.utcnow().isoformat()
-            }
+            response = self._request('GET', f"{self.api_url}/{food_item.id}", params={
+                'name': food_item.name,
+                'location': location
+            })
+            return self._parse_quote(response.json(), location)
         except Exception as e:
             print(f"Error fetching price for {food_item.name}: {str(e)}")
             return None
     
-    def get_price_trend(self, food_item_id, days=30):
-        """Get price trend for a food item"""
-        cutoff_date = datetime.utcnow() - timedelta(days=days)
-        
-        prices = FoodPrice.query.filter(
-            FoodPrice.food_item_id == food_item_id,
-            FoodPrice.recorded_at >= cutoff_date
-        ).order_by(FoodPrice.recorded_at.asc()).all()
-        
-        return [{
-            'date': price.recorded_at.isoformat(),
-            'price': price.price,
-            'location': price.location
-        } for price in prices]
+    def _fetch_bulk(self, food_items):
+        """Fetch prices for a chunk of foods with a single bulk-quote request"""
+        try:
+            location = food_items[0].location
+            response = self._request('POST', f"{self.api_url}/bulk", json={
+                'location': location,
+                'items': [{'id': item.id, 'name': item.name} for item in food_items]
+            })
+            prices = {}
+            for quote in response.json().get('prices', []):
+                price_data = self._parse_quote(quote, location)
+                if price_data and quote.get('id') is not None:
+                    prices[int(quote['id'])] = price_data
+            return prices
+        except Exception as e:
+            print(f"Error fetching bulk prices for {len(food_items)} foods: {str(e)}")
+            return {}
+    
+    def _parse_quote(self, quote, location=DEFAULT_MARKET):
+        if quote.get('price') is None:
+            return None
+        return {
+            'price': round(float(quote['price']), 2),
+            'location': quote.get('location', location),
+            'source': quote.get('source', 'api'),
+            'timestamp': quote.get('timestamp', datetime.utcnow().isoformat())
+        }
+    
+    def _get_session(self):
+        """Shared HTTP session whose connection pool is sized to the worker count"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_workers)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    if self.api_key:
+                        session.headers['X-API-Key'] = self.api_key
+                    self._session = session
+        return self._session
+    
+    def _request(self, method, url, **kwargs):
+        """HTTP request with a per-request timeout and retries with full jitter"""
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                response = self._get_session().request(method, url, timeout=self.timeout, **kwargs)
+                if response.status_code not in self.RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response
+                error = requests.HTTPError(f"{response.status_code} from {url}", response=response)
+                retry_after = response.headers.get('Retry-After')
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            
+            if attempt == self.max_retries:
+                raise error
+            
+            # Exponential backoff with full jitter, honouring Retry-After
+            delay = random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * (2 ** attempt)))
+            if retry_after:
+                try:
+                    delay = max(delay, min(self.max_backoff_seconds, float(retry_after)))
+                except ValueError:
+                    pass
+            time.sleep(delay)
+    
+    def get_price_trend(self, food_item_id, days=30, location=None):
+        """
+        Get price trend for a food item
+        
+        Short windows return raw price points; longer ones return daily or
+        weekly rollups (last/min/max/mean per market), see PriceRollupService.
+        """
+        _, points = price_rollups.get_trend(food_item_id, days=days, location=location)
+        return points
     
     def get_affordable_foods(self, max_price, limit=20):
         """Get foods within a price range"""
@@ -111,30 +323,34 @@ class PriceAPIService:
         
         return foods
     
-    def estimate_meal_cost(self, food_items_with_quantities):
+    def estimate_meal_cost(self, food_items_with_quantities, location=None):
         """
         Estimate total cost for a meal
         
         Args:
             food_items_with_quantities: List of tuples (food_item_id, quantity_in_grams)
+            location: Market to price the meal at (defaults to Kampala)
         
         Returns:
             Total estimated cost in UGX
         """
-        total_cost = 0
-        
-        for food_id, quantity in food_items_with_quantities:
-            food = FoodItem.query.get(food_id)
-            if food and food.current_price:
-                if food.price_unit == 'kg':
-                    cost_per_gram = food.current_price / 1000
-                    total_cost += cost_per_gram * quantity
-                elif food.price_unit == 'piece':
-                    total_cost += food.current_price
-                else:
-                    # Assume per 100g
-                    cost_per_gram = food.current_price / 100
-                    total_cost += cost_per_gram * quantity
-        
-        return round(total_cost, 2)
+        return round(cost_estimator.estimate(food_items_with_quantities, location), 2)
+    
+    def estimate_meal_costs(self, meals, location=None):
+        """
+        Estimate total costs for many meals at once
+        
+        Args:
+            meals: List of meals, each a list of (food_item_id, quantity_in_grams)
+            location: Market to price the meals at
+        
+        Returns:
+            List of estimated costs in UGX, one per meal
+        """
+        return [round(total, 2) for total in cost_estimator.estimate_meals(meals, location)]
+
 
+def refresh_prices_job(job, force=False):
+    """Job scheduler entry point for a price refresh"""
+    updated_count = PriceAPIService().update_food_prices(force=force, progress=job.set_progress)
+    return {'updated_count': updated_count}
@@ -0,0 +1,264 @@
+"""
+Price History Retention
+Compacts old food_prices rows into daily rollups and columnar archive files
+"""
+import glob
+import os
+import shutil
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from app import db
+from app.models import FoodPrice, PriceRollup
+from app.services.catalog import DEFAULT_MARKET
+from app.services.price_rollups import period_start, price_rollups
+
+# Optional Parquet support - falls back to uncompressed .npy column files without it
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+class ParquetArchiveWriter:
+    """Writes one month of rows to a zstd Parquet file, a row group per chunk"""
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = path + '.tmp'
+        self._writer = None
+
+    def write(self, columns):
+        table = pa.table({name: pa.array(values) for name, values in columns.items()})
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._tmp_path, table.schema, compression='zstd')
+        self._writer.write_table(table)
+
+    def close(self):
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+class NpyArchiveWriter:
+    """
+    Writes one month of rows as a directory of uncompressed .npy column files
+
+    Columns are preallocated with np.lib.format.open_memmap and filled chunk
+    by chunk, so neither writing nor reading needs the month in memory:
+    np.load(mmap_mode='r') maps them back. String columns are stored as int32
+    codes into a <column>_values.npy lookup array.
+    """
+
+    COLUMNS = {
+        'id': np.int64,
+        'food_item_id': np.int32,
+        'location': np.int32,
+        'price': np.float64,
+        'source': np.int32,
+        'recorded_at': 'datetime64[us]'
+    }
+    CODED = ('location', 'source')
+
+    def __init__(self, path, total):
+        self.path = path
+        self.total = total
+        self._tmp_path = path + '.tmp'
+        shutil.rmtree(self._tmp_path, ignore_errors=True)
+        os.makedirs(self._tmp_path)
+        self._offset = 0
+        self._codes = {name: {} for name in self.CODED}
+        self._columns = {
+            name: np.lib.format.open_memmap(
+                os.path.join(self._tmp_path, name + '.npy'), mode='w+', dtype=dtype, shape=(total,)
+            )
+            for name, dtype in self.COLUMNS.items()
+        }
+
+    def write(self, columns):
+        end = self._offset + len(columns['id'])
+        if end > self.total:
+            raise ValueError(f"Archive for {self.path} got more than the {self.total} rows counted")
+        for name, values in columns.items():
+            if name in self._codes:
+                codes = self._codes[name]
+                values = np.array([codes.setdefault(value, len(codes)) for value in values], dtype=np.int32)
+            self._columns[name][self._offset:end] = values
+        self._offset = end
+
+    def close(self):
+        if self._offset != self.total:
+            raise ValueError(f"Archive for {self.path} got {self._offset} of {self.total} rows counted")
+        for column in self._columns.values():
+            column.flush()
+        self._columns = {}
+        for name, codes in self._codes.items():
+            np.save(os.path.join(self._tmp_path, f'{name}_values.npy'), np.array(list(codes), dtype=str))
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._columns = {}
+        shutil.rmtree(self._tmp_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path, food_item_id=None):
+        """Memory-map an archive directory and copy out the matching rows as a DataFrame"""
+        columns = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in cls.COLUMNS}
+        rows = slice(None) if food_item_id is None else columns['food_item_id'] == food_item_id
+        frame = pd.DataFrame({name: np.asarray(values[rows]) for name, values in columns.items()})
+        for name in cls.CODED:
+            labels = np.load(os.path.join(path, f'{name}_values.npy'))
+            frame[name] = labels[frame[name].to_numpy()]
+        return frame
+
+
+class PriceArchiveService:
+    """Keeps food_prices to a retention window and archives the rest to files"""
+
+    def __init__(self, retention_days=None, archive_dir=None, chunk_size=None):
+        self.retention_days = retention_days or int(os.getenv('FOOD_PRICE_RETENTION_DAYS', 90))
+        self.archive_dir = archive_dir or os.getenv('FOOD_PRICE_ARCHIVE_DIR', 'price_archive')
+        # Rows read, archived and rolled up at a time while compacting a month
+        self.chunk_size = chunk_size or int(os.getenv('FOOD_PRICE_COMPACT_CHUNK_SIZE', 50000))
+
+    def compact(self, retention_days=None):
+        """
+        Archive and delete raw price history older than the retention window
+
+        History is processed one calendar month at a time, oldest first,
+        starting from the oldest day still in food_prices, so days archived by
+        an earlier run in the same month keep their rollups. For each month
+        the rows are streamed chunk_size at a time into a columnar
+        file, their daily rollups are recomputed from the complete raw data,
+        and the rows are deleted, all before a single commit. Weekly rollups
+        are already maintained incrementally and are left as they are.
+
+        Returns:
+            Dict with the number of rows archived and files written
+        """
+        days = retention_days if retention_days is not None else self.retention_days
+        # Day-aligned so every archived day is archived whole
+        cutoff = period_start(datetime.utcnow() - timedelta(days=days), 'day')
+        summary = {'rows': 0, 'files': 0}
+
+        while True:
+            oldest = db.session.query(db.func.min(FoodPrice.recorded_at)).filter(
+                FoodPrice.recorded_at < cutoff
+            ).scalar()
+            if oldest is None:
+                break
+
+            range_start = period_start(oldest, 'day')
+            month_end = min(cutoff, (datetime(oldest.year, oldest.month, 1) + timedelta(days=32)).replace(day=1))
+            summary['rows'] += self._compact_range(range_start, month_end)
+            summary['files'] += 1
+
+        return summary
+
+    def _compact_range(self, start, end):
+        in_range = (FoodPrice.recorded_at >= start, FoodPrice.recorded_at < end)
+        query = db.session.query(
+            FoodPrice.id, FoodPrice.food_item_id, FoodPrice.location,
+            FoodPrice.price, FoodPrice.source, FoodPrice.recorded_at
+        ).filter(*in_range)
+        total = query.count()
+        if not total:
+            return 0
+
+        writer = None
+        try:
+            # The range's daily rollups are rebuilt from its complete raw data
+            PriceRollup.query.filter(
+                PriceRollup.resolution == 'day',
+                PriceRollup.period_start >= start,
+                PriceRollup.period_start < end
+            ).delete(synchronize_session=False)
+
+            chunk = []
+            for row in query.order_by(FoodPrice.recorded_at, FoodPrice.id).yield_per(self.chunk_size):
+                chunk.append(row)
+                if len(chunk) >= self.chunk_size:
+                    writer = self._write_chunk(writer, chunk, start, total)
+                    chunk = []
+            if chunk:
+                writer = self._write_chunk(writer, chunk, start, total)
+
+            writer.close()
+            FoodPrice.query.filter(*in_range).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if writer is not None:
+                writer.abort()
+            raise
+
+        return total
+
+    def _write_chunk(self, writer, rows, range_start, total):
+        """Append rows to the month's archive and rollups; opens the writer on the first chunk"""
+        if writer is None:
+            # Named by first row id so re-runs overwrite
+            os.makedirs(self.archive_dir, exist_ok=True)
+            base_name = os.path.join(self.archive_dir, f"food_prices-{range_start:%Y-%m}-{rows[0].id}")
+            writer = ParquetArchiveWriter(base_name + '.parquet') if PYARROW_AVAILABLE else NpyArchiveWriter(base_name, total)
+
+        writer.write({
+            'id': np.array([row.id for row in rows], dtype=np.int64),
+            'food_item_id': np.array([row.food_item_id for row in rows], dtype=np.int32),
+            'location': np.array([row.location or DEFAULT_MARKET for row in rows], dtype=str),
+            'price': np.array([row.price for row in rows], dtype=np.float64),
+            'source': np.array([row.source or '' for row in rows], dtype=str),
+            'recorded_at': np.array([row.recorded_at for row in rows], dtype='datetime64[us]')
+        })
+        price_rollups.record([{
+            'food_item_id': row.food_item_id,
+            'location': row.location or DEFAULT_MARKET,
+            'price': row.price,
+            'recorded_at': row.recorded_at
+        } for row in rows], resolutions=('day',))
+        return writer
+
+    def load_archive(self, food_item_id=None, start=None, end=None):
+        """
+        Read archived price history into a DataFrame for analysis
+
+        Parquet files and .npy archive directories are memory-mapped, and only
+        rows for food_item_id are copied out of them.
+
+        Args:
+            food_item_id: Only rows for this food
+            start, end: Only rows recorded in [start, end)
+        """
+        frames = []
+        for path in sorted(glob.glob(os.path.join(self.archive_dir, 'food_prices-*'))):
+            if path.endswith('.tmp'):
+                continue
+            if os.path.isdir(path):
+                frame = NpyArchiveWriter.load(path, food_item_id)
+            elif path.endswith('.parquet'):
+                if not PYARROW_AVAILABLE:
+                    continue
+                filters = [('food_item_id', '=', food_item_id)] if food_item_id is not None else None
+                frame = pq.read_table(path, memory_map=True, filters=filters).to_pandas()
+            else:
+                continue
+
+            if food_item_id is not None:
+                frame = frame[frame['food_item_id'] == food_item_id]
+            if start is not None:
+                frame = frame[frame['recorded_at'] >= start]
+            if end is not None:
+                frame = frame[frame['recorded_at'] < end]
+            frames.append(frame)
+
+        if not frames:
+            return pd.DataFrame(columns=['id', 'food_item_id', 'location', 'price', 'source', 'recorded_at'])
+        return pd.concat(frames, ignore_index=True).sort_values('recorded_at', ignore_index=True)
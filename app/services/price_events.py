@@ -0,0 +1,82 @@
+"""
+Price Change Events
+Publish/subscribe for food price updates, fed by the shared catalog change log
+"""
+import threading
+import traceback
+
+
+class PriceChangeEvent:
+    """
+    Foods whose prices changed, and the catalog version that includes the change
+
+    food_ids is None when any food may have changed. local is False for
+    changes another process made and this one picked up from the change log;
+    subscribers that write to the database should act on local events only,
+    so each change is handled once.
+    """
+
+    def __init__(self, food_ids, version, previous_version=None, local=True):
+        self.food_ids = frozenset(food_ids) if food_ids is not None else None
+        self.version = version
+        self.previous_version = version - 1 if previous_version is None else previous_version
+        self.local = local
+
+    def __repr__(self):
+        foods = 'all foods' if self.food_ids is None else f"{len(self.food_ids)} foods"
+        return f"PriceChangeEvent({foods}, version={self.version}, local={self.local})"
+
+
+class PriceEventBus:
+    """
+    Synchronous event bus for price changes
+
+    FoodCatalog publishes one event per catalog change as it applies it,
+    whether this process or another one recorded the change. Subscribers
+    run in the publishing thread, in subscription order. A subscriber that
+    raises is logged and does not stop the others.
+    """
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """Register callback(event); returns the callback so it works as a decorator"""
+        with self._lock:
+            if callback not in self._subscribers:
+                self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def publish(self, food_ids, version, previous_version=None, local=True):
+        """
+        Notify subscribers that prices changed
+
+        Args:
+            food_ids: IDs of foods with new prices, or None for any food
+            version: Catalog version after the change
+            previous_version: Catalog version the change applies on top of
+            local: Whether this process made the change
+
+        Returns:
+            The published PriceChangeEvent
+        """
+        event = PriceChangeEvent(food_ids, version, previous_version, local)
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Error in price change subscriber {getattr(callback, '__qualname__', callback)}: {str(e)}")
+                traceback.print_exc()
+        return event
+
+
+price_events = PriceEventBus()
@@ -0,0 +1,206 @@
+"""
+Price Trend Rollups
+Daily and weekly price summaries maintained alongside the raw price history
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import insert, update
+from app import db
+from app.models import FoodPrice, PriceRollup
+from app.services.catalog import DEFAULT_MARKET
+
+RESOLUTIONS = ('day', 'week')
+
+
+def period_start(recorded_at, resolution):
+    """Start of the day or ISO week (Monday) containing a timestamp"""
+    start = datetime(recorded_at.year, recorded_at.month, recorded_at.day)
+    if resolution == 'week':
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+class PriceRollupService:
+    """Maintains price_rollups and serves price trends from them"""
+
+    # Windows up to this many days are served from raw food_prices rows
+    RAW_MAX_DAYS = 2
+    # Windows up to this many days use daily rollups; longer ones use weekly
+    DAILY_MAX_DAYS = 90
+
+    def resolution_for(self, days):
+        """Pick the coarsest resolution that still gives a useful chart"""
+        if days <= self.RAW_MAX_DAYS:
+            return 'raw'
+        if days <= self.DAILY_MAX_DAYS:
+            return 'day'
+        return 'week'
+
+    def record(self, history_rows, resolutions=RESOLUTIONS, replace=False):
+        """
+        Fold new price history rows into the daily and weekly rollups
+
+        Runs in the caller's transaction; the caller commits.
+
+        Args:
+            history_rows: Dicts with food_item_id, location, price and recorded_at
+            resolutions: Rollup resolutions to maintain
+            replace: Overwrite matching rollups instead of adding to them; the
+                rows must then hold every sample of the periods they touch
+        """
+        if not history_rows:
+            return
+        for resolution in resolutions:
+            self._merge(resolution, self._summarize(history_rows, resolution), replace)
+
+    def rebuild(self, since=None, chunk_size=5000):
+        """
+        Recompute rollups from raw history, e.g. after a backfill
+
+        Rollup periods touched by the rebuilt window are replaced, so
+        `since` is widened to the start of its week.
+
+        Returns:
+            Number of history rows read
+        """
+        query = db.session.query(
+            FoodPrice.food_item_id, FoodPrice.location, FoodPrice.price, FoodPrice.recorded_at
+        ).filter(FoodPrice.recorded_at.isnot(None))
+        stale_rollups = PriceRollup.query
+        if since is not None:
+            since = period_start(since, 'week')
+            query = query.filter(FoodPrice.recorded_at >= since)
+            stale_rollups = stale_rollups.filter(PriceRollup.period_start >= since)
+        stale_rollups.delete(synchronize_session=False)
+
+        rows_read = 0
+        batch = []
+        for food_item_id, location, price, recorded_at in query.order_by(FoodPrice.recorded_at).yield_per(chunk_size):
+            batch.append({
+                'food_item_id': food_item_id,
+                'location': location or DEFAULT_MARKET,
+                'price': price,
+                'recorded_at': recorded_at
+            })
+            if len(batch) >= chunk_size:
+                self.record(batch)
+                rows_read += len(batch)
+                batch = []
+        self.record(batch)
+        rows_read += len(batch)
+
+        db.session.commit()
+        return rows_read
+
+    def get_trend(self, food_item_id, days=30, location=None):
+        """
+        Price trend for a food, oldest first
+
+        Returns:
+            Tuple of (resolution, points)
+        """
+        resolution = self.resolution_for(days)
+        cutoff = datetime.utcnow() - timedelta(days=days)
+
+        if resolution == 'raw':
+            query = FoodPrice.query.with_entities(
+                FoodPrice.recorded_at, FoodPrice.price, FoodPrice.location
+            ).filter(
+                FoodPrice.food_item_id == food_item_id,
+                FoodPrice.recorded_at >= cutoff
+            )
+            if location:
+                query = query.filter(FoodPrice.location == location)
+            return resolution, [{
+                'date': recorded_at.isoformat(),
+                'price': price,
+                'location': price_location
+            } for recorded_at, price, price_location in query.order_by(FoodPrice.recorded_at.asc())]
+
+        query = PriceRollup.query.filter(
+            PriceRollup.food_item_id == food_item_id,
+            PriceRollup.resolution == resolution,
+            # Include the period that contains the cutoff
+            PriceRollup.period_start >= period_start(cutoff, resolution)
+        )
+        if location:
+            query = query.filter(PriceRollup.location == location)
+        rollups = query.order_by(PriceRollup.period_start.asc(), PriceRollup.location.asc()).all()
+        return resolution, [rollup.to_dict() for rollup in rollups]
+
+    def _summarize(self, history_rows, resolution):
+        """Aggregate rows into {(food, location, period_start): summary}"""
+        summaries = {}
+        for row in history_rows:
+            key = (row['food_item_id'], row['location'], period_start(row['recorded_at'], resolution))
+            price = row['price']
+            summary = summaries.get(key)
+            if summary is None:
+                summaries[key] = {
+                    'min_price': price,
+                    'max_price': price,
+                    'price_sum': price,
+                    'sample_count': 1,
+                    'last_price': price,
+                    'last_recorded_at': row['recorded_at']
+                }
+                continue
+            summary['min_price'] = min(summary['min_price'], price)
+            summary['max_price'] = max(summary['max_price'], price)
+            summary['price_sum'] += price
+            summary['sample_count'] += 1
+            if row['recorded_at'] >= summary['last_recorded_at']:
+                summary['last_price'] = price
+                summary['last_recorded_at'] = row['recorded_at']
+        return summaries
+
+    def _merge(self, resolution, summaries, replace=False):
+        """Combine summaries with existing rollup rows: one SELECT, one UPDATE, one INSERT"""
+        food_ids = {food_item_id for food_item_id, _, _ in summaries}
+        starts = {start for _, _, start in summaries}
+        existing = {
+            (rollup.food_item_id, rollup.location, rollup.period_start): rollup
+            for rollup in db.session.query(
+                PriceRollup.id, PriceRollup.food_item_id, PriceRollup.location, PriceRollup.period_start,
+                PriceRollup.min_price, PriceRollup.max_price, PriceRollup.price_sum,
+                PriceRollup.sample_count, PriceRollup.last_price, PriceRollup.last_recorded_at
+            ).filter(
+                PriceRollup.resolution == resolution,
+                PriceRollup.food_item_id.in_(food_ids),
+                PriceRollup.period_start.in_(starts)
+            )
+        }
+
+        updates = []
+        inserts = []
+        for key, summary in summaries.items():
+            current = existing.get(key)
+            if current is None:
+                food_item_id, location, start = key
+                inserts.append(dict(summary, food_item_id=food_item_id, location=location,
+                                    resolution=resolution, period_start=start))
+                continue
+            if replace:
+                updates.append(dict(summary, id=current.id))
+                continue
+
+            merged = {
+                'id': current.id,
+                'min_price': min(current.min_price, summary['min_price']),
+                'max_price': max(current.max_price, summary['max_price']),
+                'price_sum': current.price_sum + summary['price_sum'],
+                'sample_count': current.sample_count + summary['sample_count'],
+                'last_price': current.last_price,
+                'last_recorded_at': current.last_recorded_at
+            }
+            if summary['last_recorded_at'] >= current.last_recorded_at:
+                merged['last_price'] = summary['last_price']
+                merged['last_recorded_at'] = summary['last_recorded_at']
+            updates.append(merged)
+
+        if updates:
+            db.session.execute(update(PriceRollup), updates)
+        if inserts:
+            db.session.execute(insert(PriceRollup.__table__).values(inserts))
+
+
+price_rollups = PriceRollupService()
@@ -8,7 +8,10 @@ import joblib
 import os
 from datetime import datetime
 from app import db
+from sqlalchemy import update
 from app.models import FoodItem, Recommendation, FoodLog, User
+from app.services.catalog import catalog
+from app.services.cost_estimator import cost_estimator
 
 # Optional ML imports - app works without them using rule-based logic only
 try:
@@ -53,7 +56,7 @@ class RecommendationEngine:
         # Train a simple model (in production, use more sophisticated ML)
         self.model = None  # Will use rule-based + similarity for now
     
-    def generate_recommendations(self, user, meal_type='all', limit=10):
+    def generate_recommendations(self, user, meal_type='all', limit=10, ranked_foods=None, commit=True):
         """
         Generate personalized food recommendations
         
@@ -61,46 +64,40 @@ class RecommendationEngine:
             user: User model instance
             meal_type: 'breakfast', 'lunch', 'dinner', 'snack', or 'all'
             limit: Maximum number of recommendations
+            ranked_foods: Precomputed output of rank_foods (used by batch callers)
+            commit: Commit the new recommendations (False leaves it to the caller)
         
         Returns:
             List of Recommendation objects
         """
-        # Get all food items
-        query = FoodItem.query.filter_by(is_affordable=True)
+        if ranked_foods is None:
+            ranked_foods = self.rank_foods(user, meal_type)
         
-        if meal_type != 'all':
-            # Filter by typical meal categories
-            if meal_type == 'breakfast':
-                query = query.filter(FoodItem.category.in_(['grains', 'fruits', 'proteins']))
-            elif meal_type == 'lunch' or meal_type == 'dinner':
-                query = query.filter(FoodItem.category.in_(['grains', 'vegetables', 'proteins']))
-            elif meal_type == 'snack':
-                query = query.filter(FoodItem.category.in_(['fruits', 'vegetables']))
-        
-        all_foods = query.all()
-        
-        if not all_foods:
+        top_foods = ranked_foods[:limit]
+        if not top_foods:
             return []
         
-        # Score each food item
-        scored_foods = []
-        for food in all_foods:
-            score, reasoning = self._calculate_food_score(user, food, meal_type)
-            if score > 0:
-                scored_foods.append((food, score, reasoning))
+        meal_suggestion = meal_type if meal_type != 'all' else None
         
-        # Sort by score
-        scored_foods.sort(key=lambda x: x[1], reverse=True)
+        # Look up existing recommendations for all candidates in one query
+        existing_by_food = {}
+        existing_recommendations = Recommendation.query.filter(
+            Recommendation.user_id == user.id,
+            Recommendation.food_item_id.in_([food.id for food, _, _ in top_foods]),
+            Recommendation.meal_suggestion == meal_suggestion
+        ).order_by(Recommendation.id.asc()).all()
+        for existing in existing_recommendations:
+            existing_by_food.setdefault(existing.food_item_id, existing)
+        
+        # Price every new recommendation's serving in one pass
+        new_foods = [food for food, _, _ in top_foods if food.id not in existing_by_food]
+        serving_sizes = {food.id: self._calculate_serving_size(user, food) for food in new_foods}
+        costs = dict(zip(serving_sizes, cost_estimator.item_costs(serving_sizes.items(), user.location)))
         
         # Create recommendations
         recommendations = []
-        for food, score, reasoning in scored_foods[:limit]:
-            # Check if recommendation already exists
-            existing = Recommendation.query.filter_by(
-                user_id=user.id,
-                food_item_id=food.id,
-                meal_suggestion=meal_type if meal_type != 'all' else None
-            ).first()
+        for food, score, reasoning in top_foods:
+            existing = existing_by_food.get(food.id)
             
             if not existing:
                 recommendation = Recommendation(
@@ -109,9 +106,9 @@ class RecommendationEngine:
                     recommendation_type='hybrid',
                     confidence_score=min(1.0, score / 100.0),
                     reasoning=reasoning,
-                    meal_suggestion=meal_type if meal_type != 'all' else None,
-                    serving_size=self._calculate_serving_size(user, food),
-                    estimated_cost=self._estimate_cost(food, user),
+                    meal_suggestion=meal_suggestion,
+                    serving_size=serving_sizes[food.id],
+                    estimated_cost=float(costs[food.id]),
                     model_version='v1.0',
                     features_used=str(self._extract_features(user, food))
                 )
@@ -120,14 +117,90 @@ class RecommendationEngine:
             else:
                 recommendations.append(existing)
         
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return recommendations
     
-    def _calculate_food_score(self, user, food, meal_type):
+    def rank_foods(self, user, meal_type='all', recent_food_ids=None, profile_scores=None):
+        """
+        Score candidate foods for a user and sort them best first
+        
+        Args:
+            user: User model instance
+            meal_type: Meal type used to pick candidate foods
+            recent_food_ids: IDs of foods the user ate recently (queried if None)
+            profile_scores: Output of profile_scores for this user's profile and meal type
+        
+        Returns:
+            List of (food, score, reasoning) tuples with score > 0
+        """
+        if profile_scores is None:
+            profile_scores = self.profile_scores(user, meal_type)
+        if recent_food_ids is None:
+            recent_food_ids = self.get_recent_food_ids(user)
+        
+        scored_foods = []
+        for food, score, reasoning_parts in profile_scores:
+            score, reasoning = self._apply_history(food, score, reasoning_parts, recent_food_ids)
+            if score > 0:
+                scored_foods.append((food, score, reasoning))
+        
+        # Sort by score
+        scored_foods.sort(key=lambda x: x[1], reverse=True)
+        return scored_foods
+    
+    def profile_scores(self, user, meal_type='all'):
+        """
+        Score every candidate food on the user's profile alone
+        
+        The result depends only on profile_key(user) and meal_type, so it can
+        be shared by every user with the same profile.
+        """
+        return [
+            (food,) + self._score_profile(user, food)
+            for food in self._candidate_foods(meal_type)
+        ]
+    
+    def profile_key(self, user):
+        """Profile fields that the profile part of the score depends on"""
+        return (bool(user.has_diabetes), user.primary_goal, user.monthly_budget, user.location)
+    
+    def get_recent_food_ids(self, user):
+        """IDs of the last 10 foods the user logged"""
+        recent_logs = FoodLog.query.with_entities(FoodLog.food_item_id).filter_by(
+            user_id=user.id
+        ).order_by(FoodLog.consumed_at.desc()).limit(10).all()
+        return {food_item_id for food_item_id, in recent_logs}
+    
+    def _candidate_foods(self, meal_type):
+        """Affordable foods from the catalog snapshot for a meal type"""
+        categories = None
+        if meal_type != 'all':
+            # Filter by typical meal categories
+            if meal_type == 'breakfast':
+                categories = ('grains', 'fruits', 'proteins')
+            elif meal_type == 'lunch' or meal_type == 'dinner':
+                categories = ('grains', 'vegetables', 'proteins')
+            elif meal_type == 'snack':
+                categories = ('fruits', 'vegetables')
+        
+        return [
+            food for food in catalog.snapshot().foods
+            if food.is_affordable and (categories is None or food.category in categories)
+        ]
+    
+    def _calculate_food_score(self, user, food, meal_type, recent_food_ids=None):
         """
         Calculate recommendation score for a food item
         Uses both rule-based and ML-based scoring
         """
+        if recent_food_ids is None:
+            recent_food_ids = self.get_recent_food_ids(user)
+        score, reasoning_parts = self._score_profile(user, food)
+        return self._apply_history(food, score, reasoning_parts, recent_food_ids)
+    
+    def _score_profile(self, user, food):
+        """Rule-based score from the user's profile; returns (score, reasoning_parts)"""
         score = 50.0  # Base score
         reasoning_parts = []
         
@@ -184,10 +257,11 @@ class RecommendationEngine:
         # 3. Budget considerations
         if user.monthly_budget:
             daily_budget = user.monthly_budget / 30
-            if food.current_price and food.current_price <= daily_budget * 0.1:
+            price = catalog.snapshot().price_for(food.id, user.location)
+            if price and price <= daily_budget * 0.1:
                 score += 15
                 reasoning_parts.append("Affordable within your budget")
-            elif food.current_price and food.current_price > daily_budget * 0.3:
+            elif price and price > daily_budget * 0.3:
                 score -= 20
                 reasoning_parts.append("May exceed budget constraints")
         
@@ -206,17 +280,17 @@ class RecommendationEngine:
         if nutrition_score >= 3:
             reasoning_parts.append("Rich in essential nutrients")
         
-        # 5. User history (collaborative filtering aspect)
-        recent_logs = FoodLog.query.filter_by(
-            user_id=user.id
-        ).order_by(FoodLog.consumed_at.desc()).limit(10).all()
+        return score, reasoning_parts
+    
+    def _apply_history(self, food, score, reasoning_parts, recent_food_ids):
+        """Add the eating-history boost and build the final reasoning"""
+        reasoning_parts = list(reasoning_parts)
         
-        if recent_logs:
-            recent_food_ids = [log.food_item_id for log in recent_logs]
-            if food.id in recent_food_ids:
-                # Slight boost for foods user has eaten before
-                score += 5
-                reasoning_parts.append("Based on your eating history")
+        # 5. User history (collaborative filtering aspect)
+        if food.id in recent_food_ids:
+            # Slight boost for foods user has eaten before
+            score += 5
+            reasoning_parts.append("Based on your eating history")
         
         # 6. ML-based similarity (if we have user preferences)
         # This would use collaborative filtering or content-based filtering
@@ -237,20 +311,9 @@ class RecommendationEngine:
             return base_serving
     
     def _estimate_cost(self, food, user):
-        """Estimate cost for a serving"""
-        if not food.current_price:
-            return 0
-        
+        """Estimate cost for a serving at the user's market"""
         serving_size = self._calculate_serving_size(user, food)
-        
-        # Convert to cost per serving
-        if food.price_unit == 'kg':
-            cost_per_gram = food.current_price / 1000
-            return cost_per_gram * serving_size
-        elif food.price_unit == 'piece':
-            return food.current_price
-        else:
-            return food.current_price * (serving_size / 100)
+        return cost_estimator.estimate([(food.id, serving_size)], user.location)
     
     def _extract_features(self, user, food):
         """Extract features for ML model"""
@@ -263,7 +326,7 @@ class RecommendationEngine:
             'food_carbs': food.carbohydrates or 0,
             'food_fiber': food.fiber or 0,
             'food_gi': food.glycemic_index or 50,
-            'food_price': food.current_price or 0
+            'food_price': catalog.snapshot().price_for(food.id, user.location) or 0
         }
     
     def explain_recommendation(self, recommendation):
@@ -310,3 +373,40 @@ class RecommendationEngine:
         
         return explanation
 
+
+def update_recommendation_costs(event):
+    """
+    Price change subscriber: re-price pending recommendations of the changed foods
+    
+    Accepted and rejected recommendations keep the cost they were shown with.
+    Only the process that made the change re-prices, so it happens once.
+    """
+    if not event.local or event.food_ids is None:
+        return
+    food_ids = list(event.food_ids)
+    for start in range(0, len(food_ids), 500):
+        rows = db.session.query(
+            Recommendation.id, Recommendation.food_item_id, Recommendation.serving_size, User.location
+        ).join(User, Recommendation.user_id == User.id).filter(
+            Recommendation.food_item_id.in_(food_ids[start:start + 500]),
+            Recommendation.is_accepted.is_(None)
+        ).all()
+        if not rows:
+            continue
+        
+        by_location = {}
+        for row in rows:
+            by_location.setdefault(row.location, []).append(row)
+        
+        updates = []
+        for location, location_rows in by_location.items():
+            costs = cost_estimator.item_costs(
+                [(row.food_item_id, row.serving_size or 100) for row in location_rows], location
+            )
+            updates.extend(
+                {'id': row.id, 'estimated_cost': float(cost)}
+                for row, cost in zip(location_rows, costs)
+            )
+        
+        db.session.execute(update(Recommendation), updates)
+        db.session.commit()
@@ -0,0 +1,96 @@
+"""
+Chatbot Response Cache
+Caches response fragments for intents that depend only on catalog data and a few profile fields
+"""
+import os
+import threading
+from collections import OrderedDict
+from app.services.catalog import catalog
+
+
+class ResponseCache:
+    """Thread-safe LRU cache keyed by (intent, key), scoped to the catalog version"""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or int(os.getenv('CHATBOT_RESPONSE_CACHE_SIZE', 2000))
+        self._entries = OrderedDict()
+        self._depends_on = {}  # cache key -> frozenset of food ids, or None for any price
+        self._version = catalog.version
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_set(self, intent, key, compute, depends_on=None):
+        """
+        Return the cached value for (intent, key), computing it on a miss
+
+        Args:
+            intent: Intent the fragment belongs to
+            key: Hashable tuple of everything the fragment depends on
+            compute: Zero-argument callable producing the value
+            depends_on: Food ids whose price changes invalidate the value;
+                None means any price change, () means prices don't matter
+        """
+        cache_key = (intent, key)
+        # Pick up changes other processes made (throttled to one read per sync interval);
+        # their price change events patch this cache before sync returns
+        catalog.sync()
+        with self._lock:
+            # A version ahead of ours means its event is still on its way: bypass, don't clear
+            current = self._version == catalog.version
+            if current and cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return self._entries[cache_key]
+            self.misses += 1
+            version = self._version
+
+        value = compute()
+
+        with self._lock:
+            # Don't store values computed against a catalog that has since changed
+            if current and version == self._version == catalog.version:
+                self._entries[cache_key] = value
+                self._entries.move_to_end(cache_key)
+                self._depends_on[cache_key] = frozenset(depends_on) if depends_on is not None else None
+                while len(self._entries) > self.max_entries:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self._depends_on.pop(evicted, None)
+        return value
+
+    def on_price_change(self, event):
+        """Drop only the entries that depend on the changed foods' prices"""
+        with self._lock:
+            if event.food_ids is None:
+                # Anything may have changed (or the change log was reset)
+                self._entries.clear()
+                self._depends_on.clear()
+                self._version = event.version
+                return
+            if self._version != event.previous_version:
+                # Missed an intermediate change or got it out of order; nothing here can be trusted
+                self._entries.clear()
+                self._depends_on.clear()
+            else:
+                for cache_key, food_ids in list(self._depends_on.items()):
+                    if food_ids is None or food_ids & event.food_ids:
+                        del self._entries[cache_key]
+                        del self._depends_on[cache_key]
+            self._version = max(self._version, event.version)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._depends_on.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'catalog_version': self._version
+            }
+
+
+response_cache = ResponseCache()
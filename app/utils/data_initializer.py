@@ -350,5 +350,8 @@ def initialize_default_data():
         db.session.add(food)
     
     db.session.commit()
+    
+    from app.services.catalog import catalog
+    catalog.bump_version()
     print("Default food items initialized successfully!")
 
@@ -0,0 +1,219 @@
+"""
+Market Price API Simulator
+Local stand-in for the external food price API, for load and integration tests
+
+Serves the same endpoints PriceAPIService calls:
+    GET  <prefix>/<food_id>?name=&location=     one quote
+    POST <prefix>/bulk                          {'location', 'items': [{id, name}]}
+    GET  /_stats                                request counters
+
+Prices are deterministic per (food id, location, refresh round), and the
+error and latency behaviour comes from a seeded RNG, so runs are reproducible.
+
+Usage:
+    python -m app.utils.price_simulator --port 8099 --latency-ms 50 --error-rate 0.05
+    FOOD_PRICE_API_URL=http://127.0.0.1:8099/prices flask price-worker --once
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import datetime
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+
+class PriceSimulator:
+    """WSGI app imitating a market price API with latency, errors and rate limits"""
+
+    def __init__(self, prefix='/prices', latency_ms=0.0, latency_jitter_ms=0.0, error_rate=0.0,
+                 rate_limit=0, bulk_enabled=True, max_bulk_items=500, base_price=3000.0, seed=42):
+        """
+        Args:
+            prefix: URL path the API is mounted at
+            latency_ms: Mean added latency per request
+            latency_jitter_ms: Uniform +/- jitter around latency_ms
+            error_rate: Fraction of requests answered with 503
+            rate_limit: Max requests per second (0 = unlimited); excess gets 429
+            bulk_enabled: Serve POST <prefix>/bulk (404 otherwise)
+            max_bulk_items: Largest bulk request accepted (413 above)
+            base_price: Centre of the generated price range in UGX
+            seed: RNG seed for latency and error decisions
+        """
+        self.prefix = '/' + prefix.strip('/')
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.bulk_enabled = bulk_enabled
+        self.max_bulk_items = max_bulk_items
+        self.base_price = base_price
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._quote_rounds = {}  # (food_id, location) -> times quoted
+        self.stats = {'requests': 0, 'quotes': 0, 'bulk_requests': 0, 'errors': 0, 'throttled': 0}
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        path = environ.get('PATH_INFO', '')
+
+        if path == '/_stats':
+            with self._lock:
+                return self._json(start_response, '200 OK', dict(self.stats))
+
+        with self._lock:
+            self.stats['requests'] += 1
+            throttled = self._throttled()
+            failed = not throttled and self._rng.random() < self.error_rate
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.latency_jitter_ms, self.latency_jitter_ms))
+            if throttled:
+                self.stats['throttled'] += 1
+            elif failed:
+                self.stats['errors'] += 1
+
+        if delay:
+            time.sleep(delay / 1000.0)
+        if throttled:
+            return self._json(start_response, '429 Too Many Requests', {'error': 'rate limited'},
+                              [('Retry-After', '1')])
+        if failed:
+            return self._json(start_response, '503 Service Unavailable', {'error': 'simulated outage'})
+
+        if not path.startswith(self.prefix + '/'):
+            return self._json(start_response, '404 Not Found', {'error': 'not found'})
+        resource = path[len(self.prefix) + 1:]
+
+        if resource == 'bulk' and method == 'POST':
+            if not self.bulk_enabled:
+                return self._json(start_response, '404 Not Found', {'error': 'bulk quotes not supported'})
+            return self._bulk(environ, start_response)
+        if resource.isdigit() and method == 'GET':
+            query = parse_qs(environ.get('QUERY_STRING', ''))
+            location = query.get('location', ['Kampala'])[0]
+            return self._json(start_response, '200 OK', self._quote(int(resource), location))
+        return self._json(start_response, '404 Not Found', {'error': 'not found'})
+
+    def _bulk(self, environ, start_response):
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            body = json.loads(environ['wsgi.input'].read(length) or b'{}')
+            items = body.get('items', [])
+            location = body.get('location') or 'Kampala'
+        except (ValueError, AttributeError):
+            return self._json(start_response, '400 Bad Request', {'error': 'invalid JSON body'})
+
+        if len(items) > self.max_bulk_items:
+            return self._json(start_response, '413 Payload Too Large',
+                              {'error': f'at most {self.max_bulk_items} items per request'})
+
+        with self._lock:
+            self.stats['bulk_requests'] += 1
+        quotes = []
+        for item in items:
+            quote = self._quote(int(item['id']), location)
+            quote['id'] = int(item['id'])
+            quotes.append(quote)
+        return self._json(start_response, '200 OK', {'prices': quotes})
+
+    def _quote(self, food_id, location):
+        """Deterministic price: stable per food and market, drifting each round"""
+        key = (food_id, location)
+        with self._lock:
+            quote_round = self._quote_rounds.get(key, 0)
+            self._quote_rounds[key] = quote_round + 1
+            self.stats['quotes'] += 1
+
+        food_level = 0.5 + (zlib.crc32(f'{food_id}'.encode('utf-8')) % 1000) / 1000.0
+        market_level = 0.9 + (zlib.crc32(location.encode('utf-8')) % 21) / 100.0
+        drift = 1.0 + ((zlib.crc32(f'{food_id}:{location}:{quote_round}'.encode('utf-8')) % 41) - 20) / 100.0
+        return {
+            'price': round(self.base_price * food_level * market_level * drift, 2),
+            'location': location,
+            'source': 'simulator',
+            'timestamp': datetime.utcnow().isoformat()
+        }
+
+    def _throttled(self):
+        """Fixed one-second window rate limit; call with the lock held"""
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        if now - self._window_start >= 1.0:
+            self._window_start = now
+            self._window_count = 0
+        self._window_count += 1
+        return self._window_count > self.rate_limit
+
+    def _json(self, start_response, status, payload, extra_headers=()):
+        body = json.dumps(payload).encode('utf-8')
+        start_response(status, [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body)))
+        ] + list(extra_headers))
+        return [body]
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def run_in_thread(host='127.0.0.1', port=0, **options):
+    """
+    Start a simulator on a background thread
+
+    Args:
+        host, port: Address to bind (port 0 picks a free port)
+        options: PriceSimulator settings
+
+    Returns:
+        Tuple of (server, simulator, api_url); call server.shutdown() when done
+    """
+    simulator = PriceSimulator(**options)
+    server = make_server(host, port, simulator, server_class=_ThreadingWSGIServer, handler_class=_QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, name='price-simulator', daemon=True)
+    thread.start()
+    api_url = f"http://{host}:{server.server_port}{simulator.prefix}"
+    return server, simulator, api_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local market price API simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--prefix', default='/prices')
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--latency-jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=int, default=0, help='Requests per second, 0 for unlimited')
+    parser.add_argument('--no-bulk', action='store_true', help='Disable the bulk endpoint')
+    parser.add_argument('--max-bulk-items', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    simulator = PriceSimulator(
+        prefix=args.prefix, latency_ms=args.latency_ms, latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate, rate_limit=args.rate_limit, bulk_enabled=not args.no_bulk,
+        max_bulk_items=args.max_bulk_items, seed=args.seed
+    )
+    server = make_server(args.host, args.port, simulator, server_class=_ThreadingWSGIServer)
+    print(f"Price simulator on http://{args.host}:{args.port}{simulator.prefix} (CTRL+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,90 @@
+"""
+Schema Upgrade
+Brings an existing database up to the models: adds missing tables, columns and indexes
+"""
+import warnings
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import SAWarning
+from app import db
+
+
+def upgrade_schema():
+    """
+    Create tables, columns and indexes declared on the models but missing from the database
+
+    db.create_all() skips tables that already exist, so columns and indexes
+    added to an existing model never reach databases created before them
+    (reads then fail with "no such column"). This runs at startup and only
+    adds objects; a brand-new (empty) database is left to db.create_all()
+    and initialize_default_data().
+
+    Returns:
+        List of created table, column (table.column) and index names
+    """
+    import app.models  # noqa: F401 - register every model on the metadata
+
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    if not existing_tables:
+        return []
+
+    created = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            table.create(db.engine, checkfirst=True)
+            created.append(table.name)
+            continue
+
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns and _add_column(table, column):
+                created.append(f'{table.name}.{column.name}')
+
+        existing_indexes = _index_names(inspector, table.name)
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            try:
+                index.create(db.engine, checkfirst=True)
+                created.append(index.name)
+            except Exception as e:
+                # Another process may have created it first
+                print(f"Error creating index {index.name}: {str(e)}")
+
+    if created:
+        print(f"Schema upgraded: created {', '.join(created)}")
+    return created
+
+
+def _index_names(inspector, table_name):
+    """Names of a table's indexes, including expression indexes SQLite reflection skips"""
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', 'Skipped unsupported reflection of expression-based index', SAWarning)
+        names = {index['name'] for index in inspector.get_indexes(table_name)}
+    if db.engine.dialect.name == 'sqlite':
+        with db.engine.connect() as connection:
+            names.update(connection.execute(
+                text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+                {'table': table_name}
+            ).scalars())
+    return names
+
+
+def _add_column(table, column):
+    """ALTER TABLE ... ADD COLUMN for a nullable column; returns True if added"""
+    if not column.nullable:
+        print(f"Cannot add NOT NULL column {table.name}.{column.name}; migrate it by hand")
+        return False
+
+    preparer = db.engine.dialect.identifier_preparer
+    column_type = column.type.compile(dialect=db.engine.dialect)
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(text(
+                f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column_type}'
+            ))
+        return True
+    except Exception as e:
+        # Another process may have added it first
+        print(f"Error adding column {table.name}.{column.name}: {str(e)}")
+        return False
@@ -0,0 +1,119 @@
+"""
+Price refresh benchmark
+Runs PriceAPIService.update_food_prices against the local price simulator and
+reports wall time, HTTP requests, simulated failures and SQL statements for
+several fetch configurations.
+
+Usage:
+    python benchmark_price_api.py
+    python benchmark_price_api.py --foods 5000 --latency-ms 40 --error-rate 0.02
+    python benchmark_price_api.py --rate-limit 200 --markets Kampala,Gulu,Mbarara
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# (label, PriceAPIService settings)
+SCENARIOS = [
+    ('sequential', {'max_workers': 1, 'bulk_size': 0}),
+    ('concurrent x8', {'max_workers': 8, 'bulk_size': 0}),
+    ('concurrent x32', {'max_workers': 32, 'bulk_size': 0}),
+    ('bulk 100 x4', {'max_workers': 4, 'bulk_size': 100}),
+    ('bulk 500 x4', {'max_workers': 4, 'bulk_size': 500}),
+]
+
+
+def setup_database(foods):
+    """Scratch database with `foods` synthetic food items"""
+    work_dir = tempfile.mkdtemp(prefix='zoe_price_bench_')
+    os.environ.setdefault('SECRET_KEY', 'benchmark-only')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(work_dir, 'benchmark.db').replace('\\', '/')
+    os.chdir(work_dir)
+
+    from app import create_app, db
+    from app.models import FoodItem
+    from sqlalchemy import insert
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        categories = ['grains', 'vegetables', 'fruits', 'proteins']
+        db.session.execute(insert(FoodItem), [{
+            'name': f'Benchmark food {i}',
+            'category': categories[i % len(categories)],
+            'current_price': 1000 + (i % 50) * 100,
+            'price_unit': 'kg',
+            'is_affordable': True
+        } for i in range(foods)])
+        db.session.commit()
+    return app, db
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Price refresh benchmark')
+    parser.add_argument('--foods', type=int, default=2000)
+    parser.add_argument('--markets', default='Kampala,Gulu', help='Comma-separated FOOD_PRICE_MARKETS')
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--latency-jitter-ms', type=float, default=5.0)
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    parser.add_argument('--rate-limit', type=int, default=0, help='Simulator requests per second, 0 for unlimited')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ['FOOD_PRICE_MARKETS'] = args.markets
+    # Keep retries quick so failures show up as retries, not as sleeping
+    os.environ.setdefault('FOOD_PRICE_API_BACKOFF', '0.05')
+    os.environ.setdefault('FOOD_PRICE_API_MAX_BACKOFF', '1')
+
+    app, db = setup_database(args.foods)
+    from app.services.price_api import PriceAPIService
+    from app.utils.price_simulator import run_in_thread
+    from sqlalchemy import event
+
+    print("=" * 70)
+    print("ZOE NutriTech - Price Refresh Benchmark")
+    print("=" * 70)
+    print(f"{args.foods} foods x {len(args.markets.split(','))} markets, latency {args.latency_ms}ms "
+          f"+/- {args.latency_jitter_ms}ms, error rate {args.error_rate:.1%}, "
+          f"rate limit {args.rate_limit or 'none'}")
+    print(f"\n   {'scenario':18} {'seconds':>8} {'updated':>8} {'requests':>9} {'errors':>7} "
+          f"{'429s':>6} {'sql':>6} {'foods/s':>8}")
+
+    statements = {'count': 0}
+    main_thread = threading.get_ident()
+    with app.app_context():
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_statement(*_):
+            if threading.get_ident() == main_thread:
+                statements['count'] += 1
+
+    for label, settings in SCENARIOS:
+        server, simulator, api_url = run_in_thread(
+            latency_ms=args.latency_ms, latency_jitter_ms=args.latency_jitter_ms,
+            error_rate=args.error_rate, rate_limit=args.rate_limit, seed=args.seed
+        )
+        try:
+            with app.app_context():
+                service = PriceAPIService(api_url=api_url, **settings)
+                statements['count'] = 0
+                started = time.perf_counter()
+                updated = service.update_food_prices(force=True, chunk_size=args.chunk_size)
+                elapsed = time.perf_counter() - started
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        stats = simulator.stats
+        print(f"   {label:18} {elapsed:8.2f} {updated:8d} {stats['requests']:9d} {stats['errors']:7d} "
+              f"{stats['throttled']:6d} {statements['count']:6d} {updated / elapsed if elapsed else 0:8.1f}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
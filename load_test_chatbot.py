@@ -0,0 +1,317 @@
+"""
+Chatbot load test
+Drives the chatbot with a scripted corpus of nutrition questions and reports
+per-intent latency, database queries per message and throughput at several
+concurrency levels.
+
+Usage:
+    python load_test_chatbot.py                          # in-process, temporary database
+    python load_test_chatbot.py --concurrency 1,8,64 --messages 40
+    python load_test_chatbot.py --mode http --base-url http://localhost:5000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+# Realistic questions from Ugandan users, grouped by the intent they should hit
+CORPUS = {
+    'greeting': [
+        "Hello ZOE",
+        "Hi there, good morning",
+        "Hey, greetings from Gulu",
+    ],
+    'food_recommendation': [
+        "What should I eat for breakfast?",
+        "Recommend a lunch for me",
+        "Suggest a cheap dinner meal with matooke",
+        "What should i eat as a snack in the afternoon?",
+        "Can you recommend food for my family supper?",
+    ],
+    'nutrition_info': [
+        "How many calories are in matooke?",
+        "What is the protein in beans?",
+        "Tell me the nutrition of groundnuts",
+        "What about its protein?",
+        "Vitamin content of mango",
+        "Nutrient value of tilapia",
+    ],
+    'diabetes_advice': [
+        "Is posho bad for my blood sugar?",
+        "I have diabetes, what about glucose after meals?",
+        "How do I keep my blood sugar stable?",
+        "Which foods have a low glycemic index?",
+    ],
+    'weight_management': [
+        "I want to lose weight",
+        "How can I gain weight healthily?",
+        "Is my weight okay for my height?",
+    ],
+    'budget': [
+        "What is affordable at Owino market this week?",
+        "I have a small budget, what can I buy?",
+        "What is the price of rice now?",
+        "Cheap foods for a student",
+    ],
+    'recipe': [
+        "Recipe for groundnut sauce",
+        "How to cook matooke the Buganda way",
+        "How do I prepare it?",
+    ],
+    'goodbye': [
+        "Thank you ZOE",
+        "Bye, see you tomorrow",
+    ],
+    'general': [
+        "Who are you?",
+        "Help",
+    ],
+}
+
+# Profiles cycled across simulated users
+PROFILES = [
+    {'has_diabetes': True, 'diabetes_type': 'type2', 'primary_goal': 'lose_weight', 'monthly_budget': 300000},
+    {'has_diabetes': True, 'diabetes_type': 'type1', 'primary_goal': 'healthy_eating', 'monthly_budget': 600000},
+    {'has_diabetes': False, 'diabetes_type': None, 'primary_goal': 'gain_weight', 'monthly_budget': 150000},
+    {'has_diabetes': False, 'diabetes_type': None, 'primary_goal': 'healthy_eating', 'monthly_budget': None},
+]
+
+
+def build_script(rng, count):
+    """Pick a conversation of `count` messages spread across all intents"""
+    intents = list(CORPUS)
+    script = []
+    for _ in range(count):
+        intent = rng.choice(intents)
+        script.append((intent, rng.choice(CORPUS[intent])))
+    return script
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Results:
+    """Thread-safe collector of per-message measurements"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.mismatches = defaultdict(int)
+        self.errors = 0
+
+    def add(self, intent, expected, seconds, queries):
+        with self.lock:
+            self.latencies[intent].append(seconds * 1000)
+            if queries is not None:
+                self.queries[intent].append(queries)
+            if expected != intent:
+                self.mismatches[expected] += 1
+
+    def add_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def total(self):
+        return sum(len(values) for values in self.latencies.values())
+
+
+class InProcessDriver:
+    """Calls ChatbotService.process_message directly against a scratch database"""
+
+    def __init__(self, users):
+        self.work_dir = tempfile.mkdtemp(prefix='zoe_load_')
+        os.environ.setdefault('SECRET_KEY', 'load-test-only')
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(self.work_dir, 'load_test.db').replace('\\', '/')
+        os.chdir(self.work_dir)
+
+        from app import create_app, db
+        from app.models import User
+        from app.utils.data_initializer import initialize_default_data
+        from app.services.chatbot_service import ChatbotService
+        from sqlalchemy import event
+
+        self.app = create_app()
+        self.db = db
+        self.User = User
+        self.service = ChatbotService()
+        self.local = threading.local()
+
+        with self.app.app_context():
+            db.create_all()
+            initialize_default_data()
+            self.user_ids = []
+            for i in range(users):
+                user = User(username=f'load_user_{i}', email=f'load_user_{i}@example.com',
+                            first_name=f'User{i}', **PROFILES[i % len(PROFILES)])
+                user.set_password('load-test')
+                db.session.add(user)
+                db.session.flush()
+                self.user_ids.append(user.id)
+            db.session.commit()
+
+            # Count statements issued by the simulated user threads only
+            @event.listens_for(db.engine, 'before_cursor_execute')
+            def count_query(*args):
+                if getattr(self.local, 'counting', False):
+                    self.local.queries += 1
+
+    def run_user(self, slot, script, results):
+        with self.app.app_context():
+            user = self.db.session.get(self.User, self.user_ids[slot % len(self.user_ids)])
+            for expected, message in script:
+                self.local.queries = 0
+                self.local.counting = True
+                started = time.perf_counter()
+                try:
+                    reply = self.service.process_message(user, message)
+                except Exception as e:
+                    self.local.counting = False
+                    self.db.session.rollback()
+                    print(f"   [ERROR] {message!r}: {e}")
+                    results.add_error()
+                    continue
+                elapsed = time.perf_counter() - started
+                self.local.counting = False
+                results.add(reply['intent'], expected, elapsed, self.local.queries)
+
+    def finish(self):
+        from app.services.chat_history_writer import history_writer
+        with self.app.app_context():
+            history_writer.flush()
+
+
+class HttpDriver:
+    """Posts to the chatbot message endpoint of a running server"""
+
+    def __init__(self, base_url, message_path, users):
+        import requests
+        self.requests = requests
+        self.base_url = base_url.rstrip('/')
+        self.message_path = message_path
+        self.run_id = int(time.time())
+        self.sessions = []
+        for i in range(users):
+            session = requests.Session()
+            username = f'load_{self.run_id}_{i}'
+            session.post(f'{self.base_url}/auth/register', data={
+                'username': username,
+                'email': f'{username}@example.com',
+                'password': 'load-test'
+            })
+            profile = PROFILES[i % len(PROFILES)]
+            session.post(f'{self.base_url}/onboarding', data={
+                'first_name': f'User{i}', 'last_name': 'Load', 'age': 35, 'gender': 'female',
+                'height': 165, 'weight': 70, 'activity_level': 'moderate',
+                'has_diabetes': 'yes' if profile['has_diabetes'] else 'no',
+                'diabetes_type': profile['diabetes_type'] or '',
+                'primary_goal': profile['primary_goal'],
+                'budget_range': 'low',
+                'monthly_budget': profile['monthly_budget'] or ''
+            })
+            self.sessions.append(session)
+
+    def run_user(self, slot, script, results):
+        session = self.sessions[slot % len(self.sessions)]
+        for expected, message in script:
+            started = time.perf_counter()
+            try:
+                response = session.post(f'{self.base_url}{self.message_path}', json={'message': message}, timeout=60)
+                reply = response.json()
+            except Exception as e:
+                print(f"   [ERROR] {message!r}: {e}")
+                results.add_error()
+                continue
+            elapsed = time.perf_counter() - started
+            if not reply.get('success'):
+                results.add_error()
+                continue
+            results.add(reply['intent'], expected, elapsed, None)
+
+    def finish(self):
+        pass
+
+
+def run_level(driver, concurrency, messages, seed):
+    """Run `concurrency` simulated users, each sending `messages` messages"""
+    results = Results()
+    scripts = [build_script(random.Random(seed + slot), messages) for slot in range(concurrency)]
+    threads = [
+        threading.Thread(target=driver.run_user, args=(slot, scripts[slot], results))
+        for slot in range(concurrency)
+    ]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return results, elapsed
+
+
+def report(concurrency, results, elapsed):
+    total = results.total()
+    throughput = total / elapsed if elapsed else 0
+    print(f"\nConcurrency {concurrency}: {total} messages in {elapsed:.2f}s "
+          f"({throughput:.1f} msg/s, {results.errors} errors)")
+    print(f"   {'intent':22} {'count':>6} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'queries':>8}")
+
+    rows = sorted(results.latencies.items(), key=lambda item: percentile(item[1], 95), reverse=True)
+    for intent, latencies in rows:
+        queries = results.queries.get(intent)
+        avg_queries = f"{sum(queries) / len(queries):8.1f}" if queries else f"{'n/a':>8}"
+        print(f"   {intent:22} {len(latencies):6d} {sum(latencies) / len(latencies):8.1f} "
+              f"{percentile(latencies, 50):8.1f} {percentile(latencies, 95):8.1f} "
+              f"{percentile(latencies, 99):8.1f} {max(latencies):8.1f} {avg_queries}")
+
+    if results.mismatches:
+        misses = ', '.join(f"{intent}: {count}" for intent, count in sorted(results.mismatches.items()))
+        print(f"   Messages detected as a different intent than scripted -> {misses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chatbot load test')
+    parser.add_argument('--mode', choices=['inprocess', 'http'], default='inprocess')
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--message-path', default='/message')
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32,64',
+                        help='Comma-separated list of simulated user counts')
+    parser.add_argument('--messages', type=int, default=20, help='Messages per simulated user')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    print("=" * 70)
+    print("ZOE NutriTech - Chatbot Load Test")
+    print("=" * 70)
+    print(f"Mode: {args.mode}, levels: {levels}, messages per user: {args.messages}")
+    print("Latencies in milliseconds; 'queries' is the mean number of SQL statements per message")
+
+    if args.mode == 'inprocess':
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        driver = InProcessDriver(users=max(levels))
+    else:
+        driver = HttpDriver(args.base_url, args.message_path, users=max(levels))
+
+    for concurrency in levels:
+        results, elapsed = run_level(driver, concurrency, args.messages, args.seed)
+        report(concurrency, results, elapsed)
+
+    driver.finish()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
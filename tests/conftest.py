@@ -0,0 +1,73 @@
+"""
+Test fixtures
+Each test runs against a fresh SQLite database seeded with the default foods
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Configure before the app is imported: scratch database, files in a temp dir
+WORK_DIR = tempfile.mkdtemp(prefix='zoe_tests_')
+os.environ.setdefault('SECRET_KEY', 'test-only')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORK_DIR, 'test.db').replace('\\', '/')
+os.environ['CONNECTIVITY_PROBE_INTERVAL_SECONDS'] = '0'
+os.environ['FOOD_PRICE_ARCHIVE_DIR'] = os.path.join(WORK_DIR, 'price_archive')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(WORK_DIR)
+
+from app import create_app, db  # noqa: E402
+from app.models import User  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app('testing')
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return app
+
+
+@pytest.fixture(autouse=True)
+def database(app):
+    """Fresh tables and default foods for every test, with in-memory caches reset"""
+    from app.services.chat_history_writer import history_writer
+    from app.services.conversation_context import context_store
+    from app.services.response_cache import response_cache
+    from app.utils.data_initializer import initialize_default_data
+
+    with app.app_context():
+        history_writer.flush()
+        db.drop_all()
+        db.create_all()
+        initialize_default_data()
+        response_cache.clear()
+        with context_store._lock:
+            context_store._contexts.clear()
+        yield db
+        history_writer.flush()
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user():
+    """Create a user with password 'pw'"""
+    def make(username='alice', **fields):
+        user = User(username=username, email=f'{username}@example.com', first_name=username.title(), **fields)
+        user.set_password('pw')
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def login(client):
+    def log_in(username):
+        return client.post('/auth/login', data={'username': username, 'password': 'pw'})
+    return log_in
@@ -0,0 +1,62 @@
+"""
+Chat history pagination and schema upgrade
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect, text
+
+from app import db
+from app.models import ChatHistory
+from app.utils.schema_upgrade import upgrade_schema
+
+
+def add_turns(user, count, created_at=None):
+    created_at = created_at or datetime(2026, 1, 1)
+    for number in range(count):
+        # Pairs of turns share a timestamp, so the id tie-breaker is exercised
+        db.session.add(ChatHistory(user_id=user.id, message=f'm{number}', response='r', intent='general',
+                                   created_at=created_at + timedelta(minutes=number // 2)))
+    db.session.commit()
+
+
+def test_history_pages_cover_every_turn_once(client, make_user, login):
+    user = make_user()
+    add_turns(user, 7)
+    login('alice')
+
+    seen = []
+    before_id = None
+    while True:
+        query = '/history?limit=3' + (f'&before_id={before_id}' if before_id else '')
+        page = client.get(query).get_json()
+        assert page['success']
+        seen.extend(turn['message'] for turn in page['history'])
+        before_id = page['next_before_id']
+        if before_id is None:
+            break
+
+    assert seen == [f'm{number}' for number in reversed(range(7))]
+
+
+def test_history_cursor_is_scoped_to_user(client, make_user, login):
+    alice = make_user('alice')
+    bob = make_user('bob')
+    add_turns(alice, 2)
+    add_turns(bob, 2)
+    bob_turn = ChatHistory.query.filter_by(user_id=bob.id).first()
+    login('alice')
+
+    page = client.get(f'/history?before_id={bob_turn.id}').get_json()
+    assert page['history'] == []
+
+
+def test_upgrade_adds_missing_indexes():
+    db.session.execute(text('DROP INDEX ix_chat_history_user_created'))
+    db.session.commit()
+
+    created = upgrade_schema()
+
+    assert 'ix_chat_history_user_created' in created
+    names = {index['name'] for index in inspect(db.engine).get_indexes('chat_history')}
+    assert 'ix_chat_history_user_created' in names
+    assert upgrade_schema() == []
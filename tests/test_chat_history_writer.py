@@ -0,0 +1,93 @@
+"""
+Chat history write-behind buffer
+"""
+import threading
+import time
+
+from app import db
+from app.models import ChatHistory
+from app.services.chat_history_writer import ChatHistoryWriter
+
+
+def make_writer(app, **settings):
+    writer = ChatHistoryWriter()
+    writer.app = app
+    for name, value in settings.items():
+        setattr(writer, name, value)
+    return writer
+
+
+def test_flush_waits_for_batch_being_written(app, make_user):
+    user = make_user()
+    writer = make_writer(app, batch_size=1, strict=False)
+
+    # Hold the flusher's insert until released, as if it were mid-write
+    release = threading.Event()
+    started = threading.Event()
+    execute = writer._execute
+
+    def slow_execute(rows):
+        started.set()
+        release.wait(5)
+        return execute(rows)
+
+    writer._execute = slow_execute
+    writer.init_app(app)
+    try:
+        writer.record(user.id, 'hello', 'reply', 'greeting', {})
+        assert started.wait(5)
+        assert writer.pending_count() == 0
+
+        flushed = threading.Event()
+        flusher = threading.Thread(target=lambda: (writer.flush(), flushed.set()))
+        flusher.start()
+        time.sleep(0.2)
+        assert not flushed.is_set()
+
+        release.set()
+        flusher.join(5)
+        assert flushed.is_set()
+        assert ChatHistory.query.filter_by(user_id=user.id).count() == 1
+    finally:
+        release.set()
+        writer.shutdown()
+
+
+def test_failed_batch_is_retried(app, make_user):
+    user = make_user()
+    writer = make_writer(app, strict=True)
+    execute = writer._execute
+    failures = {'left': 1}
+
+    def flaky_execute(rows):
+        if failures['left']:
+            failures['left'] -= 1
+            return False
+        return execute(rows)
+
+    writer._execute = flaky_execute
+    writer.record(user.id, 'hello', 'reply', 'greeting', {})
+    assert ChatHistory.query.count() == 0
+
+    writer.flush()
+    assert ChatHistory.query.filter_by(user_id=user.id, message='hello').count() == 1
+
+
+def test_bad_row_does_not_sink_batch(app, make_user):
+    user = make_user()
+    writer = make_writer(app, strict=True, max_retries=1)
+    rows = [
+        {'user_id': user.id, 'message': 'ok', 'response': 'r', 'intent': 'general', 'entities': '{}'},
+        {'user_id': user.id, 'message': None, 'response': 'r', 'intent': 'general', 'entities': '{}'},
+    ]
+    execute = writer._execute
+
+    def reject_none(batch):
+        if any(row['message'] is None for row in batch):
+            return False
+        return execute(batch)
+
+    writer._execute = reject_none
+    writer._write(rows)
+    db.session.expire_all()
+    assert [row.message for row in ChatHistory.query.all()] == ['ok']
@@ -0,0 +1,80 @@
+"""
+Chatbot HTTP endpoints
+"""
+import json
+
+from app.models import ChatHistory
+from app.routes import chatbot as chatbot_routes
+from app.services.chat_history_writer import history_writer
+
+
+def post_batch(client, user, key=None):
+    headers = {'X-API-Key': key} if key is not None else {}
+    return client.post('/message/batch', headers=headers,
+                       json={'messages': [{'user_id': user.id, 'message': 'nutrition of beans'}]})
+
+
+def test_batch_requires_the_configured_key(client, make_user, monkeypatch):
+    user = make_user()
+    monkeypatch.setenv('CHATBOT_BATCH_API_KEY', 'gateway-secret')
+
+    assert post_batch(client, user).status_code == 401
+    assert post_batch(client, user, key='guess').status_code == 401
+    assert ChatHistory.query.count() == 0
+
+    response = post_batch(client, user, key='gateway-secret')
+    assert response.status_code == 200 and response.get_json()['processed'] == 1
+
+
+def test_batch_is_disabled_without_a_configured_key(client, make_user, monkeypatch):
+    user = make_user()
+    monkeypatch.delenv('CHATBOT_BATCH_API_KEY', raising=False)
+
+    assert post_batch(client, user, key='anything').status_code == 503
+
+
+def sse_events(response):
+    events = []
+    for frame in response.get_data(as_text=True).strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in frame.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_stream_sends_chunks_then_done_and_saves_the_turn_once(client, make_user, login):
+    make_user()
+    login('alice')
+
+    response = client.post('/message/stream', json={'message': 'hello'})
+    events = sse_events(response)  # the body is generated as it is read
+    history_writer.flush()
+
+    assert response.mimetype == 'text/event-stream'
+    names = [event for event, _ in events]
+    assert names[:2] == ['meta', 'entities'] and names[-1] == 'done'
+    assert set(names[2:-1]) == {'chunk'}
+    done = events[-1][1]
+    assert done['intent'] == events[0][1]['intent'] == 'greeting'
+    assert done['response'] == ''.join(payload['text'] for event, payload in events if event == 'chunk')
+
+    rows = ChatHistory.query.all()
+    assert [(row.message, row.response, row.intent) for row in rows] == [('hello', done['response'], 'greeting')]
+
+
+def test_stream_error_ends_with_error_event_and_saves_nothing(client, make_user, login, monkeypatch):
+    make_user()
+    login('alice')
+
+    def failing_response(*args):
+        yield 'Here is the first part'
+        raise RuntimeError('recommendation engine down')
+
+    monkeypatch.setattr(chatbot_routes.chatbot_service, '_iter_response', failing_response)
+
+    response = client.post('/message/stream', json={'message': 'hello'})
+    events = sse_events(response)
+    history_writer.flush()
+
+    assert [event for event, _ in events] == ['meta', 'entities', 'chunk', 'error']
+    assert 'error' in events[-1][1]
+    assert ChatHistory.query.count() == 0
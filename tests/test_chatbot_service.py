@@ -0,0 +1,49 @@
+"""
+Chatbot batch processing and response fragments
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from app import db
+from app.models import ChatHistory
+from app.services.chatbot_service import ChatbotService
+from app.services.conversation_context import context_store
+
+
+@pytest.fixture
+def service():
+    return ChatbotService()
+
+
+def test_batch_follow_up_uses_earlier_message_in_batch(service, make_user):
+    user = make_user()
+
+    results = service.process_batch([
+        {'user_id': user.id, 'message': 'nutrition of beans'},
+        {'user_id': user.id, 'message': 'what about its protein?'},
+    ])
+
+    assert results[1]['entities'].get('food') == results[0]['entities']['food']
+    assert ChatHistory.query.filter_by(user_id=user.id).count() == 2
+    # Hydrated from the committed rows, without repeating the batch's turns
+    assert len(context_store.get_turns(user.id)) == 2
+
+
+def test_failed_batch_commit_leaves_context_untouched(service, make_user, monkeypatch):
+    user = make_user()
+    context_store.get_turns(user.id)
+
+    def fail():
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr(db.session, 'commit', fail)
+    with pytest.raises(RuntimeError):
+        service.process_batch([{'user_id': user.id, 'message': 'hello'}])
+
+    assert context_store.get_turns(user.id) == []
+
+
+def test_recommendation_for_removed_food_is_skipped(service):
+    recommendations = [SimpleNamespace(food_item_id=10 ** 6, reasoning='gone')]
+    assert 'trouble' in service._recommendation_fragments(recommendations)[0]
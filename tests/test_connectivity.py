@@ -0,0 +1,19 @@
+"""
+Connectivity monitor startup
+"""
+from app.services.connectivity import ConnectivityMonitor
+
+
+def test_probe_thread_starts_on_first_check(monkeypatch):
+    monitor = ConnectivityMonitor()
+    monitor.interval_seconds = 60
+    monkeypatch.setattr(monitor, 'probe', lambda: False)
+    assert monitor._thread is None
+
+    monitor.status()
+    thread = monitor._thread
+    monitor.is_online()
+    monitor.stop()
+
+    assert thread is not None and monitor._thread is thread
+    thread.join(timeout=5)
@@ -0,0 +1,33 @@
+"""
+Conversation context store
+"""
+from app import db
+from app.models import ChatHistory
+from app.services.conversation_context import ConversationContextStore
+
+
+def test_add_turn_on_miss_keeps_earlier_turns(make_user):
+    user = make_user()
+    db.session.add(ChatHistory(user_id=user.id, message='tell me about beans', response='r',
+                               intent='nutrition_info', entities='{"food": "Beans"}'))
+    db.session.commit()
+    store = ConversationContextStore(max_turns=5)
+
+    store.add_turn(user.id, 'greeting', {})
+
+    assert [turn['intent'] for turn in store.get_turns(user.id)] == ['nutrition_info', 'greeting']
+    assert store.last_entity(user.id, 'food') == 'Beans'
+
+
+def test_evicted_user_is_hydrated_again(make_user):
+    first = make_user('alice')
+    second = make_user('bob')
+    db.session.add(ChatHistory(user_id=first.id, message='m', response='r', intent='budget', entities='{}'))
+    db.session.commit()
+    store = ConversationContextStore(max_users=1)
+
+    store.get_turns(first.id)
+    store.get_turns(second.id)  # evicts the first user
+    store.add_turn(first.id, 'recipe', {'food': 'Matooke'})
+
+    assert [turn['intent'] for turn in store.get_turns(first.id)] == ['budget', 'recipe']
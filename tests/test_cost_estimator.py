@@ -0,0 +1,55 @@
+"""
+Meal cost estimation from the catalog snapshot
+"""
+import pytest
+
+from app import db
+from app.models import FoodItem, MarketPrice
+from app.routes.api import price_service
+from app.services.catalog import catalog
+from app.services.cost_estimator import cost_estimator
+
+
+@pytest.fixture
+def foods():
+    items = {
+        'per_kg': FoodItem(name='Test beans', category='legumes', current_price=4000, price_unit='kg'),
+        'per_piece': FoodItem(name='Test avocado', category='fruits', current_price=500, price_unit='piece'),
+        'per_100g': FoodItem(name='Test groundnut paste', category='legumes', current_price=300, price_unit='100g'),
+        'unpriced': FoodItem(name='Test greens', category='vegetables', current_price=None, price_unit='kg'),
+    }
+    db.session.add_all(items.values())
+    db.session.commit()
+    catalog.bump_version()
+    return {key: food.id for key, food in items.items()}
+
+
+def test_units_scale_with_quantity(foods):
+    costs = cost_estimator.item_costs([
+        (foods['per_kg'], 250),     # a quarter kilo
+        (foods['per_piece'], 250),  # one piece, whatever it weighs
+        (foods['per_100g'], 250),   # two and a half portions
+    ])
+
+    assert costs.tolist() == [1000.0, 500.0, 750.0]
+
+
+def test_unpriced_and_unknown_foods_cost_nothing(foods):
+    costs = cost_estimator.item_costs([(foods['unpriced'], 500), (999999, 100), (foods['per_kg'], None)])
+
+    assert costs.tolist() == [0.0, 0.0, 0.0]
+
+
+def test_meal_costs_are_totalled_per_meal_at_the_market(foods):
+    db.session.add(MarketPrice(food_item_id=foods['per_kg'], location='Gulu', price=3000))
+    db.session.commit()
+    catalog.apply_price_changes([foods['per_kg']])
+    meals = [
+        [(foods['per_kg'], 500), (foods['per_piece'], 1)],
+        [],
+        [(foods['unpriced'], 100)],
+    ]
+
+    assert price_service.estimate_meal_costs(meals) == [2500.0, 0.0, 0.0]
+    # Gulu quotes beans; the avocado falls back to the Kampala price
+    assert price_service.estimate_meal_costs(meals, location='Gulu') == [2000.0, 0.0, 0.0]
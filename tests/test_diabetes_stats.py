@@ -0,0 +1,47 @@
+"""
+Glucose statistics windows and weekly progress
+"""
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import DiabetesRecord
+from app.routes.diabetes import _analyze_progress, _calculate_diabetes_stats
+
+
+def add_reading(user, level, days_ago, entered_days_ago=0):
+    """A reading taken days_ago but entered (created_at) entered_days_ago"""
+    now = datetime.utcnow()
+    db.session.add(DiabetesRecord(
+        user_id=user.id, record_type='blood_glucose', blood_glucose_level=level,
+        measurement_time=now - timedelta(days=days_ago) if days_ago is not None else None,
+        created_at=now - timedelta(days=entered_days_ago)
+    ))
+    db.session.commit()
+
+
+def test_windows_use_the_time_a_reading_was_taken(make_user):
+    user = make_user()
+    add_reading(user, 100, days_ago=1)
+    # Synced today, taken 20 days ago
+    add_reading(user, 200, days_ago=20)
+    # No measurement time: falls back to created_at
+    add_reading(user, 150, days_ago=None, entered_days_ago=10)
+
+    stats = _calculate_diabetes_stats(user)
+
+    assert stats['windows'][7]['total_readings'] == 1
+    assert stats['windows'][14]['avg_glucose'] == 125.0
+    assert stats['windows'][30]['total_readings'] == 3
+    assert stats['windows'][30]['in_range_percentage'] == 66.7
+    assert stats['glucose_range'] == '100-200'
+
+
+def test_weekly_progress_buckets_by_time_taken(make_user):
+    user = make_user()
+    add_reading(user, 200, days_ago=21)
+    add_reading(user, 100, days_ago=0)
+
+    trends = _analyze_progress(user)['glucose_trends']
+
+    assert [week['average'] for week in trends] == [200.0, 100.0]
+    assert trends[1]['rolling_average'] == 150.0
@@ -0,0 +1,106 @@
+"""
+Bulk glucose import
+"""
+import io
+import json
+from datetime import datetime
+
+from app.models import DiabetesRecord
+
+
+def upload(client, body, filename=None, content_type=None, **args):
+    if filename:
+        return client.post('/record/import', query_string=args,
+                           data={'file': (io.BytesIO(body), filename)}, content_type='multipart/form-data')
+    return client.post('/record/import', query_string=args, data=body, content_type=content_type)
+
+
+def readings():
+    return {record.measurement_time: record.blood_glucose_level
+            for record in DiabetesRecord.query.filter_by(record_type='blood_glucose')}
+
+
+def test_format_is_detected_from_file_name_and_content_type(client, make_user, login):
+    make_user(has_diabetes=True)
+    login('alice')
+
+    csv_body = b'timestamp,glucose\n2026-01-01T08:00:00Z,100\n'
+    ndjson_body = b'{"time": "2026-01-02T08:00:00", "value": 110}\n'
+    json_body = json.dumps({'readings': [{'date': '2026-01-03T08:00:00', 'reading': 120}]}).encode()
+
+    summaries = [
+        upload(client, csv_body, filename='export.CSV').get_json()['summary'],
+        upload(client, ndjson_body, content_type='application/x-ndjson').get_json()['summary'],
+        upload(client, json_body, content_type='application/json').get_json()['summary'],
+    ]
+
+    assert [summary['imported'] for summary in summaries] == [1, 1, 1]
+    assert sorted(readings().values()) == [100, 110, 120]
+
+
+def test_duplicates_within_and_across_uploads_are_skipped(client, make_user, login):
+    make_user(has_diabetes=True)
+    login('alice')
+    body = b'time,glucose\n2026-01-01T08:00:00,100\n2026-01-01T08:00:00,105\n2026-01-01T08:05:00,110\n'
+
+    first = upload(client, body, filename='a.csv').get_json()['summary']
+    second = upload(client, body, filename='a.csv').get_json()['summary']
+
+    assert (first['imported'], first['duplicates']) == (2, 1)
+    assert (second['imported'], second['duplicates']) == (0, 3)
+    assert readings() == {datetime(2026, 1, 1, 8, 0): 100, datetime(2026, 1, 1, 8, 5): 110}
+
+
+def test_units_are_converted_to_mg_per_dl(client, make_user, login):
+    make_user(has_diabetes=True)
+    login('alice')
+    rows = [
+        {'time': '2026-01-01T08:00:00', 'glucose': 5.5},
+        {'time': '2026-01-01T09:00:00', 'glucose': 180, 'unit': 'mg/dL'},
+        {'time': '2026-01-01T10:00:00', 'glucose': 7, 'unit': 'ppm'},
+    ]
+
+    summary = upload(client, json.dumps(rows).encode(), content_type='application/json',
+                     unit='mmol/L').get_json()['summary']
+
+    assert (summary['imported'], summary['invalid']) == (2, 1)
+    assert readings() == {datetime(2026, 1, 1, 8, 0): 99.0, datetime(2026, 1, 1, 9, 0): 180}
+
+
+def test_epoch_milliseconds_and_latin1_csv(client, make_user, login):
+    make_user(has_diabetes=True)
+    login('alice')
+    # 2026-01-01T08:00:00Z in seconds and in milliseconds; the note is Latin-1
+    body = 'time,glucose,notes\n1767254400,100,caf\xe9\n1767254700000,110,ok\n'.encode('latin-1')
+
+    response = upload(client, body, filename='legacy.csv')
+
+    assert response.status_code == 200
+    assert response.get_json()['summary']['imported'] == 2
+    assert readings() == {datetime(2026, 1, 1, 8, 0): 100, datetime(2026, 1, 1, 8, 5): 110}
+
+
+def test_unreadable_csv_rows_are_counted_invalid(client, make_user, login):
+    make_user(has_diabetes=True)
+    login('alice')
+    oversized = b'x' * 200000  # beyond the csv module's field size limit
+    body = b'time,glucose,notes\n2026-01-01T08:00:00,100,a\n2026-01-01T08:05:00,110,' + oversized + \
+        b'\n2026-01-01T08:10:00,120,b\n'
+
+    response = upload(client, body, filename='a.csv')
+
+    summary = response.get_json()['summary']
+    assert (summary['imported'], summary['invalid']) == (2, 1)
+    assert summary['errors'][0]['error'].startswith('unreadable CSV row')
+
+
+def test_imported_rows_keep_their_real_creation_time(client, make_user, login):
+    make_user(has_diabetes=True)
+    login('alice')
+    before = datetime.utcnow()
+
+    upload(client, b'time,glucose\n2020-01-01T08:00:00,100\n', filename='old.csv')
+
+    record = DiabetesRecord.query.one()
+    assert record.measurement_time == datetime(2020, 1, 1, 8, 0)
+    assert record.created_at >= before
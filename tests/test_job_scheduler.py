@@ -0,0 +1,65 @@
+"""
+Background jobs and cross-process leases
+"""
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import JobLease
+from app.services.job_lease import job_leases
+from app.services.job_scheduler import JobScheduler
+
+
+def count_job(job, calls):
+    calls.append(job.id)
+    return {'calls': len(calls)}
+
+
+def test_leased_job_is_skipped_while_another_process_holds_it():
+    job_leases.acquire('price_refresh', 'other-host:1234:job')
+    scheduler = JobScheduler()
+    calls = []
+
+    job, created = scheduler.submit('price_refresh', count_job, lease=True, calls=calls)
+
+    assert created and job.status == 'skipped' and calls == []
+
+    job_leases.release('price_refresh', 'other-host:1234:job')
+    job, _ = scheduler.submit('price_refresh', count_job, lease=True, calls=calls)
+    assert job.status == 'succeeded' and len(calls) == 1
+    # Released after the run
+    assert db.session.get(JobLease, 'price_refresh') is None
+
+
+def test_expired_lease_can_be_taken_over():
+    db.session.add(JobLease(name='price_refresh', owner='crashed:1:job',
+                            expires_at=datetime.utcnow() - timedelta(seconds=1)))
+    db.session.commit()
+
+    assert job_leases.acquire('price_refresh', 'me:2:job')
+    assert not job_leases.renew('price_refresh', 'crashed:1:job')
+    assert not job_leases.acquire('price_refresh', 'someone-else:3:job')
+
+
+def test_lease_is_released_when_the_job_fails():
+    scheduler = JobScheduler()
+
+    def fail(job):
+        raise RuntimeError('API down')
+
+    job, _ = scheduler.submit('price_refresh', fail, lease=True)
+
+    assert job.status == 'failed'
+    assert job_leases.acquire('price_refresh', 'other-host:1234:job')
+
+
+def test_queues_keep_separate_history():
+    scheduler = JobScheduler()
+    scheduler.queues['offline_cache'] = (1, 2)
+    refresh, _ = scheduler.submit('price_refresh', count_job, calls=[])
+    caches = [scheduler.submit(f'offline_cache:{n}', count_job, queue='offline_cache', calls=[])[0]
+              for n in range(5)]
+
+    # Cache builds only evict each other
+    assert scheduler.get(refresh.id) is refresh
+    assert scheduler.get(caches[0].id) is None
+    assert scheduler.get(caches[-1].id).queue == 'offline_cache'
@@ -0,0 +1,74 @@
+"""
+Offline catalog and cache files
+"""
+import os
+
+from app.routes.api import offline_manager
+from app.services import offline_manager as offline_module
+from app.services.catalog import catalog
+from app.services.job_scheduler import Job
+
+
+def test_plain_json_is_moved_into_place_after_every_variant(monkeypatch):
+    replaced = []
+    real_replace = os.replace
+
+    def record(src, dst):
+        replaced.append(dst)
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, 'replace', record)
+    offline_manager._write_catalog_files('ordering', catalog.snapshot().foods)
+
+    assert len(replaced) > 1
+    assert replaced[-1] == offline_manager.catalog_path('ordering')
+    assert all(os.path.exists(path) for path in replaced)
+
+
+def test_reenabling_offline_mode_drops_the_stale_cache(client, make_user, login, monkeypatch):
+    user = make_user(offline_mode_enabled=True)
+    login('alice')
+    offline_manager._save_cached_data(user.id, {'stale': True})
+    stale_etag = offline_manager.data_etag(user.id)
+    # Leave the rebuild queued, as it is while the worker is busy
+    queued = Job(f'offline_cache:{user.id}', 'offline_cache')
+    monkeypatch.setattr(offline_module.job_scheduler, 'submit', lambda *args, **kwargs: (queued, True))
+    monkeypatch.setattr(offline_module.job_scheduler, 'active', lambda name: queued)
+
+    client.post('/api/offline/enable')
+    response = client.get('/api/offline/data', headers={'If-None-Match': f'"{stale_etag}"'})
+
+    assert response.status_code == 202
+    assert offline_manager.cache_etag(user.id) is None
+
+
+def test_matching_etag_gets_304_without_a_body(client, make_user, login):
+    user = make_user(offline_mode_enabled=True)
+    login('alice')
+    offline_manager._save_cached_data(user.id, {'user': {'id': user.id}, 'recommendations': [], 'goals': []})
+
+    first = client.get('/api/offline/data')
+    assert first.status_code == 200 and first.get_json()['data']['catalog_id']
+
+    again = client.get('/api/offline/data', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304 and again.data == b''
+    assert again.headers['ETag'] == first.headers['ETag']
+
+
+def test_each_encoding_variant_gets_its_own_etag(client, make_user, login):
+    user = make_user(offline_mode_enabled=True)
+    login('alice')
+    offline_manager._save_cached_data(user.id, {'user': {'id': user.id}, 'recommendations': [], 'goals': []})
+
+    plain = client.get('/api/offline/data')
+    gzipped = client.get('/api/offline/data', headers={'Accept-Encoding': 'gzip'})
+
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert plain.headers['ETag'] != gzipped.headers['ETag']
+    # A validator for one variant does not match the other
+    assert client.get('/api/offline/data', headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': plain.headers['ETag']
+    }).status_code == 200
+    assert client.get('/api/offline/data', headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': gzipped.headers['ETag']
+    }).status_code == 304
@@ -0,0 +1,82 @@
+"""
+Offline payload negotiation and encoding
+"""
+import gzip
+import json
+
+import pytest
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from app.services import offline_encoding
+from app.services.offline_encoding import JSON_TYPE, MSGPACK_TYPE
+
+PAYLOAD = {'catalog_id': 'abc', 'food_items': [{'id': 1, 'name': 'Beans', 'price': 4500.0}, {'id': 2, 'name': None}]}
+
+
+def request_with(**headers):
+    return Request(EnvironBuilder(headers=headers).get_environ())
+
+
+@pytest.fixture
+def all_codecs(monkeypatch):
+    monkeypatch.setattr(offline_encoding, 'MSGPACK_AVAILABLE', True)
+    monkeypatch.setattr(offline_encoding, 'BROTLI_AVAILABLE', True)
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({}, (JSON_TYPE, 'identity')),
+    ({'Accept': 'application/msgpack'}, (MSGPACK_TYPE, 'identity')),
+    ({'Accept': 'application/json, application/msgpack;q=0.5'}, (JSON_TYPE, 'identity')),
+    ({'Accept': 'application/msgpack, application/json;q=0.5', 'Accept-Encoding': 'gzip'}, (MSGPACK_TYPE, 'gzip')),
+    ({'Accept-Encoding': 'gzip, br'}, (JSON_TYPE, 'br')),
+    ({'Accept-Encoding': 'br;q=0.5, gzip'}, (JSON_TYPE, 'gzip')),
+])
+def test_accept_headers_select_the_variant(all_codecs, headers, expected):
+    assert offline_encoding.negotiate(request_with(**headers)) == expected
+
+
+def test_falls_back_when_encoders_are_not_installed(monkeypatch):
+    monkeypatch.setattr(offline_encoding, 'MSGPACK_AVAILABLE', False)
+    monkeypatch.setattr(offline_encoding, 'BROTLI_AVAILABLE', False)
+
+    request = request_with(**{'Accept': 'application/msgpack', 'Accept-Encoding': 'br, gzip;q=0.5'})
+    assert offline_encoding.negotiate(request) == (JSON_TYPE, 'gzip')
+    assert offline_encoding.negotiate(request_with(**{'Accept-Encoding': 'br'})) == (JSON_TYPE, 'identity')
+
+
+def test_each_variant_has_its_own_etag():
+    variants = [(media_type, encoding) for media_type in (JSON_TYPE, MSGPACK_TYPE)
+                for encoding in ('identity', 'gzip', 'br')]
+    etags = {offline_encoding.variant_etag('abc', *variant) for variant in variants}
+    assert len(etags) == len(variants)
+    assert offline_encoding.variant_etag('abc', JSON_TYPE, 'identity') == 'abc'
+
+
+def decode(body, media_type, encoding):
+    if encoding == 'gzip':
+        body = gzip.decompress(body)
+    elif encoding == 'br':
+        body = pytest.importorskip('brotli').decompress(body)
+    if media_type == MSGPACK_TYPE:
+        return pytest.importorskip('msgpack').unpackb(body, raw=False)
+    return json.loads(body)
+
+
+@pytest.mark.parametrize('media_type', [JSON_TYPE, MSGPACK_TYPE])
+@pytest.mark.parametrize('encoding', ['identity', 'gzip', 'br'])
+def test_variants_round_trip(media_type, encoding):
+    if media_type == MSGPACK_TYPE and not offline_encoding.MSGPACK_AVAILABLE:
+        pytest.skip('msgpack is not installed')
+    if encoding == 'br' and not offline_encoding.BROTLI_AVAILABLE:
+        pytest.skip('brotli is not installed')
+
+    body = offline_encoding.compress(offline_encoding.dumps(PAYLOAD, media_type), encoding)
+    assert decode(body, media_type, encoding) == PAYLOAD
+
+    # The streamed writer used for catalog files produces the same document
+    compressor = offline_encoding.StreamCompressor(encoding)
+    chunks = offline_encoding.encode_items({'catalog_id': 'abc'}, 'food_items', iter(PAYLOAD['food_items']),
+                                           media_type=media_type, count=len(PAYLOAD['food_items']))
+    streamed = b''.join(compressor.compress(chunk) for chunk in chunks) + compressor.flush()
+    assert decode(streamed, media_type, encoding) == PAYLOAD
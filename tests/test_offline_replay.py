@@ -0,0 +1,59 @@
+"""
+Idempotent replay of queued offline writes
+"""
+from app import db
+from app.models import FoodLog, Goal, GoalProgress, OfflineOperation
+from app.routes.api import offline_manager
+
+
+def food_log(key, minute, food_item_id=1):
+    return {'key': key, 'type': 'food_log',
+            'data': {'food_item_id': food_item_id, 'quantity': 1, 'consumed_at': f'2026-01-01T08:{minute:02d}:00'}}
+
+
+def replay(client, operations):
+    response = client.post('/api/offline/replay', json={'operations': operations})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_replaying_the_same_keys_writes_once(client, make_user, login):
+    make_user()
+    login('alice')
+    operations = [food_log('a', 0), food_log('b', 1), food_log('a', 0)]
+
+    first = replay(client, operations)
+    second = replay(client, operations)
+
+    assert first['summary'] == {'applied': 3, 'conflict': 0, 'invalid': 0, 'failed': 0, 'replayed': 1}
+    assert second['summary'] == {'applied': 3, 'conflict': 0, 'invalid': 0, 'failed': 0, 'replayed': 3}
+    assert [result['id'] for result in second['results']] == [result['id'] for result in first['results']]
+    assert FoodLog.query.count() == 2
+    assert OfflineOperation.query.count() == 2
+
+
+def test_failing_operation_does_not_abort_the_replay(client, make_user, login, monkeypatch):
+    user = make_user()
+    goal = Goal(user_id=user.id, goal_type='lose_weight', target_value=60, unit='kg')
+    db.session.add(goal)
+    db.session.commit()
+    login('alice')
+    real_apply = offline_manager._apply_goal_value
+
+    def apply(goal, value):
+        if value == 13:
+            raise RuntimeError('boom')
+        real_apply(goal, value)
+
+    monkeypatch.setattr(offline_manager, '_apply_goal_value', apply)
+    progress = [{'key': f'g{value}', 'type': 'goal_progress',
+                 'data': {'goal_id': goal.id, 'value': value, 'recorded_at': f'2026-01-0{day}T08:00:00'}}
+                for day, value in ((1, 70), (2, 13), (3, 68))]
+
+    body = replay(client, [food_log('f', 0)] + progress)
+
+    assert [result['status'] for result in body['results']] == ['applied', 'applied', 'failed', 'applied']
+    assert GoalProgress.query.count() == 2
+    # Failures are not stored, so the client can send them again
+    monkeypatch.setattr(offline_manager, '_apply_goal_value', real_apply)
+    assert replay(client, progress[1:2])['results'][0]['status'] == 'applied'
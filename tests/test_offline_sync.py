@@ -0,0 +1,76 @@
+"""
+Offline upload validation
+"""
+from app import db
+from app.models import Goal, GoalProgress
+
+
+def make_goal(user, **fields):
+    goal = Goal(user_id=user.id, goal_type='lose_weight', unit='kg', **fields)
+    db.session.add(goal)
+    db.session.commit()
+    return goal
+
+
+def test_kind_that_is_not_a_list_is_rejected(client, make_user, login):
+    make_user()
+    login('alice')
+
+    response = client.post('/api/offline/sync', json={'food_logs': 5})
+
+    assert response.status_code == 400
+    assert 'food_logs' in response.get_json()['error']
+
+
+def test_malformed_items_come_back_as_invalid_conflicts(client, make_user, login):
+    user = make_user()
+    goal = make_goal(user, target_value=70)
+    login('alice')
+
+    response = client.post('/api/offline/sync', json={
+        'food_logs': ['not an item', {'client_id': 'f1', 'food_item_id': [1], 'consumed_at': '2026-01-01T08:00:00'}],
+        'diabetes_records': [{'client_id': 'd1', 'record_type': 'glucose', 'blood_glucose_level': 'high',
+                              'measurement_time': '2026-01-01T08:00:00'}],
+        'goal_progress': [{'client_id': 'g1', 'goal_id': goal.id, 'value': 'heavy',
+                           'recorded_at': '2026-01-01T08:00:00'}]
+    })
+
+    assert response.status_code == 200
+    reasons = {(c['type'], c['client_id']): c['reason'] for c in response.get_json()['conflicts']}
+    assert reasons == {
+        ('food_logs', None): 'invalid',
+        ('food_logs', 'f1'): 'unknown_food',
+        ('diabetes_records', 'd1'): 'invalid',
+        ('goal_progress', 'g1'): 'invalid'
+    }
+
+
+def test_goal_without_target_takes_progress(client, make_user, login):
+    user = make_user()
+    goal = make_goal(user, target_value=0)
+    goal.goal_type = 'maintain_weight'
+    db.session.commit()
+    login('alice')
+
+    response = client.post('/api/offline/sync', json={'goal_progress': [
+        {'client_id': 'g1', 'goal_id': goal.id, 'value': 65, 'recorded_at': '2026-01-01T08:00:00'}
+    ]})
+
+    assert response.status_code == 200
+    assert db.session.get(Goal, goal.id).current_value == 65
+    assert db.session.get(Goal, goal.id).status == 'active'
+
+
+def test_goal_progress_applies_in_time_order_across_offsets(client, make_user, login):
+    user = make_user()
+    goal = make_goal(user, target_value=50)
+    login('alice')
+
+    # 09:00+03:00 is 06:00 UTC, earlier than 07:00Z although it sorts later as text
+    client.post('/api/offline/sync', json={'goal_progress': [
+        {'client_id': 'g1', 'goal_id': goal.id, 'value': 80, 'recorded_at': '2026-01-01T09:00:00+03:00'},
+        {'client_id': 'g2', 'goal_id': goal.id, 'value': 79, 'recorded_at': '2026-01-01T07:00:00Z'}
+    ]})
+
+    assert db.session.get(Goal, goal.id).current_value == 79
+    assert GoalProgress.query.count() == 2
@@ -0,0 +1,96 @@
+"""
+Price fetcher against the local market price API simulator
+"""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.models import FoodItem, MarketPrice
+from app.services import price_api
+from app.services.price_api import PriceAPIService
+from app.utils.price_simulator import run_in_thread
+
+
+@pytest.fixture
+def simulator():
+    servers = []
+
+    def start(**options):
+        server, sim, api_url = run_in_thread(**options)
+        servers.append(server)
+        return sim, api_url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Backoff delays requested by the fetcher; real sleeps are capped at 1s"""
+    delays = []
+
+    def record(delay):
+        delays.append(delay)
+        time.sleep(min(delay, 1.0))
+
+    monkeypatch.setattr(price_api, 'time', SimpleNamespace(sleep=record))
+    return delays
+
+
+def foods(count):
+    return [SimpleNamespace(id=number, name=f'food {number}', current_price=1000) for number in range(1, count + 1)]
+
+
+def test_transient_errors_are_retried_with_jitter(simulator, sleeps):
+    sim, api_url = simulator(error_rate=0.4, seed=7)
+    service = PriceAPIService(api_url=api_url, max_workers=4, max_retries=8)
+    service.backoff_seconds = 0.01
+    service.max_backoff_seconds = 0.05
+
+    prices = service.fetch_prices(foods(20))
+
+    assert len(prices) == 20
+    assert sim.stats['errors'] == len(sleeps) > 0
+    assert all(0 <= delay <= 0.05 for delay in sleeps)
+    assert len(set(sleeps)) > 1
+
+
+def test_retry_after_is_honoured(simulator, sleeps):
+    sim, api_url = simulator(rate_limit=1)
+    service = PriceAPIService(api_url=api_url, max_workers=1, max_retries=3)
+    service.backoff_seconds = 0.01
+    service.max_backoff_seconds = 1.0
+
+    prices = service.fetch_prices(foods(2))
+
+    assert len(prices) == 2
+    assert sim.stats['throttled'] >= 1
+    # Retry-After: 1 wins over the much shorter jittered backoff
+    assert sleeps and all(delay == 1.0 for delay in sleeps)
+
+
+def test_bulk_mode_batches_requests(simulator):
+    sim, api_url = simulator()
+    service = PriceAPIService(api_url=api_url, bulk_size=2)
+
+    prices = service.fetch_prices(foods(5), location='Gulu')
+
+    assert sorted(prices) == [1, 2, 3, 4, 5]
+    assert all(price['location'] == 'Gulu' for price in prices.values())
+    assert sim.stats['bulk_requests'] == 3
+    assert sim.stats['quotes'] == 5
+
+
+def test_update_food_prices_writes_simulated_quotes(simulator):
+    sim, api_url = simulator()
+    service = PriceAPIService(api_url=api_url, bulk_size=50)
+    service.markets = ['Kampala', 'Gulu']
+
+    updated = service.update_food_prices(force=True)
+
+    food_count = FoodItem.query.count()
+    assert updated == food_count
+    assert MarketPrice.query.filter_by(location='Gulu', source='simulator').count() == food_count
+    assert sim.stats['quotes'] == 2 * food_count
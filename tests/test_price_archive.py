@@ -0,0 +1,90 @@
+"""
+Price history compaction into archive files
+"""
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app import db
+from app.models import FoodItem, FoodPrice, PriceRollup
+from app.services import price_archive
+from app.services.price_archive import PriceArchiveService
+from app.services.price_rollups import price_rollups
+
+
+def add_history(food, start, days, per_day=3):
+    rows = []
+    for day in range(days):
+        for sample in range(per_day):
+            rows.append(FoodPrice(food_item_id=food.id, price=1000 + day * 10 + sample, location='Gulu',
+                                  source='api', recorded_at=start + timedelta(days=day, hours=sample)))
+    db.session.add_all(rows)
+    db.session.commit()
+    return rows
+
+
+def test_compaction_streams_months_into_mmap_archives(tmp_path, monkeypatch):
+    monkeypatch.setattr(price_archive, 'PYARROW_AVAILABLE', False)
+    beans, rice = FoodItem.query.order_by(FoodItem.id).limit(2).all()
+    start = datetime(2025, 1, 30)
+    add_history(beans, start, days=4)  # spans January and February
+    add_history(rice, start, days=1)
+    service = PriceArchiveService(archive_dir=str(tmp_path), chunk_size=4)
+
+    summary = service.compact(retention_days=30)
+
+    assert summary == {'rows': 15, 'files': 2}
+    assert FoodPrice.query.count() == 0
+    january = next(path for path in os.listdir(tmp_path) if path.startswith('food_prices-2025-01'))
+    ids = np.load(os.path.join(tmp_path, january, 'id.npy'), mmap_mode='r')
+    assert isinstance(ids, np.memmap) and len(ids) == 9
+
+    frame = service.load_archive(food_item_id=beans.id)
+    assert len(frame) == 12
+    assert set(frame['location']) == {'Gulu'} and set(frame['source']) == {'api'}
+    assert frame['price'].tolist() == sorted(frame['price'].tolist())
+
+    day_rollup = PriceRollup.query.filter_by(
+        food_item_id=beans.id, resolution='day', period_start=datetime(2025, 2, 1)
+    ).one()
+    assert day_rollup.sample_count == 3
+    assert (day_rollup.min_price, day_rollup.max_price, day_rollup.last_price) == (1020, 1022, 1022)
+
+
+def test_recompaction_replaces_day_rollups(tmp_path, monkeypatch):
+    monkeypatch.setattr(price_archive, 'PYARROW_AVAILABLE', False)
+    food = FoodItem.query.first()
+    add_history(food, datetime(2025, 3, 1), days=1)
+    service = PriceArchiveService(archive_dir=str(tmp_path), chunk_size=2)
+    price_rollups.rebuild()
+
+    service.compact(retention_days=30)
+
+    rollup = PriceRollup.query.filter_by(food_item_id=food.id, resolution='day').one()
+    assert rollup.sample_count == 3
+
+
+def test_second_compaction_in_a_month_keeps_earlier_rollups(tmp_path, monkeypatch):
+    monkeypatch.setattr(price_archive, 'PYARROW_AVAILABLE', False)
+    food = FoodItem.query.first()
+    add_history(food, datetime(2025, 3, 1), days=20)
+    price_rollups.rebuild()
+    service = PriceArchiveService(archive_dir=str(tmp_path), chunk_size=8)
+
+    class Clock(datetime):
+        now = datetime(2025, 3, 11)
+
+        @classmethod
+        def utcnow(cls):
+            return cls.now
+
+    monkeypatch.setattr(price_archive, 'datetime', Clock)
+    assert service.compact(retention_days=0)['rows'] == 30
+    Clock.now = datetime(2025, 3, 21)
+    assert service.compact(retention_days=0)['rows'] == 30
+
+    day_rollups = PriceRollup.query.filter_by(food_item_id=food.id, resolution='day').all()
+    assert len(day_rollups) == 20
+    assert all(rollup.sample_count == 3 for rollup in day_rollups)
+    assert len(service.load_archive(food_item_id=food.id)) == 60
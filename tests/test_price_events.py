@@ -0,0 +1,84 @@
+"""
+Price change events across processes
+"""
+import pytest
+
+from app import db
+from app.models import CatalogChange, Recommendation
+from app.routes.api import offline_manager
+from app.services import offline_manager as offline_module
+from app.services.catalog import FoodCatalog, catalog
+from app.services.job_scheduler import Job
+from app.services.price_events import price_events
+
+
+@pytest.fixture
+def events():
+    received = []
+    price_events.subscribe(received.append)
+    yield received
+    price_events.unsubscribe(received.append)
+
+
+def test_local_change_publishes_one_local_event(events):
+    food = catalog.snapshot().foods[0]
+
+    version = catalog.apply_price_changes([food.id])
+
+    assert [(event.version, event.food_ids, event.local) for event in events] == [(version, {food.id}, True)]
+    assert events[0].previous_version == version - 1
+
+
+def test_first_change_of_a_never_synced_process_keeps_its_food_ids(events):
+    catalog.bump_version()  # some history in the log
+    fresh = FoodCatalog()  # e.g. a new web worker or `flask price-worker --once`
+    food = catalog.snapshot().foods[0]
+
+    version = fresh.apply_price_changes([food.id])
+
+    local = [(event.version, event.food_ids) for event in events if event.local]
+    assert local[-1] == (version, {food.id})
+    assert not any(event.local and event.food_ids is None for event in events[1:])
+
+
+def test_change_from_another_process_is_published_as_remote(events):
+    catalog.sync(force=True)
+    previous = catalog.version
+    db.session.add(CatalogChange(food_ids='[1, 2]'))
+    db.session.add(CatalogChange(food_ids='[3]'))
+    db.session.commit()
+
+    catalog.sync(force=True)
+
+    assert [(event.previous_version, event.version, event.food_ids, event.local) for event in events] == [
+        (previous, previous + 1, {1, 2}, False),
+        (previous + 1, previous + 2, {3}, False),
+    ]
+
+
+def test_offline_caches_are_rebuilt_only_for_affected_users(make_user, monkeypatch, tmp_path):
+    food, other_food = catalog.snapshot().foods[:2]
+    affected, unaffected = make_user('alice', offline_mode_enabled=True), make_user('bob', offline_mode_enabled=True)
+    db.session.add_all([
+        Recommendation(user_id=affected.id, food_item_id=food.id),
+        Recommendation(user_id=unaffected.id, food_item_id=other_food.id),
+    ])
+    db.session.commit()
+    monkeypatch.setattr(offline_manager, 'cache_dir', str(tmp_path))
+    for user in (affected, unaffected):
+        (tmp_path / f'user_{user.id}.json').write_text('{}')
+    submitted = []
+    monkeypatch.setattr(offline_module.job_scheduler, 'submit',
+                        lambda name, func, **kwargs: submitted.append((name, func)) or (Job(name), True))
+    monkeypatch.setattr(offline_manager, '_refresh_job', None)
+    rebuilt = []
+    monkeypatch.setattr(offline_manager, '_build_cache_job', lambda job, user_id: rebuilt.append(user_id))
+
+    catalog.apply_price_changes([food.id])
+    # A second change while the first job is still queued joins it
+    catalog.apply_price_changes([food.id])
+
+    assert len(submitted) == 1
+    name, func = submitted[0]
+    assert func(Job(name)) == {'rebuilt': 1, 'failed': 0}
+    assert rebuilt == [affected.id]
@@ -0,0 +1,64 @@
+"""
+Price rollups and trend resolution
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import FoodItem, FoodPrice, PriceRollup
+from app.services.price_rollups import price_rollups
+
+
+def sample(food, price, recorded_at, location='Gulu'):
+    return {'food_item_id': food.id, 'location': location, 'price': price, 'recorded_at': recorded_at}
+
+
+@pytest.mark.parametrize('days, resolution', [
+    (1, 'raw'), (2, 'raw'), (3, 'day'), (30, 'day'), (90, 'day'), (91, 'week'), (365, 'week'),
+])
+def test_resolution_follows_the_requested_span(days, resolution):
+    assert price_rollups.resolution_for(days) == resolution
+
+
+def test_trend_reads_the_chosen_resolution():
+    food = FoodItem.query.first()
+    now = datetime.utcnow()
+    rows = [sample(food, 1000 + day, now - timedelta(days=day)) for day in range(200)]
+    db.session.add_all([FoodPrice(**row) for row in rows])
+    price_rollups.record(rows)
+    db.session.commit()
+
+    raw = price_rollups.get_trend(food.id, days=1)
+    daily = price_rollups.get_trend(food.id, days=30)
+    weekly = price_rollups.get_trend(food.id, days=180)
+
+    assert raw[0] == 'raw' and len(raw[1]) == 1
+    assert daily[0] == 'day' and len(daily[1]) == 31
+    assert weekly[0] == 'week' and 26 <= len(weekly[1]) <= 27
+    assert all(point['samples'] <= 7 for point in weekly[1])
+
+
+def test_record_merges_into_an_existing_bucket():
+    food = FoodItem.query.first()
+    day = datetime(2025, 5, 6)
+    price_rollups.record([sample(food, 1000, day + timedelta(hours=8)),
+                          sample(food, 1200, day + timedelta(hours=12))], resolutions=('day',))
+    db.session.commit()
+
+    # A later batch with a new low and a sample older than the current last price
+    price_rollups.record([sample(food, 900, day + timedelta(hours=16)),
+                          sample(food, 1500, day + timedelta(hours=9))], resolutions=('day',))
+    db.session.commit()
+
+    rollup = PriceRollup.query.filter_by(food_item_id=food.id, resolution='day').one()
+    assert rollup.period_start == day
+    assert rollup.sample_count == 4
+    assert (rollup.min_price, rollup.max_price) == (900, 1500)
+    assert rollup.to_dict()['mean'] == 1150
+    assert rollup.last_price == 900  # 16:00 is the newest sample
+
+    price_rollups.record([sample(food, 1100, day + timedelta(hours=10))], resolutions=('day',))
+    db.session.commit()
+    db.session.refresh(rollup)
+    assert rollup.last_price == 900 and rollup.sample_count == 5
@@ -0,0 +1,28 @@
+"""
+Profile form handling
+"""
+from app.models import User
+
+
+def profile_form(location):
+    return {'first_name': 'Alice', 'last_name': 'A', 'age': '30', 'height': '165', 'weight': '60',
+            'activity_level': 'moderate', 'budget_range': 'low', 'location': location}
+
+
+def test_location_is_normalized_to_a_tracked_market(client, make_user, login):
+    make_user()
+    login('alice')
+
+    client.post('/profile', data=profile_form('  gulu '))
+
+    assert User.query.filter_by(username='alice').one().location == 'Gulu'
+
+
+def test_unknown_location_is_rejected(client, make_user, login):
+    make_user(location='Mbarara')
+    login('alice')
+
+    response = client.post('/profile', data=profile_form('Atlantis'), follow_redirects=True)
+
+    assert User.query.filter_by(username='alice').one().location == 'Mbarara'
+    assert b'Unknown market location' in response.data
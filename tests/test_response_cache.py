@@ -0,0 +1,78 @@
+"""
+Response cache invalidation against the shared catalog version
+"""
+from app import db
+from app.models import CatalogChange, FoodItem
+from app.services.catalog import catalog
+from app.services.chatbot_service import ChatbotService
+from app.services.response_cache import response_cache
+
+
+def cheapest_price():
+    return response_cache.get_or_set('test', ('cheapest',), lambda: min(
+        food.current_price for food in catalog.snapshot().foods if food.current_price
+    ))
+
+
+def test_change_recorded_by_another_process_invalidates(monkeypatch):
+    monkeypatch.setattr(catalog, 'sync_seconds', 0)
+    before = cheapest_price()
+    assert cheapest_price() == before
+    hits = response_cache.hits
+
+    # Another process updates a price and records the change; nothing is published here
+    food = FoodItem.query.filter(FoodItem.current_price == before).first()
+    food.current_price = before / 2
+    db.session.add(CatalogChange(food_ids=f'[{food.id}]'))
+    db.session.commit()
+
+    assert cheapest_price() == before / 2
+    assert response_cache.hits == hits
+    assert catalog.snapshot().price_for(food.id) == before / 2
+
+
+def test_sync_is_throttled(monkeypatch):
+    monkeypatch.setattr(catalog, 'sync_seconds', 3600)
+    catalog.sync(force=True)
+    version = catalog.version
+    db.session.add(CatalogChange(food_ids=None))
+    db.session.commit()
+
+    assert catalog.sync() == version
+    assert catalog.sync(force=True) == version + 1
+
+
+def test_nearby_budgets_share_a_cache_entry(make_user):
+    service = ChatbotService()
+    first = make_user('alice', monthly_budget=301000)
+    second = make_user('bob', monthly_budget=309500)
+
+    list(service._iter_response(first, 'budget', 'budget', {}))
+    misses = response_cache.misses
+    list(service._iter_response(second, 'budget', 'budget', {}))
+
+    assert response_cache.misses == misses
+    assert service._budget_bucket(301000) == service._budget_bucket(309500) == 300000
+
+
+def test_price_change_drops_only_dependent_entries(app):
+    foods = catalog.snapshot().foods
+    response_cache.get_or_set('test', ('first',), lambda: 1, depends_on=[foods[0].id])
+    response_cache.get_or_set('test', ('second',), lambda: 2, depends_on=[foods[1].id])
+
+    catalog.apply_price_changes([foods[0].id])
+
+    assert response_cache.get_or_set('test', ('first',), lambda: 10) == 10
+    assert response_cache.get_or_set('test', ('second',), lambda: 20) == 2
+
+
+def test_version_ahead_of_its_event_bypasses_without_clearing(monkeypatch):
+    response_cache.get_or_set('test', ('kept',), lambda: 1, depends_on=())
+    monkeypatch.setattr(catalog, 'version', catalog.version + 1)
+    monkeypatch.setattr(catalog, 'sync', lambda *args, **kwargs: catalog.version)
+
+    # The event for the new version has not been published yet
+    assert response_cache.get_or_set('test', ('kept',), lambda: 2, depends_on=()) == 2
+    assert response_cache.stats()['entries'] == 1
+    monkeypatch.undo()
+    assert response_cache.get_or_set('test', ('kept',), lambda: 3, depends_on=()) == 1
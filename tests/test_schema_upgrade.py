@@ -0,0 +1,37 @@
+"""
+Startup schema upgrade for databases created before newer columns
+"""
+from sqlalchemy import inspect, text
+
+from app import db
+from app.models import User
+from app.utils.schema_upgrade import upgrade_schema
+
+
+def test_missing_column_is_added(make_user):
+    make_user()
+    db.session.execute(text('ALTER TABLE users DROP COLUMN location'))
+    db.session.commit()
+
+    created = upgrade_schema()
+
+    assert 'users.location' in created
+    assert 'location' in {column['name'] for column in inspect(db.engine).get_columns('users')}
+    db.session.expire_all()
+    assert User.query.filter_by(username='alice').one().location is None
+
+
+def test_missing_table_is_created():
+    db.session.execute(text('DROP TABLE catalog_changes'))
+    db.session.commit()
+
+    assert 'catalog_changes' in upgrade_schema()
+    assert 'catalog_changes' in inspect(db.engine).get_table_names()
+
+
+def test_expression_index_is_created_once():
+    db.session.execute(text('DROP INDEX ix_diabetes_records_user_type_taken'))
+    db.session.commit()
+
+    assert upgrade_schema() == ['ix_diabetes_records_user_type_taken']
+    assert upgrade_schema() == []